@@ -1,72 +1,80 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import delete, select
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from app.db.database import get_db
-from app.db.models import Currency, CurrencyRate
-from app.api.schemas import Currency as CurrencySchema, CurrencyCreate, CurrencyUpdate, CurrencyRate as CurrencyRateSchema
-from app.tasks.background import background_tasks
+from app.db.database import get_read_db
+from app.db.writer import db_writer
+from app.db.models import Currency, DailyRate, RateStats
+from app.api.schemas import Currency as CurrencySchema, CurrencyCreate, CurrencyUpdate
+from app.services.history import get_rates_page, parse_codes
+from app.services.response_cache import data_generation
+from app.tasks.jobs import parse_jobs
 from app.websocket.manager import manager
 from app.nats.client import nats_client
 
 router = APIRouter(prefix="/api/v1")
 
 @router.get("/currencies", response_model=List[CurrencySchema])
-async def get_currencies(db: AsyncSession = Depends(get_db)):
+async def get_currencies(db: AsyncSession = Depends(get_read_db)):
     result = await db.execute(select(Currency))
     return result.scalars().all()
 
 @router.get("/currencies/{currency_id}", response_model=CurrencySchema)
-async def get_currency(currency_id: int, db: AsyncSession = Depends(get_db)):
+async def get_currency(currency_id: int, db: AsyncSession = Depends(get_read_db)):
     currency = await db.get(Currency, currency_id)
     if not currency:
         raise HTTPException(404, "Валюта не найдена")
     return currency
 
 @router.post("/currencies", response_model=CurrencySchema)
-async def create_currency(currency: CurrencyCreate, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Currency).where(Currency.code == currency.code)
-    )
-    existing = result.scalar_one_or_none()
-    if existing:
-        raise HTTPException(400, f"Валюта с кодом {currency.code} уже существует")
-    
-    db_currency = Currency(**currency.dict())
-    db.add(db_currency)
-    await db.commit()
-    await db.refresh(db_currency)
+async def create_currency(currency: CurrencyCreate):
+    async def write(db: AsyncSession):
+        result = await db.execute(
+            select(Currency).where(Currency.code == currency.code)
+        )
+        existing = result.scalar_one_or_none()
+        if existing:
+            raise HTTPException(400, f"Валюта с кодом {currency.code} уже существует")
+
+        db_currency = Currency(**currency.dict())
+        db.add(db_currency)
+        await db.flush()
+        return db_currency
+
+    db_currency = await db_writer.submit(write)
+    data_generation.bump("currencies")
     return db_currency
 
 @router.patch("/currencies/{currency_id}", response_model=CurrencySchema) 
 async def update_currency(
     currency_id: int,
-    currency_update: CurrencyUpdate,
-    db: AsyncSession = Depends(get_db)
+    currency_update: CurrencyUpdate
 ):
+    async def write(db: AsyncSession):
+        currency = await db.get(Currency, currency_id)
+        if not currency:
+            raise HTTPException(404, "Валюта не найдена")
 
-    currency = await db.get(Currency, currency_id)
-    if not currency:
-        raise HTTPException(404, "Валюта не найдена")
-    
-    update_data = currency_update.dict(exclude_unset=True)
-    
-    if "code" in update_data:
-        if update_data["code"] != currency.code:
-            result = await db.execute(
-                select(Currency).where(Currency.code == update_data["code"])
-            )
-            existing = result.scalar_one_or_none()
-            if existing:
-                raise HTTPException(400, f"Код {update_data['code']} уже используется")
-    
-    for field, value in update_data.items():
-        setattr(currency, field, value)
-    
-    await db.commit()
-    await db.refresh(currency)
+        update_data = currency_update.dict(exclude_unset=True)
+
+        if "code" in update_data:
+            if update_data["code"] != currency.code:
+                result = await db.execute(
+                    select(Currency).where(Currency.code == update_data["code"])
+                )
+                existing = result.scalar_one_or_none()
+                if existing:
+                    raise HTTPException(400, f"Код {update_data['code']} уже используется")
+
+        for field, value in update_data.items():
+            setattr(currency, field, value)
+        await db.flush()
+        return currency
+
+    currency = await db_writer.submit(write)
+    data_generation.bump("currencies", "rates")
     
     await manager.broadcast({
         "type": "currency_updated",
@@ -74,26 +82,30 @@ async def update_currency(
         "timestamp": datetime.now().isoformat()
     })
     
-    if hasattr(nats_client, 'connected') and nats_client.connected:
-        await nats_client.publish(
-            "currency.updates",
-            {
-                "event": "currency_updated",
-                "payload": CurrencySchema.from_orm(currency).dict(),
-                "timestamp": datetime.now().isoformat()
-            }
-        )
+    await nats_client.publish(
+        "currency.updates",
+        {
+            "event": "currency_updated",
+            "payload": CurrencySchema.from_orm(currency).dict(),
+            "timestamp": datetime.now().isoformat()
+        }
+    )
     
     return currency
 
 @router.delete("/currencies/{currency_id}")
-async def delete_currency(currency_id: int, db: AsyncSession = Depends(get_db)):
-    currency = await db.get(Currency, currency_id)
-    if not currency:
-        raise HTTPException(404, "Валюта не найдена")
-    
-    await db.delete(currency)
-    await db.commit()
+async def delete_currency(currency_id: int):
+    async def write(db: AsyncSession):
+        currency = await db.get(Currency, currency_id)
+        if not currency:
+            raise HTTPException(404, "Валюта не найдена")
+        await db.execute(delete(DailyRate).where(DailyRate.currency_id == currency_id))
+        await db.execute(delete(RateStats).where(RateStats.currency_id == currency_id))
+        await db.delete(currency)
+        await db.flush()
+
+    await db_writer.submit(write)
+    data_generation.bump("currencies", "rates")
     
     await manager.broadcast({
         "type": "currency_deleted",
@@ -103,12 +115,21 @@ async def delete_currency(currency_id: int, db: AsyncSession = Depends(get_db)):
     
     return {"message": "Валюта удалена"}
 
-@router.get("/rates", response_model=List[CurrencyRateSchema])
-async def get_rates(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(CurrencyRate))
-    return result.scalars().all()
+@router.get("/rates")
+async def get_rates(
+    code: Optional[List[str]] = Query(None),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db)
+):
+    try:
+        return await get_rates_page(db, parse_codes(code), date_from, date_to, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
 
-@router.post("/tasks/run")
-async def run_task():
-    await background_tasks.manual_run()
-    return {"message": "Фоновая задача запущена вручную"}
\ No newline at end of file
+@router.post("/tasks/run", status_code=202)
+async def run_task(force: bool = False):
+    job = parse_jobs.submit("manual", force)
+    return {"message": "Фоновая задача запущена вручную", **job.as_dict()}
\ No newline at end of file
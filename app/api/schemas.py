@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from datetime import datetime
+from pydantic import BaseModel, Field
+from datetime import date, datetime
 from typing import List, Optional
 
 class CurrencyBase(BaseModel):
@@ -29,4 +29,26 @@ class CurrencyRate(CurrencyRateBase):
         from_attributes = True
 
 class CurrencyWithRates(Currency):
-    rates: List[CurrencyRate] = []
\ No newline at end of file
+    rates: List[CurrencyRate] = []
+
+class BackfillRequest(BaseModel):
+    start: date
+    end: date
+    # Верхняя граница - backfill.MAX_CONCURRENCY
+    concurrency: Optional[int] = Field(None, ge=1, le=64)
+
+class ConvertItem(BaseModel):
+    from_: str = Field(alias="from")
+    to: str
+    amount: float = 1.0
+    date: Optional[datetime] = None
+
+class ConvertRequest(BaseModel):
+    items: List[ConvertItem] = Field(max_length=100000)
+
+class AsOfRequest(BaseModel):
+    # Один код на все моменты или по коду на каждый момент
+    code: List[str] = Field(min_length=1, max_length=1000000)
+    # ISO 8601; строки без часового пояса разбираются быстрее
+    at: List[str] = Field(min_length=1, max_length=1000000)
+    with_dates: bool = False
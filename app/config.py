@@ -1,13 +1,65 @@
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     app_name: str = "Currency Parser API"
     debug: bool = True
     database_url: str = "sqlite+aiosqlite:///./currency.db"
+    db_echo: bool = False
+    db_busy_timeout: int = 5000
+    db_read_pool_size: int = 5
+    db_write_batch_size: int = 200
+    db_write_window: float = 0.0
     nats_url: str = "nats://localhost:4222"
     nats_subject_updates: str = "currency.updates"
     nats_subject_external: str = "currency.external.updates"
+    nats_subject_cluster: str = "currency.cluster.events"
+    nats_subject_alerts: str = "currency.alerts"
+    nats_outbox_size: int = 10000
+    nats_batch_size: int = 100
+    nats_flush_interval: float = 0.05
+    nats_reconnect_interval: float = 5.0
+    nats_spill_path: Optional[str] = None
+    external_ingest_batch_size: int = 500
+    external_ingest_batch_interval: float = 0.1
+    external_ingest_queue_size: int = 10000
+    external_ingest_concurrency: int = 4
     cbr_url: str = "http://www.cbr.ru/scripts/XML_daily.asp"
+    ecb_url: str = "https://www.ecb.europa.eu/stats/eurofxref/eurofxref-daily.xml"
+    json_rates_url: Optional[str] = None
+    rate_providers: str = "cbr"
+    provider_deadlines: Dict[str, float] = {}
+    base_currency: str = "RUB"
+    upstream_timeout: float = 5.0
+    upstream_retries: int = 2
+    upstream_backoff_base: float = 0.25
+    upstream_backoff_max: float = 2.0
+    upstream_deadline: float = 12.0
+    upstream_breaker_threshold: int = 5
+    upstream_breaker_reset: float = 60.0
+    rates_stale_after: int = 1800
     background_task_interval: int = 600
+    delta_ingest: bool = True
+    ws_queue_size: int = 100
+    ws_overflow_policy: str = "drop_oldest"
+    cluster_mode: bool = False
+    cluster_broker: str = "nats"
+    leader_lease_ttl: int = 30
+    backfill_concurrency: int = 8
+    backfill_batch_days: int = 31
+    export_chunk_rows: int = 10000
+    http_cache_max_age: int = 5
+    http_cache_stale_while_revalidate: int = 30
+    http_cache_entries: int = 512
+    retention_enabled: bool = False
+    retention_raw_days: int = 365
+    retention_chunk_rows: int = 2000
+    retention_interval: int = 3600
+    anomaly_enabled: bool = True
+    anomaly_z_threshold: float = 4.0
+    anomaly_min_samples: int = 20
+    anomaly_ewma_alpha: float = 0.1
+    anomaly_checkpoint_interval: float = 60.0
+    profiler_enabled: bool = False
 
 settings = Settings()
@@ -1,13 +1,86 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.config import settings
+from app.services.metrics import instrument_engine
 
-engine = create_async_engine(settings.database_url, echo=True)
+def _is_sqlite_file(url: str) -> bool:
+    parsed = make_url(url)
+    database = parsed.database or ""
+    return parsed.get_backend_name() == "sqlite" and database not in ("", ":memory:") and "mode=memory" not in str(parsed)
+
+def configure_sqlite(engine, read_only: bool = False):
+    """Прагмы SQLite для каждого нового соединения.
+
+    WAL позволяет читать параллельно с записью, synchronous=NORMAL в WAL
+    безопасен и избавляет от fsync на каждый коммит. Пишущие соединения
+    сами начинают транзакцию с BEGIN IMMEDIATE: блокировка записи берётся
+    сразу, а не при первом INSERT, и SAVEPOINT работают штатно.
+    Читающие соединения переводятся в query_only; временные данные больших
+    сортировок у них уходят на диск, а не в память процесса.
+    """
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        if not read_only:
+            # Транзакциями управляет SQLAlchemy (событие begin ниже), а не драйвер
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={settings.db_busy_timeout}")
+        if not read_only:
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-16000")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    if not read_only:
+        @event.listens_for(engine.sync_engine, "begin")
+        def on_begin(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+# echo=True логирует каждый запрос и заметно замедляет работу под нагрузкой
+if _is_sqlite_file(settings.database_url):
+    # aiosqlite по умолчанию использует NullPool и открывает соединение на каждую сессию.
+    # Пишущее соединение одно (его держит db_writer), читающие - отдельный пул:
+    # GET-запросы не ждут очередь записи
+    engine = create_async_engine(
+        settings.database_url,
+        echo=settings.db_echo,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=2
+    )
+    read_engine = create_async_engine(
+        settings.database_url,
+        echo=settings.db_echo,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.db_read_pool_size,
+        max_overflow=settings.db_read_pool_size
+    )
+    configure_sqlite(engine)
+    configure_sqlite(read_engine, read_only=True)
+    instrument_engine(read_engine)
+else:
+    engine = create_async_engine(settings.database_url, echo=settings.db_echo)
+    read_engine = engine
+instrument_engine(engine)
+
+# Сессии на пишущем соединении; изменения идут через app.db.writer.db_writer
 AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+ReadSessionLocal = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
 
 class Base(DeclarativeBase):
     pass
 
 async def get_db():
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+async def get_read_db():
+    async with ReadSessionLocal() as session:
+        yield session
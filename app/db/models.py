@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.db.database import Base
 from datetime import datetime
@@ -16,4 +16,46 @@ class CurrencyRate(Base):
     currency_id = Column(Integer, ForeignKey("currencies.id"))
     value = Column(Float)
     date = Column(DateTime, default=datetime.now)
-    currency = relationship("Currency", back_populates="rates")
\ No newline at end of file
+    currency = relationship("Currency", back_populates="rates")
+    __table_args__ = (
+        Index("ix_currency_rates_currency_id_date", "currency_id", "date"),
+        Index("ix_currency_rates_date", "date"),
+    )
+
+# Дневные агрегаты курсов старше окна хранения (см. app.services.retention)
+class DailyRate(Base):
+    __tablename__ = "daily_rates"
+    currency_id = Column(Integer, ForeignKey("currencies.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    open = Column(Float)
+    close = Column(Float)
+    min = Column(Float)
+    max = Column(Float)
+    count = Column(Integer, default=0)
+    first_at = Column(DateTime)
+    last_at = Column(DateTime, index=True)
+
+class BackfillCheckpoint(Base):
+    __tablename__ = "backfill_checkpoints"
+    date_req = Column(Date, primary_key=True)
+    rates_date = Column(Date, index=True)
+    rates_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+
+# Накопленная статистика изменений курса для детектора аномалий (см. app.services.anomaly)
+class RateStats(Base):
+    __tablename__ = "rate_stats"
+    currency_id = Column(Integer, ForeignKey("currencies.id"), primary_key=True)
+    count = Column(Integer, default=0)
+    mean = Column(Float, default=0.0)
+    m2 = Column(Float, default=0.0)
+    ewma = Column(Float, default=0.0)
+    ewm_var = Column(Float, default=0.0)
+    last_value = Column(Float)
+    last_at = Column(DateTime)
+
+class LeaderLease(Base):
+    __tablename__ = "leader_leases"
+    name = Column(String(50), primary_key=True)
+    holder = Column(String(64))
+    expires_at = Column(DateTime)
\ No newline at end of file
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.database import AsyncSessionLocal
+from app.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+WriteOperation = Callable[[AsyncSession], Awaitable[Any]]
+
+db_write_batch_ops = registry.histogram(
+    "db_write_batch_operations", "Операций в одном групповом коммите", (),
+    (1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+db_write_commit_duration = registry.histogram(
+    "db_write_commit_duration_seconds", "Выполнение и коммит пачки операций записи"
+)
+
+class WriteCoordinator:
+    """Единственный писатель в SQLite с групповым коммитом.
+
+    Все изменения БД передаются сюда как операции op(db) -> результат.
+    Задача-писатель забирает все операции, накопившиеся пока шёл
+    предыдущий коммит (не больше db_write_batch_size), выполняет их в
+    одной транзакции, каждую - в своём SAVEPOINT, и делает один коммит. Ошибка операции
+    откатывает только её savepoint и возвращается её вызывающему;
+    ошибка коммита - всем операциям пачки. Операции не должны вызывать
+    commit() сами, результат возвращается вызывающему после коммита.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, window: Optional[float] = None, session_factory=None):
+        self.batch_size = batch_size or settings.db_write_batch_size
+        self.window = window if window is not None else settings.db_write_window
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.pending: Deque[Tuple[WriteOperation, asyncio.Future]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.operations_total = 0
+        self.failed_operations = 0
+        self.batches_total = 0
+        self.failed_batches = 0
+        self.max_batch = 0
+
+    async def submit(self, operation: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        self._ensure_running()
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((operation, future))
+        self._wakeup.set()
+        return await future
+
+    def _ensure_running(self):
+        # Писатель запускается при первой записи в текущем event loop
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """Дожидается записи уже поставленных операций, включая выполняемую пачку"""
+        task = self._task
+        if task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await task
+        finally:
+            self._stopping = False
+            if self._task is task:
+                self._task = None
+
+    async def _run(self):
+        batch = []
+        try:
+            while True:
+                if not self.pending:
+                    if self._stopping:
+                        return
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                if self.window and len(self.pending) < self.batch_size and not self._stopping:
+                    # Необязательное окно: при db_write_window > 0 одиночная запись ждёт соседей
+                    await asyncio.sleep(self.window)
+                batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+                await self._execute(batch)
+                batch = []
+        finally:
+            # Писателя отменили: операции, которые он уже не выполнит, не должны ждать вечно
+            error = RuntimeError("Писатель БД остановлен")
+            for _, future in [*batch, *self.pending]:
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+
+    async def _execute(self, batch):
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            async with self.session_factory() as db:
+                if len(batch) == 1:
+                    # Одна операция: savepoint не нужен, при ошибке откатывается вся транзакция
+                    operation, future = batch[0]
+                    try:
+                        result = await operation(db)
+                    except Exception as e:
+                        await db.rollback()
+                        outcomes.append((future, None, e))
+                    else:
+                        await db.commit()
+                        outcomes.append((future, result, None))
+                else:
+                    for operation, future in batch:
+                        if future.cancelled():
+                            continue
+                        try:
+                            async with db.begin_nested():
+                                result = await operation(db)
+                            outcomes.append((future, result, None))
+                        except Exception as e:
+                            outcomes.append((future, None, e))
+                    await db.commit()
+        except Exception as e:
+            logger.error(f"Ошибка группового коммита ({len(batch)} операций): {e}")
+            self.failed_batches += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_total += 1
+        self.operations_total += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        db_write_batch_ops.observe(len(batch))
+        db_write_commit_duration.observe(time.perf_counter() - started)
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                self.failed_operations += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self.pending),
+            "operations_total": self.operations_total,
+            "failed_operations": self.failed_operations,
+            "batches_total": self.batches_total,
+            "failed_batches": self.failed_batches,
+            "avg_batch": round(self.operations_total / self.batches_total, 2) if self.batches_total else 0.0,
+            "max_batch": self.max_batch,
+            "window": self.window,
+            "batch_size": self.batch_size
+        }
+
+db_writer = WriteCoordinator()
@@ -1,20 +1,62 @@
-from fastapi import FastAPI, WebSocket, HTTPException, Depends
+import asyncio
+from fastapi import FastAPI, WebSocket, HTTPException, Depends, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from app.db.database import get_db
-from app.db.models import Currency, CurrencyRate
-from app.api.schemas import CurrencyCreate, CurrencyUpdate
+from sqlalchemy import delete, select, update
+from app.db.database import get_read_db, ReadSessionLocal
+from app.db.writer import db_writer
+from app.db.models import Currency, CurrencyRate, DailyRate, RateStats
+from app.api.schemas import AsOfRequest, CurrencyCreate, CurrencyUpdate, BackfillRequest, ConvertRequest
 from app.websocket.manager import manager
 from app.nats.client import nats_client
 from app.tasks.background import scheduler, start_background_scheduler
+from app.tasks.jobs import parse_jobs
+from app.tasks.leader import leader
+from app.nats.cluster import InMemoryBroker, cluster_relay
+from app.nats.ingest import external_ingestor
+from app.services.http_client import close_http_client
+from app.services.history import get_rates_page, local_time, parse_codes, parse_moments, stream_rates
+from app.services.export import FORMATS, available_formats, export_filename, export_rates
+from app.services.snapshot import snapshot_store
+from app.services.conversion import conversion_engine
+from app.services.analytics import get_analytics
+from app.services.anomaly import anomaly_detector
+from app.services.series import series_store
+from app.services.metrics import http_request_duration, registry
+from app.services.profiler import profiler
+from app.services.providers import provider_runner
+from app.services.response_cache import data_generation, response_cache
+from app.services.resilience import CircuitOpenError, UpstreamError, breakers_stats
+from app.config import settings
 from datetime import datetime
+from typing import List, Optional
 import logging
+import time
+import numpy as np
 
 app = FastAPI(title="Currency Parser API")
 logger = logging.getLogger(__name__)
 
 websocket_clients = []
 
+@app.middleware("http")
+async def collect_http_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Шаблон маршрута, а не фактический путь: иначе метки не ограничены
+        route = request.scope.get("route")
+        http_request_duration.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=status
+        )
+
 @app.on_event("startup")
 async def startup():
     print("=== STARTUP FUNCTION EXECUTED ===")
@@ -22,12 +64,23 @@ async def startup():
         from app.db.database import engine, Base
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            # create_all не добавляет индексы в уже существующие таблицы
+            for index in CurrencyRate.__table__.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
         print("1. Таблицы БД созданы")
         logger.info("Таблицы БД созданы")
+
+        async with ReadSessionLocal() as db:
+            await snapshot_store.seed(db)
         
-        from app.config import settings
         print("2. Подключение к NATS...")
         await nats_client.connect(settings.nats_url)
+        await external_ingestor.start(nats_client)
+
+        if settings.cluster_mode:
+            broker = InMemoryBroker() if settings.cluster_broker == "memory" else nats_client
+            await cluster_relay.attach(broker)
+            await leader.try_acquire()
         
         print("3. Запуск фоновых задач...")
         start_background_scheduler()
@@ -40,7 +93,13 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown():
     try:
+        cluster_relay.detach()
+        await leader.release()
+        await external_ingestor.stop()
+        await anomaly_detector.checkpoint(force=True)
+        await db_writer.stop()
         await nats_client.disconnect()
+        await close_http_client()
         if scheduler.running:
             scheduler.shutdown()
         logger.info("Приложение завершено")
@@ -48,40 +107,56 @@ async def shutdown():
         logger.error(f"Ошибка завершения: {e}")
 
 
+def currency_dict(currency: Currency) -> dict:
+    return {"id": currency.id, "code": currency.code, "name": currency.name}
+
 @app.get("/api/v1/currencies")
-async def get_currencies(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Currency))
-    currencies = result.scalars().all()
-    return currencies
+async def get_currencies(request: Request):
+    async def build():
+        async with ReadSessionLocal() as db:
+            result = await db.execute(select(Currency))
+            return [currency_dict(currency) for currency in result.scalars()]
+
+    return await response_cache.respond(request, ("currencies",), data_generation.get("currencies"), build)
 
 @app.get("/api/v1/currencies/{currency_id}")
-async def get_currency(currency_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Currency).where(Currency.id == currency_id)
-    )
-    currency = result.scalar_one_or_none()
+async def get_currency(currency_id: int, request: Request):
+    async def build():
+        async with ReadSessionLocal() as db:
+            result = await db.execute(
+                select(Currency).where(Currency.id == currency_id)
+            )
+            currency = result.scalar_one_or_none()
 
-    if not currency:
-        raise HTTPException(status_code=404, detail="Currency not found")
-    return currency
+        if not currency:
+            raise HTTPException(status_code=404, detail="Currency not found")
+        return currency_dict(currency)
 
-@app.post("/api/v1/currencies")
-async def create_currency(currency_data: CurrencyCreate, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Currency).where(Currency.code == currency_data.code)
+    return await response_cache.respond(
+        request, ("currencies", currency_id), data_generation.get("currencies"), build
     )
-    existing = result.scalar_one_or_none()
 
-    if existing:
-        raise HTTPException(status_code=400, detail=f"Currency {currency_data.code} already exists")
-    
-    db_currency = Currency(
-        code=currency_data.code,
-        name=currency_data.name
-    )
-    db.add(db_currency)
-    await db.commit()
-    await db.refresh(db_currency)
+@app.post("/api/v1/currencies")
+async def create_currency(currency_data: CurrencyCreate):
+    async def write(db: AsyncSession):
+        result = await db.execute(
+            select(Currency).where(Currency.code == currency_data.code)
+        )
+        existing = result.scalar_one_or_none()
+
+        if existing:
+            raise HTTPException(status_code=400, detail=f"Currency {currency_data.code} already exists")
+
+        db_currency = Currency(
+            code=currency_data.code,
+            name=currency_data.name
+        )
+        db.add(db_currency)
+        await db.flush()
+        return db_currency
+
+    db_currency = await db_writer.submit(write)
+    data_generation.bump("currencies")
 
     await manager.broadcast({
         "type": "currency_created",
@@ -91,41 +166,50 @@ async def create_currency(currency_data: CurrencyCreate, db: AsyncSession = Depe
             "name": db_currency.name
         },
         "timestamp": datetime.now().isoformat()
-    })
-
-    if nats_client.is_connected:
-        await nats_client.publish(
-            subject="currency.updates",
-            payload={
-                "event": "currency_created",
-                "currency_id": db_currency.id,
-                "code": db_currency.code,
-                "timestamp": datetime.now().isoformat()
-            }
-        )
+    }, codes=[db_currency.code])
+
+    await nats_client.publish(
+        subject="currency.updates",
+        payload={
+            "event": "currency_created",
+            "currency_id": db_currency.id,
+            "code": db_currency.code,
+            "timestamp": datetime.now().isoformat()
+        }
+    )
 
     return db_currency
 
 @app.patch("/api/v1/currencies/{currency_id}")
-async def update_currency(
-    currency_id: int,
-    updates: CurrencyUpdate,
-    db: AsyncSession = Depends(get_db)
-):
-    result = await db.execute(
-        select(Currency).where(Currency.id == currency_id)
-    )
-    currency = result.scalar_one_or_none()
+async def update_currency(currency_id: int, updates: CurrencyUpdate):
+    async def write(db: AsyncSession):
+        result = await db.execute(
+            select(Currency).where(Currency.id == currency_id)
+        )
+        currency = result.scalar_one_or_none()
 
-    if not currency:
-        raise HTTPException(status_code=404, detail="Currency not found")
+        if not currency:
+            raise HTTPException(status_code=404, detail="Currency not found")
 
-    update_data = updates.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(currency, field, value)
+        previous_code = currency.code
+        update_data = updates.dict(exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(currency, field, value)
+        await db.flush()
+        return currency, previous_code
 
-    await db.commit()
-    await db.refresh(currency)
+    currency, previous_code = await db_writer.submit(write)
+    data_generation.bump("currencies")
+    if currency.code != previous_code:
+        # Код валюты есть и в строках истории курсов
+        data_generation.bump("rates")
+
+    latest = snapshot_store.current.rates.get(previous_code)
+    if latest:
+        snapshot_store.publish(
+            [latest._replace(code=currency.code, name=currency.name)],
+            remove=[previous_code]
+        )
 
     await manager.broadcast({
         "type": "currency_updated",
@@ -135,107 +219,374 @@ async def update_currency(
             "name": currency.name
         },
         "timestamp": datetime.now().isoformat()
-    })
-
-    if nats_client.is_connected:
-        await nats_client.publish(
-            subject="currency.updates",
-            payload={
-                "event": "currency_updated",
-                "currency_id": currency.id,
-                "code": currency.code,
-                "timestamp": datetime.now().isoformat()
-            }
-        )
+    }, codes={previous_code, currency.code})
+
+    await nats_client.publish(
+        subject="currency.updates",
+        payload={
+            "event": "currency_updated",
+            "currency_id": currency.id,
+            "code": currency.code,
+            "timestamp": datetime.now().isoformat()
+        }
+    )
 
     return currency
 
 @app.delete("/api/v1/currencies/{currency_id}")
-async def delete_currency(currency_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Currency).where(Currency.id == currency_id)
-    )
-    currency = result.scalar_one_or_none()
+async def delete_currency(currency_id: int):
+    async def write(db: AsyncSession):
+        result = await db.execute(
+            select(Currency).where(Currency.id == currency_id)
+        )
+        currency = result.scalar_one_or_none()
 
-    if not currency:
-        raise HTTPException(status_code=404, detail="Currency not found")
+        if not currency:
+            raise HTTPException(status_code=404, detail="Currency not found")
+
+        code = currency.code
+        await db.execute(delete(DailyRate).where(DailyRate.currency_id == currency_id))
+        await db.execute(delete(RateStats).where(RateStats.currency_id == currency_id))
+        await db.delete(currency)
+        await db.flush()
+        return code
 
-    await db.delete(currency)
-    await db.commit()
+    code = await db_writer.submit(write)
+    data_generation.bump("currencies", "rates")
+    snapshot_store.publish([], remove=[code])
+    series_store.invalidate(currency_id)
+    anomaly_detector.invalidate(currency_id)
 
     await manager.broadcast({
         "type": "currency_deleted",
         "data": {"id": currency_id},
         "timestamp": datetime.now().isoformat()
-    })
-
-    if nats_client.is_connected:
-        await nats_client.publish(
-            subject="currency.updates",
-            payload={
-                "event": "currency_deleted",
-                "currency_id": currency_id,
-                "timestamp": datetime.now().isoformat()
-            }
-        )
+    }, codes=[code])
+
+    await nats_client.publish(
+        subject="currency.updates",
+        payload={
+            "event": "currency_deleted",
+            "currency_id": currency_id,
+            "timestamp": datetime.now().isoformat()
+        }
+    )
 
     return {"message": "Currency deleted", "id": currency_id}
 
-@app.post("/api/v1/tasks/run")
-async def run_task(db: AsyncSession = Depends(get_db)):
-    from app.services.parser import CurrencyParser
-    
+@app.get("/api/v1/rates")
+async def get_rates(
+    request: Request,
+    code: Optional[List[str]] = Query(None),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    async def build():
+        async with ReadSessionLocal() as db:
+            try:
+                return await get_rates_page(db, parse_codes(code), date_from, date_to, cursor, limit)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+    return await response_cache.respond(request, ("rates", request.url.query), data_generation.get("rates"), build)
+
+@app.get("/api/v1/rates/stream")
+async def stream_rates_history(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    code: Optional[List[str]] = Query(None),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to")
+):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_rates(format, parse_codes(code), date_from, date_to),
+        media_type=media_type
+    )
+
+@app.get("/api/v1/rates/export")
+async def export_rates_history(
+    format: str = "csv.gz",
+    code: Optional[List[str]] = Query(None),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to")
+):
     try:
-        parser = CurrencyParser(db)
-        rates = await parser.fetch_rates()
-        saved_count = await parser.save_rates(rates)
-        
-        await manager.broadcast({
-            "type": "rates_updated",
-            "data": {
-                "rates_count": saved_count,
-                "timestamp": datetime.now().isoformat()
-            }
-        })
-        
-        if nats_client.is_connected:
-            await nats_client.publish(
-                subject="currency.updates",
-                payload={
-                    "event": "manual_parse_completed",
-                    "rates_count": saved_count,
-                    "timestamp": datetime.now().isoformat()
-                }
-            )
-        
+        body = export_rates(
+            format, parse_codes(code),
+            local_time(date_from) if date_from else None,
+            local_time(date_to) if date_to else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e}; доступно: {', '.join(available_formats())}")
+    return StreamingResponse(
+        body,
+        media_type=FORMATS[format][0],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(format)}"'}
+    )
+
+@app.get("/api/v1/rates/latest")
+async def get_latest_rates(request: Request):
+    # Снимок отдаётся и при недоступном ЦБ РФ; freshness показывает его возраст
+    def build():
+        return {**snapshot_store.current.as_dict(), "freshness": snapshot_store.freshness(with_age=False)}
+
+    return await response_cache.respond(request, ("latest",), snapshot_store.version(), build)
+
+@app.get("/api/v1/rates/latest/{code}")
+async def get_latest_rate(code: str, request: Request):
+    code = code.upper()
+    if code not in snapshot_store.current.payload:
+        raise HTTPException(status_code=404, detail="Currency not found")
+
+    def build():
+        snapshot = snapshot_store.current
         return {
-            "message": "Курсы получены",
-            "currencies_updated": saved_count,
-            "timestamp": datetime.now().isoformat()
+            "generation": snapshot.generation,
+            **snapshot.payload[code],
+            "freshness": snapshot_store.freshness(with_age=False)
         }
-        
-    except Exception as e:
-        logger.error(f"Ошибка run_task: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка парсинга: {str(e)}")
+
+    return await response_cache.respond(request, ("latest", code), snapshot_store.version(), build)
+
+@app.get("/api/v1/rates/asof")
+async def get_rate_as_of(code: str, at: datetime, db: AsyncSession = Depends(get_read_db)):
+    """Курс валюты на момент at: последний известный курс не позже него"""
+    code = code.upper()
+    values, found_at = await series_store.as_of(db, [code], np.array([local_time(at)], dtype="datetime64[us]"))
+    if np.isnan(values[0]):
+        raise HTTPException(status_code=404, detail=f"Курс {code} на {at.isoformat()} не найден")
+    return {
+        "code": code,
+        "at": at.isoformat(),
+        "value": float(values[0]),
+        "rate_date": found_at[0].item().isoformat()
+    }
+
+@app.post("/api/v1/rates/asof")
+async def get_rates_as_of(request: AsOfRequest, db: AsyncSession = Depends(get_read_db)):
+    """Пакетный поиск курсов на моменты времени.
+
+    code - один код для всех моментов at или по коду на каждый момент.
+    Ответ в колоночном виде: values[i] (и rate_dates[i] при with_dates)
+    для i-го момента, null - курс не найден.
+    """
+    if len(request.code) not in (1, len(request.at)):
+        raise HTTPException(status_code=400, detail="code должен содержать один код или по коду на каждый момент at")
+    codes = [code.upper() for code in request.code]
+    try:
+        timestamps = parse_moments(request.at)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    started = time.perf_counter()
+    values, found_at = await series_store.as_of(db, codes, timestamps)
+    elapsed = time.perf_counter() - started
+
+    missing = np.isnan(values)
+    content = {
+        "count": len(values),
+        "missing": int(missing.sum()),
+        "lookup_ms": round(elapsed * 1000, 3),
+        "values": np.where(missing, None, values).tolist()
+    }
+    if request.with_dates:
+        content["rate_dates"] = np.datetime_as_string(found_at, unit="us").tolist()
+        for i in np.flatnonzero(missing).tolist():
+            content["rate_dates"][i] = None
+    # Готовый JSONResponse не проходит jsonable_encoder - для 100k значений это заметно
+    return JSONResponse(content=content)
+
+@app.get("/api/v1/analytics/{code}")
+async def get_currency_analytics(
+    code: str,
+    interval: str = Query("day", pattern="^(day|week|month)$"),
+    window: int = Query(7, ge=1, le=365),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    analytics = await get_analytics(db, code, interval, window, date_from, date_to)
+    if analytics is None:
+        raise HTTPException(status_code=404, detail="Currency not found")
+    return analytics
+
+@app.post("/api/v1/convert")
+async def convert(request: ConvertRequest, db: AsyncSession = Depends(get_read_db)):
+    items = [
+        {
+            "from": item.from_,
+            "to": item.to,
+            "amount": item.amount,
+            "date": local_time(item.date) if item.date else None
+        }
+        for item in request.items
+    ]
+    return await conversion_engine.convert(db, items)
+
+@app.post("/api/v1/tasks/run")
+async def run_task(force: bool = False, wait: bool = True):
+    """Запуск парсинга. Если парсинг уже идёт, вызов присоединяется к нему.
+
+    wait=false сразу возвращает job_id; статус - GET /api/v1/tasks/jobs/{job_id}.
+    """
+    if not wait:
+        job = parse_jobs.submit("manual", force)
+        return JSONResponse(status_code=202, content=job.as_dict())
+
+    job = await parse_jobs.run("manual", force)
+    if isinstance(job.exception, UpstreamError):
+        # ЦБ РФ недоступен: это не ошибка сервиса, последние курсы по-прежнему отдаются
+        headers = {}
+        if isinstance(job.exception, CircuitOpenError):
+            headers["Retry-After"] = str(max(1, round(job.exception.retry_after)))
+        return JSONResponse(
+            status_code=503,
+            headers=headers,
+            content={
+                "detail": f"Источник курсов недоступен: {job.error}",
+                "job_id": job.id,
+                "freshness": snapshot_store.freshness()
+            }
+        )
+    if job.error:
+        raise HTTPException(status_code=500, detail=f"Ошибка парсинга: {job.error}")
+    return {
+        "message": "Курсы получены" if job.result["changed"] else "Курсы не изменились",
+        "currencies_updated": job.result["saved"],
+        "job_id": job.id,
+        "timings": job.as_dict()["timings"],
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/tasks/jobs")
+async def get_parse_jobs():
+    return {**parse_jobs.stats(), "items": parse_jobs.recent()}
+
+@app.get("/api/v1/tasks/jobs/{job_id}")
+async def get_parse_job(job_id: str):
+    job = parse_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.as_dict()
+
+@app.post("/api/v1/tasks/backfill")
+async def run_backfill_task(request: BackfillRequest):
+    from app.services.backfill import start_backfill
+
+    try:
+        start_backfill(request.start, request.end, request.concurrency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return {
+        "message": "Загрузка истории запущена",
+        "start": request.start.isoformat(),
+        "end": request.end.isoformat()
+    }
+
+@app.get("/api/v1/tasks/backfill")
+async def get_backfill_status():
+    from app.services.backfill import backfill_status
+    return backfill_status
+
+@app.post("/api/v1/tasks/compaction")
+async def run_compaction_task():
+    from app.services.retention import rate_compactor
+
+    result = await rate_compactor.run()
+    if result is None:
+        raise HTTPException(status_code=409, detail="Сжатие истории уже выполняется")
+    return result
+
+@app.get("/api/v1/tasks/compaction")
+async def get_compaction_status():
+    from app.services.retention import rate_compactor
+    return await rate_compactor.stats()
+
+@app.get("/api/v1/upstream/stats")
+async def get_upstream_stats():
+    return {"breakers": breakers_stats(), "providers": provider_runner.stats(), "freshness": snapshot_store.freshness()}
+
+@app.get("/api/v1/anomaly/stats")
+async def get_anomaly_stats():
+    return anomaly_detector.stats()
+
+@app.get("/api/v1/cache/stats")
+async def get_cache_stats():
+    return response_cache.stats()
+
+@app.get("/api/v1/ws/stats")
+async def get_websocket_stats():
+    return manager.stats()
+
+@app.get("/api/v1/db/stats")
+async def get_db_stats():
+    return db_writer.stats()
+
+@app.get("/api/v1/nats/stats")
+async def get_nats_stats():
+    return nats_client.publisher.stats()
+
+@app.get("/api/v1/nats/ingest/stats")
+async def get_ingest_stats():
+    return external_ingestor.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+def require_profiler():
+    # Отладочные маршруты профилировщика существуют только при PROFILER_ENABLED
+    if not settings.profiler_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.post("/api/v1/debug/profiler/start", dependencies=[Depends(require_profiler)])
+async def start_profiler(interval: float = Query(0.01, ge=0.001, le=1.0)):
+    try:
+        profiler.start(interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profiler.report()
+
+@app.post("/api/v1/debug/profiler/stop", dependencies=[Depends(require_profiler)])
+async def stop_profiler():
+    # join потока семплирования не должен держать event loop
+    await asyncio.to_thread(profiler.stop)
+    return profiler.report()
+
+@app.get("/api/v1/debug/profiler", dependencies=[Depends(require_profiler)])
+async def get_profiler_report(
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+    limit: int = Query(20, ge=1, le=500)
+):
+    if format == "collapsed":
+        return PlainTextResponse(profiler.collapsed())
+    return profiler.report(limit)
 
 @app.websocket("/ws/currencies")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     
     try:
-        await websocket.send_json({
+        await manager.send_personal_message({
             "type": "connected",
             "message": "WebSocket подключен",
             "timestamp": datetime.now().isoformat()
-        })
+        }, websocket)
         
         while True:
             data = await websocket.receive_text()
             if data == "ping":
-                await websocket.send_json({
+                await manager.send_personal_message({
                     "type": "pong",
                     "timestamp": datetime.now().isoformat()
-                })
+                }, websocket)
+            else:
+                await manager.handle_client_message(websocket, data)
                 
     except Exception as e:
         logger.error(f"WebSocket ошибка: {e}")
@@ -2,60 +2,122 @@ import asyncio
 import json
 import logging
 from nats.aio.client import Client as NATS
-from typing import Dict, Any
+from typing import Any, Dict, Tuple
+
+from app.nats.publisher import NatsPublisher
+from app.services.metrics import registry
 
 logger = logging.getLogger(__name__)
 
+class NatsSubscription:
+    """Подписка, которую клиент восстанавливает после каждого подключения.
+
+    Пока NATS недоступен, подписка только зарегистрирована (active=False).
+    """
+
+    __slots__ = ("client", "subject", "queue", "cb", "sub")
+
+    def __init__(self, client: "NatsClient", subject: str, cb, queue: str = ""):
+        self.client = client
+        self.subject = subject
+        self.queue = queue
+        self.cb = cb
+        self.sub = None
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.subject, self.queue
+
+    @property
+    def active(self) -> bool:
+        return self.sub is not None and self.client.nc.is_connected
+
+    async def activate(self):
+        if self.sub is not None:
+            # Подписка прежнего соединения: снять, чтобы не получить два обработчика
+            try:
+                await self.sub.unsubscribe()
+            except Exception:
+                pass
+            self.sub = None
+        try:
+            self.sub = await self.client.nc.subscribe(self.subject, queue=self.queue, cb=self.cb)
+        except Exception as e:
+            logger.error(f"NATS ошибка подписки на {self.subject}: {e}")
+
+    async def unsubscribe(self):
+        if self.client.subscriptions.get(self.key) is self:
+            del self.client.subscriptions[self.key]
+        if self.sub is not None:
+            try:
+                await self.sub.unsubscribe()
+            except Exception:
+                pass
+            self.sub = None
+
 class NatsClient:
     def __init__(self):
         self.nc = NATS()
         self.is_connected = False
-        self.subscriptions = []
+        # Подписки по (subject, queue); одна на ключ при любом числе переподключений
+        self.subscriptions: Dict[Tuple[str, str], NatsSubscription] = {}
+        self.publisher = NatsPublisher(self)
         
     async def connect(self, servers: str = "nats://localhost:4222"):
+        # Flusher outbox работает и без соединения: он переподключается сам
+        self.publisher.start()
         try:
             await self.nc.connect(servers=servers)
             self.is_connected = True
             logger.info(f"NATS подключен: {servers}")
-            await self.subscribe_to_channels()
         except Exception as e:
             logger.error(f"NATS ошибка подключения: {e}")
             self.is_connected = False
+            return
+        await self.subscribe_to_channels()
+        # Новое соединение: подписки, заведённые до него, оформляются заново
+        for subscription in list(self.subscriptions.values()):
+            await subscription.activate()
             
     async def subscribe_to_channels(self):
-        try:
-            sub = await self.nc.subscribe(
-                "currency.updates", 
-                cb=self.handle_message
-            )
-            self.subscriptions.append(sub)
-            
-        except Exception as e:
-            logger.error(f"NATS ошибка подписки: {e}")
+        if ("currency.updates", "") not in self.subscriptions:
+            self.subscriptions[("currency.updates", "")] = NatsSubscription(self, "currency.updates", self.handle_message)
             
     async def handle_message(self, msg):
         try:
             data = json.loads(msg.data.decode())
-            print(f"NATS команда: {data}")
+            logger.debug(f"NATS команда: {data}")
         except Exception as e:
-            print(f"NATS ошибка команды: {e}")
+            logger.error(f"NATS ошибка команды: {e}")
+            
+    async def subscribe(self, subject: str, cb, queue: str = "") -> NatsSubscription:
+        """Регистрирует подписку; без соединения она оформится после подключения"""
+        subscription = self.subscriptions.get((subject, queue))
+        if subscription is not None and subscription.cb is cb:
+            return subscription
+        if subscription is not None:
+            await subscription.unsubscribe()
+        subscription = NatsSubscription(self, subject, cb, queue)
+        self.subscriptions[subscription.key] = subscription
+        if self.is_connected:
+            await subscription.activate()
+        return subscription
             
     async def publish(self, subject: str, payload: Dict[str, Any]):
-        try:
-            if not self.is_connected:
-                return
-            message = json.dumps(payload).encode()
-            await self.nc.publish(subject, message)
-        except Exception as e:
-            logger.error(f"NATS ошибка публикации: {e}")
+        """Кладёт сообщение в outbox; отправку выполняет фоновый flusher"""
+        self.publisher.enqueue(subject, payload)
             
     async def disconnect(self):
         try:
-            for sub in self.subscriptions:
-                await sub.unsubscribe()
+            await self.publisher.stop()
+            for subscription in list(self.subscriptions.values()):
+                await subscription.unsubscribe()
             await self.nc.close()
             self.is_connected = False
         except Exception as e:
             logger.error(f"NATS ошибка отключения: {e}")
 
 nats_client = NatsClient()
+
+registry.gauge("nats_outbox_depth", "Сообщения в outbox NATS", collect=lambda: len(nats_client.publisher.outbox))
+registry.gauge("nats_connected", "Подключение к NATS (1 - есть)", collect=lambda: int(nats_client.nc.is_connected))
@@ -0,0 +1,112 @@
+import json
+import logging
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.config import settings
+from app.db.database import ReadSessionLocal
+from app.services.response_cache import data_generation
+from app.services.anomaly import anomaly_detector
+from app.services.series import series_store
+from app.services.snapshot import snapshot_store
+from app.websocket.manager import manager
+
+logger = logging.getLogger(__name__)
+
+class BrokerMessage:
+    __slots__ = ("subject", "data")
+
+    def __init__(self, subject: str, data: bytes):
+        self.subject = subject
+        self.data = data
+
+class InMemoryBroker:
+    """Брокер внутри процесса с тем же интерфейсом, что у NatsClient.
+
+    Нужен для проверки кластерного режима без nats-server: несколько
+    ClusterRelay с разными origin, подключённые к одному брокеру, ведут
+    себя как воркеры uvicorn.
+    """
+
+    def __init__(self):
+        self.is_connected = True
+        self._subscribers: Dict[str, List[Callable]] = {}
+
+    async def subscribe(self, subject: str, cb, queue: str = ""):
+        self._subscribers.setdefault(subject, []).append(cb)
+        return cb
+
+    async def publish(self, subject: str, payload: Dict[str, Any]):
+        message = BrokerMessage(subject, json.dumps(payload).encode())
+        for cb in list(self._subscribers.get(subject, ())):
+            await cb(message)
+
+class ClusterRelay:
+    """Пересылка WebSocket-событий между воркерами через брокер.
+
+    Каждое событие публикуется с origin процесса; свои же сообщения,
+    вернувшиеся от брокера, отбрасываются, чужие доставляются локальным
+    сокетам через ConnectionManager.deliver_local. После событий, меняющих
+    курсы или валюты, локальный снимок курсов и состояние детектора
+    аномалий перечитываются из БД, а закэшированные ответы API сбрасываются.
+    """
+
+    REFRESH_EVENTS = ("rates_updated", "currency_created", "currency_updated", "currency_deleted")
+
+    def __init__(self, manager, origin: Optional[str] = None, subject: Optional[str] = None):
+        self.manager = manager
+        self.origin = origin or uuid.uuid4().hex
+        self.subject = subject or settings.nats_subject_cluster
+        self.broker = None
+        self.relayed = 0
+        self.received = 0
+
+    async def attach(self, broker) -> bool:
+        sub = await broker.subscribe(self.subject, self.handle_message)
+        if sub is None:
+            logger.error("Кластерный режим: не удалось подписаться на события других воркеров")
+            return False
+        self.broker = broker
+        self.manager.relay = self
+        if not getattr(sub, "active", True):
+            # Подписку NatsClient восстановит при подключении, до тех пор relay() молчит
+            logger.warning("Кластерный режим: NATS недоступен, обмен событиями начнётся после подключения")
+        logger.info(f"Кластерный режим включён, origin={self.origin}")
+        return True
+
+    def detach(self):
+        if self.manager.relay is self:
+            self.manager.relay = None
+        self.broker = None
+
+    async def relay(self, message: dict, codes: Optional[Iterable[str]] = None):
+        if self.broker is None or not self.broker.is_connected:
+            return
+        await self.broker.publish(self.subject, {
+            "origin": self.origin,
+            "message": message,
+            "codes": list(codes or ())
+        })
+        self.relayed += 1
+
+    async def handle_message(self, msg):
+        try:
+            envelope = json.loads(msg.data.decode())
+            if envelope.get("origin") == self.origin:
+                return
+            self.received += 1
+            message = envelope["message"]
+            if message.get("type") in self.REFRESH_EVENTS:
+                await self.refresh_local_state()
+            await self.manager.deliver_local(message, envelope.get("codes"))
+        except Exception as e:
+            logger.error(f"Кластерный режим: ошибка обработки события: {e}")
+
+    async def refresh_local_state(self):
+        async with ReadSessionLocal() as db:
+            await snapshot_store.seed(db)
+        series_store.invalidate()
+        anomaly_detector.invalidate()
+        data_generation.bump_all()
+
+cluster_relay = ClusterRelay(manager)
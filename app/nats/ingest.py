@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.db.database import ReadSessionLocal
+from app.nats.client import nats_client
+from app.services.anomaly import publish_alerts
+from app.services.cbr_xml import RateRecord
+from app.services.parser import CurrencyParser
+from app.websocket.manager import manager
+
+logger = logging.getLogger(__name__)
+
+class InvalidRateMessage(ValueError):
+    pass
+
+def parse_rate_item(item: Dict[str, Any]) -> RateRecord:
+    """Проверяет одну запись {"code", "rate"|"value", "nominal"?, "name"?}"""
+    if not isinstance(item, dict):
+        raise InvalidRateMessage("Запись должна быть объектом")
+    code = item.get("code")
+    if not isinstance(code, str) or len(code) != 3 or not code.isalpha():
+        raise InvalidRateMessage(f"Некорректный код валюты: {code!r}")
+    code = code.upper()
+
+    value = item.get("rate", item.get("value"))
+    if isinstance(value, str):
+        value = value.replace(",", ".")
+    try:
+        value = float(value)
+        nominal = int(item.get("nominal") or 1)
+    except (TypeError, ValueError):
+        raise InvalidRateMessage(f"{code}: некорректный курс или номинал")
+    if not math.isfinite(value) or value <= 0 or nominal <= 0:
+        raise InvalidRateMessage(f"{code}: курс и номинал должны быть положительными")
+
+    name = item.get("name")
+    return RateRecord(code, name if isinstance(name, str) and name else code, value / nominal)
+
+def parse_rate_message(data: bytes) -> List[RateRecord]:
+    """Сообщение - одна запись или {"rates": [...]} с несколькими"""
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        raise InvalidRateMessage("Сообщение не является JSON")
+    if isinstance(payload, dict) and "rates" in payload:
+        items = payload["rates"]
+        if not isinstance(items, list):
+            raise InvalidRateMessage("Поле rates должно быть списком")
+    else:
+        items = [payload]
+    return [parse_rate_item(item) for item in items]
+
+class ExternalRateIngestor:
+    """Приём курсов от внешних систем из NATS (settings.nats_subject_external).
+
+    Колбэк подписки только кладёт сырое сообщение в ограниченную очередь;
+    если очередь заполнена, колбэк ждёт, и NATS придерживает доставку.
+    Несколько задач-декодеров разбирают и проверяют сообщения и копят
+    записи в текущую пачку. Пачка сбрасывается по размеру или по
+    batch_interval одним вызовом save_rates_bulk с той же проверкой
+    изменений, что и у парсера, после чего отправляется одно общее
+    событие rates_updated в WebSocket и NATS. Запись в БД выполняется
+    последовательно: порядок пачек определяет последнее значение курса.
+    """
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        batch_interval: Optional[float] = None,
+        queue_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        subject: Optional[str] = None
+    ):
+        self.batch_size = batch_size or settings.external_ingest_batch_size
+        self.batch_interval = batch_interval if batch_interval is not None else settings.external_ingest_batch_interval
+        self.queue_size = queue_size or settings.external_ingest_queue_size
+        self.concurrency = concurrency or settings.external_ingest_concurrency
+        self.subject = subject or settings.nats_subject_external
+        self.queue: Optional[asyncio.Queue] = None
+        self.pending: Dict[str, RateRecord] = {}
+        self._pending_messages = 0
+        self._batch_started: Optional[float] = None
+        self._full = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._subscription = None
+
+        self.received_total = 0
+        self.rejected_total = 0
+        self.batches_total = 0
+        self.saved_total = 0
+        self.changes_total = 0
+        self.failed_batches = 0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+
+    async def start(self, broker) -> bool:
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._decode()) for _ in range(self.concurrency)]
+        self._flusher = asyncio.create_task(self._flush_loop())
+        # Очередь-группа: в кластере сообщение обрабатывает только один воркер
+        self._subscription = await broker.subscribe(self.subject, self.handle_message, queue="currency-ingest")
+        if self._subscription is None:
+            logger.warning(f"Приём внешних курсов: нет подписки на {self.subject}")
+            return False
+        if not getattr(self._subscription, "active", True):
+            # NatsClient оформит подписку сам, когда подключится
+            logger.warning(f"Приём внешних курсов: NATS недоступен, подписка на {self.subject} - после подключения")
+        else:
+            logger.info(f"Приём внешних курсов из {self.subject} запущен")
+        return True
+
+    async def stop(self, timeout: float = 5.0):
+        """Дожидается разбора очереди и записывает последнюю пачку"""
+        if self.queue is None:
+            return
+        if self._subscription is not None:
+            try:
+                await self._subscription.unsubscribe()
+            except Exception:
+                pass
+            self._subscription = None
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Приём внешних курсов: не разобрано {self.queue.qsize()} сообщений")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Текущую запись не прерываем: flusher сам сбросит остаток и завершится
+        self._stopping = True
+        self._full.set()
+        await self._flusher
+        self._flusher = None
+        self.queue = None
+
+    async def handle_message(self, msg):
+        self.received_total += 1
+        await self.queue.put(msg.data)
+
+    async def _decode(self):
+        while True:
+            data = await self.queue.get()
+            try:
+                records = parse_rate_message(data)
+            except InvalidRateMessage as e:
+                self.rejected_total += 1
+                logger.debug(f"Приём внешних курсов: сообщение отклонено: {e}")
+            else:
+                if self._batch_started is None:
+                    self._batch_started = time.perf_counter()
+                # В пачке остаётся последнее значение по каждой валюте
+                for record in records:
+                    self.pending[record.code] = record
+                self._pending_messages += 1
+                if self._pending_messages >= self.batch_size:
+                    self._full.set()
+            finally:
+                self.queue.task_done()
+            # Отдаём управление, чтобы колбэк подписки успевал наполнять очередь
+            await asyncio.sleep(0)
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            self._full.clear()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.batch_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+        await self.flush()
+
+    async def flush(self) -> int:
+        if not self.pending:
+            return 0
+        records = list(self.pending.values())
+        messages = self._pending_messages
+        started = self._batch_started or time.perf_counter()
+        self.pending = {}
+        self._pending_messages = 0
+        self._batch_started = None
+
+        try:
+            async with ReadSessionLocal() as db:
+                result = await CurrencyParser(db).save_rates_bulk(records, only_changed=True)
+        except Exception as e:
+            logger.error(f"Приём внешних курсов: ошибка записи пачки из {messages} сообщений, повтор со следующей: {e}")
+            self.failed_batches += 1
+            # Пачка возвращается в текущую; значения, пришедшие во время записи, новее
+            self.pending = {**{record.code: record for record in records}, **self.pending}
+            self._pending_messages += messages
+            self._batch_started = started
+            return 0
+
+        self.batches_total += 1
+        self.saved_total += result["saved"]
+        self.changes_total += len(result["changes"])
+        self.last_batch_size = messages
+        self.last_batch_seconds = time.perf_counter() - started
+
+        if result["changes"]:
+            timestamp = datetime.now().isoformat()
+            await manager.broadcast({
+                "type": "rates_updated",
+                "data": {
+                    "source": "external",
+                    "rates_count": result["saved"],
+                    "changes": result["changes"],
+                    "timestamp": timestamp
+                }
+            }, codes=[change["code"] for change in result["changes"]])
+            await nats_client.publish(settings.nats_subject_updates, {
+                "event": "external_rates_ingested",
+                "messages": messages,
+                "rates_count": result["saved"],
+                "changes": result["changes"],
+                "timestamp": timestamp
+            })
+        await publish_alerts(result["alerts"], source="external")
+        return result["saved"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subject": self.subject,
+            "subscribed": self._subscription is not None and getattr(self._subscription, "active", True),
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "pending_rates": len(self.pending),
+            "received_total": self.received_total,
+            "rejected_total": self.rejected_total,
+            "batches_total": self.batches_total,
+            "failed_batches": self.failed_batches,
+            "saved_total": self.saved_total,
+            "changes_total": self.changes_total,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_seconds": round(self.last_batch_seconds, 6)
+        }
+
+external_ingestor = ExternalRateIngestor()
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.metrics import nats_publish_latency
+
+logger = logging.getLogger(__name__)
+
+OutboxItem = Tuple[str, Dict[str, Any], float]
+
+class NatsPublisher:
+    """Публикация в NATS через ограниченный outbox и фоновый flusher.
+
+    Обработчики API только кладут событие в outbox и сразу возвращаются.
+    Flusher отправляет сообщения пачками (по размеру пачки или по
+    истечении flush_interval) и делает один flush на пачку. Пока NATS
+    недоступен, сообщения копятся; при переполнении outbox новые
+    сообщения дописываются в spill-файл (если он задан) или вытесняют
+    самые старые. После переподключения накопленное отправляется заново.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        spill_path: Optional[str] = None
+    ):
+        self.client = client
+        self.max_size = max_size or settings.nats_outbox_size
+        self.batch_size = batch_size or settings.nats_batch_size
+        self.flush_interval = flush_interval if flush_interval is not None else settings.nats_flush_interval
+        self.spill_path = spill_path if spill_path is not None else settings.nats_spill_path
+        self.outbox: Deque[OutboxItem] = deque()
+        self.spilled = 0
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.published_total = 0
+        self.dropped_total = 0
+        self.failed_batches = 0
+        self.batches_total = 0
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+        self.latency_sum = 0.0
+
+        if self.spill_path and os.path.exists(self.spill_path):
+            with open(self.spill_path, "rb") as f:
+                self.spilled = sum(1 for _ in f)
+            if self.spilled:
+                logger.info(f"NATS outbox: в spill-файле {self.spilled} неотправленных сообщений")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 2.0):
+        """Пытается отправить остаток; не успевшее уходит в spill-файл"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._full.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        self._task = None
+        if self.outbox and self.spill_path:
+            self._spill_items(list(self.outbox), prepend=True)
+            self.outbox.clear()
+
+    def enqueue(self, subject: str, payload: Dict[str, Any]):
+        item = (subject, payload, time.perf_counter())
+        if self.spill_path and (self.spilled or len(self.outbox) >= self.max_size):
+            # Пока в файле есть сообщения, новые идут туда же, чтобы сохранить порядок
+            self._spill_items([item])
+        else:
+            if len(self.outbox) >= self.max_size:
+                self.outbox.popleft()
+                self.dropped_total += 1
+            self.outbox.append(item)
+            if len(self.outbox) >= self.batch_size:
+                self._full.set()
+        self._wakeup.set()
+
+    def _spill_items(self, items: List[OutboxItem], prepend: bool = False):
+        lines = [json.dumps({"s": subject, "p": payload}) + "\n" for subject, payload, _ in items]
+        try:
+            if prepend and self.spilled:
+                with open(self.spill_path, "r", encoding="utf-8") as f:
+                    lines.extend(f.readlines())
+                mode = "w"
+            else:
+                mode = "w" if prepend else "a"
+            with open(self.spill_path, mode, encoding="utf-8") as f:
+                f.writelines(lines)
+            self.spilled = len(lines) if mode == "w" else self.spilled + len(lines)
+        except OSError as e:
+            logger.error(f"NATS outbox: ошибка записи spill-файла: {e}")
+            self.dropped_total += len(items)
+
+    def _load_spilled(self) -> bool:
+        if not self.spilled:
+            return False
+        try:
+            with open(self.spill_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            head, rest = lines[:self.max_size], lines[self.max_size:]
+            with open(self.spill_path, "w", encoding="utf-8") as f:
+                f.writelines(rest)
+        except OSError as e:
+            logger.error(f"NATS outbox: ошибка чтения spill-файла: {e}")
+            return False
+        now = time.perf_counter()
+        for line in head:
+            record = json.loads(line)
+            self.outbox.append((record["s"], record["p"], now))
+        self.spilled = len(rest)
+        return bool(head)
+
+    def _connected(self) -> bool:
+        return self.client.nc.is_connected
+
+    async def _run(self):
+        while True:
+            if not self.outbox and not self._load_spilled():
+                if self._stopping:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if len(self.outbox) < self.batch_size and not self._stopping:
+                # Пачка отправляется по размеру или по истечении интервала
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            if not self._connected():
+                if self._stopping:
+                    return
+                await self._reconnect()
+                continue
+
+            batch = [self.outbox.popleft() for _ in range(min(self.batch_size, len(self.outbox)))]
+            try:
+                for subject, payload, _ in batch:
+                    await self.client.nc.publish(subject, json.dumps(payload).encode())
+                await self.client.nc.flush(timeout=5)
+            except Exception as e:
+                logger.error(f"NATS ошибка публикации пачки: {e}")
+                self.outbox.extendleft(reversed(batch))
+                self.failed_batches += 1
+                await asyncio.sleep(min(1.0, settings.nats_reconnect_interval))
+                continue
+
+            now = time.perf_counter()
+            self.batches_total += 1
+            self.published_total += len(batch)
+            for _, _, enqueued_at in batch:
+                latency = now - enqueued_at
+                nats_publish_latency.observe(latency)
+                self.latency_sum += latency
+                self.latency_max = max(self.latency_max, latency)
+            self.latency_last = now - batch[-1][2]
+
+    async def _reconnect(self):
+        nc = self.client.nc
+        if not (nc.is_reconnecting or nc.is_connecting):
+            logger.info("NATS outbox: переподключение...")
+            await self.client.connect(settings.nats_url)
+        if not self._connected():
+            await asyncio.sleep(settings.nats_reconnect_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self._connected(),
+            "outbox_depth": len(self.outbox),
+            "spilled": self.spilled,
+            "published_total": self.published_total,
+            "dropped_total": self.dropped_total,
+            "batches_total": self.batches_total,
+            "failed_batches": self.failed_batches,
+            "publish_latency_last": round(self.latency_last, 6),
+            "publish_latency_max": round(self.latency_max, 6),
+            "publish_latency_avg": round(self.latency_sum / self.published_total, 6) if self.published_total else 0.0
+        }
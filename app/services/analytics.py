@@ -0,0 +1,119 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import Currency
+from app.services.history import local_time
+from app.services.series import series_store
+
+INTERVALS = ("day", "week", "month")
+
+def bucket_keys(timestamps: np.ndarray, interval: str) -> np.ndarray:
+    """Начало интервала (день, неделя с понедельника, месяц) для каждой точки"""
+    days = timestamps.astype("datetime64[D]")
+    if interval == "day":
+        return days
+    if interval == "week":
+        # 1970-01-01 - четверг, сдвигаем к понедельнику
+        offsets = (days.astype(np.int64) + 3) % 7
+        return days - offsets.astype("timedelta64[D]")
+    if interval == "month":
+        return timestamps.astype("datetime64[M]").astype("datetime64[D]")
+    raise ValueError(f"Неизвестный интервал: {interval}")
+
+def resample(timestamps: np.ndarray, values: np.ndarray, interval: str) -> Dict[str, np.ndarray]:
+    """OHLC, среднее и количество точек по интервалам для отсортированного ряда"""
+    if not len(values):
+        empty = np.array([], dtype=np.float64)
+        return {
+            "t": np.array([], dtype="datetime64[D]"), "open": empty, "high": empty,
+            "low": empty, "close": empty, "mean": empty, "count": np.array([], dtype=np.int64)
+        }
+
+    keys = bucket_keys(timestamps, interval)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(values)]
+    counts = ends - starts
+    return {
+        "t": keys[starts],
+        "open": values[starts],
+        "high": np.maximum.reduceat(values, starts),
+        "low": np.minimum.reduceat(values, starts),
+        "close": values[ends - 1],
+        "mean": np.add.reduceat(values, starts) / counts,
+        "count": counts
+    }
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    result = np.full(len(values), np.nan)
+    if window > 0 and len(values) >= window:
+        cumsum = np.cumsum(np.r_[0.0, values])
+        result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
+
+def pct_change(values: np.ndarray) -> np.ndarray:
+    result = np.full(len(values), np.nan)
+    if len(values) > 1:
+        result[1:] = (values[1:] / values[:-1] - 1.0) * 100.0
+    return result
+
+def _column(values: np.ndarray, digits: int = 6) -> List[Optional[float]]:
+    rounded = np.round(values, digits)
+    return np.where(np.isnan(rounded), None, rounded).tolist()
+
+async def get_analytics(
+    db: AsyncSession,
+    code: str,
+    interval: str = "day",
+    window: int = 7,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+) -> Optional[Dict[str, Any]]:
+    """Аналитика по валюте в колоночном виде: один массив на показатель"""
+    if interval not in INTERVALS:
+        raise ValueError(f"Интервал должен быть одним из: {', '.join(INTERVALS)}")
+
+    result = await db.execute(select(Currency.id).where(Currency.code == code.upper()))
+    currency_id = result.scalar_one_or_none()
+    if currency_id is None:
+        return None
+
+    series = await series_store.get(db, currency_id)
+    timestamps, values = series.view()
+    # Серии в локальном времени без пояса, как и граница после local_time
+    start = 0 if date_from is None else np.searchsorted(timestamps, np.datetime64(local_time(date_from), "us"), side="left")
+    end = len(timestamps) if date_to is None else np.searchsorted(timestamps, np.datetime64(local_time(date_to), "us"), side="right")
+    timestamps, values = timestamps[start:end], values[start:end]
+
+    buckets = resample(timestamps, values, interval)
+    close = buckets["close"]
+    summary = None
+    if len(values):
+        summary = {
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": float(values.mean()),
+            "first": float(values[0]),
+            "last": float(values[-1]),
+            "change_pct": float((values[-1] / values[0] - 1.0) * 100.0)
+        }
+
+    return {
+        "code": code.upper(),
+        "interval": interval,
+        "window": window,
+        "points": int(len(values)),
+        "summary": summary,
+        "t": [str(key) for key in buckets["t"]],
+        "open": _column(buckets["open"]),
+        "high": _column(buckets["high"]),
+        "low": _column(buckets["low"]),
+        "close": _column(close),
+        "mean": _column(buckets["mean"]),
+        "count": buckets["count"].tolist(),
+        "ma": _column(moving_average(close, window)),
+        "pct_change": _column(pct_change(close), 4)
+    }
@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.models import Currency, CurrencyRate, RateStats
+from app.db.writer import db_writer
+from app.nats.client import nats_client
+from app.services.history import rate_points
+from app.services.metrics import registry
+from app.websocket.manager import manager
+
+logger = logging.getLogger(__name__)
+
+rate_alerts = registry.counter("rate_alerts_total", "Аномальные изменения курсов", ("code",))
+
+# Точка для детектора: (currency_id, код, значение, время курса)
+RatePoint = Tuple[int, str, float, datetime]
+
+class RunningStats:
+    """Статистика логарифмических изменений курса одной валюты за O(1) памяти.
+
+    Среднее и дисперсия за всю историю считаются алгоритмом Уэлфорда,
+    недавний режим - экспоненциальным средним (EWMA) и его дисперсией.
+    Повтор того же значения не считается изменением.
+    """
+
+    __slots__ = ("count", "mean", "m2", "ewma", "ewm_var", "last_value", "last_at")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0, ewma: float = 0.0,
+                 ewm_var: float = 0.0, last_value: Optional[float] = None, last_at: Optional[datetime] = None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.ewma = ewma
+        self.ewm_var = ewm_var
+        self.last_value = last_value
+        self.last_at = last_at
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def zscores(self, change: float) -> Tuple[Optional[float], Optional[float]]:
+        """z-оценка изменения относительно всей истории и относительно EWMA"""
+        std = self.std
+        ewm_std = math.sqrt(self.ewm_var)
+        return (
+            (change - self.mean) / std if std > 0 else None,
+            (change - self.ewma) / ewm_std if ewm_std > 0 else None
+        )
+
+    def push(self, change: float, alpha: float):
+        self.count += 1
+        delta = change - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (change - self.mean)
+        if self.count == 1:
+            self.ewma, self.ewm_var = change, 0.0
+        else:
+            diff = change - self.ewma
+            increment = alpha * diff
+            self.ewma += increment
+            self.ewm_var = (1 - alpha) * (self.ewm_var + diff * increment)
+
+    def as_row(self, currency_id: int) -> Dict[str, Any]:
+        return {"currency_id": currency_id, **{name: getattr(self, name) for name in self.__slots__}}
+
+class AnomalyDetector:
+    """Поиск аномальных скачков курсов по мере записи, без перечитывания истории.
+
+    save_rates_bulk передаёт сохранённые курсы в observe() внутри своей
+    операции db_writer, статистика валют обновляется в памяти. Состояние
+    (одна строка rate_stats на валюту) сохраняется чекпоинтом не чаще
+    anomaly_checkpoint_interval секунд и при остановке; после перезапуска
+    детектор загружает чекпоинт и доигрывает только курсы, записанные
+    после него, без перечитывания всей истории.
+    Изменение считается аномальным, когда после anomaly_min_samples
+    изменений его z-оценка превышает anomaly_z_threshold и относительно
+    всей истории, и относительно EWMA: одна историческая оценка шумит при
+    смене режима волатильности, одна EWMA - на первых точках.
+    Точки не новее последней учтённой (поздний backfill) пропускаются.
+    """
+
+    def __init__(self, recent_size: int = 100):
+        self.states: Dict[int, RunningStats] = {}
+        self.loaded = False
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=recent_size)
+        # Валюты, изменившиеся после последнего чекпоинта
+        self.dirty: Set[int] = set()
+        self.checkpointed_at = time.monotonic()
+        self.checkpoints_total = 0
+        self.observed_total = 0
+        self.skipped_total = 0
+        self.alerts_total = 0
+
+    async def ensure_loaded(self, db: AsyncSession):
+        """Загружает чекпоинт и доигрывает курсы, записанные после него"""
+        if self.loaded:
+            return
+        result = await db.execute(select(RateStats))
+        self.states = {
+            row.currency_id: RunningStats(
+                row.count, row.mean, row.m2, row.ewma, row.ewm_var, row.last_value, row.last_at
+            )
+            for row in result.scalars()
+        }
+        self.dirty = set()
+        self.loaded = True
+
+        replayed = 0
+        checkpointed = [state.last_at for state in self.states.values() if state.last_at is not None]
+        if checkpointed:
+            # Валюты без строки в rate_stats появились после чекпоинта
+            watermark = max(checkpointed)
+            result = await db.execute(
+                select(CurrencyRate.currency_id, Currency.code, CurrencyRate.value, CurrencyRate.date)
+                .join(Currency, Currency.id == CurrencyRate.currency_id)
+                .outerjoin(RateStats, RateStats.currency_id == CurrencyRate.currency_id)
+                .where(CurrencyRate.date > func.coalesce(RateStats.last_at, watermark))
+                .order_by(CurrencyRate.date, CurrencyRate.id)
+            )
+            rows = result.all()
+            replayed = len(rows)
+            self.update(rows)
+        logger.info(f"Состояние детектора аномалий загружено: {len(self.states)} валют, доиграно курсов: {replayed}")
+
+    def update(self, points: Iterable[RatePoint]) -> Tuple[Set[int], List[Dict[str, Any]]]:
+        """Учитывает точки по порядку; возвращает изменённые валюты и аномалии"""
+        threshold = settings.anomaly_z_threshold
+        touched: Set[int] = set()
+        alerts: List[Dict[str, Any]] = []
+        for currency_id, code, value, moment in points:
+            state = self.states.get(currency_id)
+            if state is None:
+                state = self.states[currency_id] = RunningStats()
+            if (state.last_at is not None and moment <= state.last_at) or value is None or value <= 0:
+                self.skipped_total += 1
+                continue
+            touched.add(currency_id)
+            previous = state.last_value
+            state.last_value, state.last_at = value, moment
+            if previous is None or previous == value:
+                continue
+
+            change = math.log(value / previous)
+            zscore, ewma_zscore = state.zscores(change)
+            if (
+                state.count >= settings.anomaly_min_samples
+                and zscore is not None and abs(zscore) > threshold
+                and ewma_zscore is not None and abs(ewma_zscore) > threshold
+            ):
+                alerts.append({
+                    "code": code,
+                    "value": value,
+                    "previous": previous,
+                    "change_pct": round((value / previous - 1.0) * 100.0, 6),
+                    "zscore": round(zscore, 3),
+                    "ewma_zscore": round(ewma_zscore, 3),
+                    "samples": state.count,
+                    "date": moment.isoformat()
+                })
+            state.push(change, settings.anomaly_ewma_alpha)
+            self.observed_total += 1
+        return touched, alerts
+
+    async def observe(self, db: AsyncSession, points: List[RatePoint]) -> List[Dict[str, Any]]:
+        """Шаг внутри операции db_writer: порядок точек совпадает с порядком коммитов.
+
+        Состояние меняется только в памяти; при ошибке записи вызывающий
+        сбрасывает его (invalidate), и следующая загрузка доиграет
+        зафиксированные курсы от чекпоинта. Вызывающий загружает состояние
+        (ensure_loaded) до вставки points, иначе доигрывание учтёт их без аномалий.
+        """
+        await self.ensure_loaded(db)
+        touched, alerts = self.update(sorted(points, key=lambda point: point[3]))
+        self.dirty |= touched
+        return alerts
+
+    async def _write_states(self, db: AsyncSession, currency_ids: Iterable[int]):
+        rows = [self.states[currency_id].as_row(currency_id) for currency_id in currency_ids if currency_id in self.states]
+        if not rows:
+            return
+        statement = sqlite_insert(RateStats)
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=["currency_id"],
+            set_={name: statement.excluded[name] for name in RunningStats.__slots__}
+        ), rows)
+
+    async def checkpoint(self, force: bool = False) -> int:
+        """Сохраняет изменённые состояния в rate_stats отдельной операцией db_writer.
+
+        Без force - не чаще anomaly_checkpoint_interval секунд.
+        """
+        if not self.dirty or (not force and time.monotonic() - self.checkpointed_at < settings.anomaly_checkpoint_interval):
+            return 0
+        self.checkpointed_at = time.monotonic()
+        dirty, self.dirty = self.dirty, set()
+
+        async def write(db: AsyncSession):
+            await self._write_states(db, dirty)
+
+        try:
+            await db_writer.submit(write)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения чекпоинта детектора аномалий: {e}")
+            self.dirty |= dirty
+            return 0
+        self.checkpoints_total += 1
+        return len(dirty)
+
+    def record(self, alerts: List[Dict[str, Any]]):
+        """Учитывает аномалии после коммита"""
+        for alert in alerts:
+            logger.warning(
+                f"Аномальное изменение курса {alert['code']}: {alert['previous']} -> {alert['value']} "
+                f"({alert['change_pct']}%, z={alert['zscore']}, z_ewma={alert['ewma_zscore']})"
+            )
+            rate_alerts.inc(code=alert["code"])
+            self.recent.append(alert)
+        self.alerts_total += len(alerts)
+
+    async def rebuild(self) -> Dict[str, Any]:
+        """Однократно пересчитывает состояние по всей истории (первый запуск на существующей БД)"""
+        async def write(db: AsyncSession):
+            result = await db.execute(select(Currency.id, Currency.code))
+            currencies = dict(result.all())
+            points = rate_points(list(currencies))
+            result = await db.execute(
+                select(points.c.currency_id, points.c.value, points.c.date).order_by(points.c.date, points.c.id)
+            )
+            self.states = {}
+            self.loaded = True
+            _, alerts = self.update(
+                (row.currency_id, currencies[row.currency_id], row.value, row.date) for row in result
+            )
+            await db.execute(delete(RateStats))
+            await self._write_states(db, list(self.states))
+            self.dirty = set()
+            return alerts
+
+        try:
+            alerts = await db_writer.submit(write)
+        except Exception:
+            self.invalidate()
+            raise
+        return {"currencies": len(self.states), "changes": sum(state.count for state in self.states.values()), "alerts": len(alerts)}
+
+    def invalidate(self, currency_id: Optional[int] = None):
+        """Следующий observe() перечитает состояние из rate_stats"""
+        if currency_id is None:
+            self.states.clear()
+            self.dirty.clear()
+            self.loaded = False
+        else:
+            self.states.pop(currency_id, None)
+            self.dirty.discard(currency_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.anomaly_enabled,
+            "loaded": self.loaded,
+            "currencies": len(self.states),
+            "z_threshold": settings.anomaly_z_threshold,
+            "min_samples": settings.anomaly_min_samples,
+            "ewma_alpha": settings.anomaly_ewma_alpha,
+            "observed_total": self.observed_total,
+            "skipped_total": self.skipped_total,
+            "alerts_total": self.alerts_total,
+            "pending_checkpoint": len(self.dirty),
+            "checkpoints_total": self.checkpoints_total,
+            "recent_alerts": list(self.recent)
+        }
+
+anomaly_detector = AnomalyDetector()
+
+async def publish_alerts(alerts: List[Dict[str, Any]], source: str):
+    """Рассылает аномалии в WebSocket (событие rate_alert) и в NATS (по сообщению на аномалию)"""
+    if not alerts:
+        return
+    timestamp = datetime.now().isoformat()
+    await manager.broadcast({
+        "type": "rate_alert",
+        "data": {"source": source, "alerts": alerts, "timestamp": timestamp}
+    }, codes=[alert["code"] for alert in alerts])
+    for alert in alerts:
+        await nats_client.publish(settings.nats_subject_alerts, {
+            "event": "rate_anomaly",
+            "source": source,
+            **alert,
+            "timestamp": timestamp
+        })
+
+async def _main(args):
+    from app.db.database import engine, Base
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    try:
+        result = await AnomalyDetector().rebuild()
+    finally:
+        await db_writer.stop()
+    print(
+        f"Состояние пересчитано: валют {result['currencies']}, изменений {result['changes']}, "
+        f"аномалий в истории {result['alerts']}"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересчёт состояния детектора аномалий по всей истории курсов")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+from sqlalchemy import select
+
+from app.config import settings
+from app.db.database import ReadSessionLocal
+from app.db.writer import db_writer
+from app.db.models import BackfillCheckpoint
+from app.services.cbr_xml import CbrXmlStreamParser, RateRecord
+from app.services.http_client import close_http_client, get_http_client
+from app.services.parser import CurrencyParser
+
+logger = logging.getLogger(__name__)
+
+backfill_status: Dict[str, Any] = {"running": False, "last_result": None}
+_backfill_task: Optional[asyncio.Task] = None
+
+# Верхняя граница числа воркеров (BackfillRequest.concurrency в API)
+MAX_CONCURRENCY = 64
+
+class BackfillRunner:
+    """Загружает исторические курсы ЦБ РФ за диапазон дат.
+
+    Страницы XML_daily.asp?date_req= скачиваются пулом из `concurrency`
+    воркеров на общем httpx.AsyncClient приложения, XML разбирается
+    потоковым парсером по мере получения, а результаты пачками по
+    `batch_days` дней пишутся в
+    БД вместе с чекпоинтами, поэтому прерванную загрузку можно продолжить.
+    """
+
+    def __init__(
+        self,
+        start: date,
+        end: date,
+        concurrency: Optional[int] = None,
+        batch_days: Optional[int] = None,
+        cbr_url: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None
+    ):
+        if end < start:
+            raise ValueError("Дата окончания раньше даты начала")
+        self.start = start
+        self.end = end
+        self.concurrency = settings.backfill_concurrency if concurrency is None else concurrency
+        if not 1 <= self.concurrency <= MAX_CONCURRENCY:
+            raise ValueError(f"Число воркеров должно быть от 1 до {MAX_CONCURRENCY}")
+        self.batch_days = batch_days or settings.backfill_batch_days
+        self.cbr_url = cbr_url or settings.cbr_url
+        self.client = client
+        self.failed: List[date] = []
+        self.days_fetched = 0
+        self.rates_saved = 0
+
+    def _dates(self) -> List[date]:
+        days = (self.end - self.start).days + 1
+        return [self.start + timedelta(days=i) for i in range(days)]
+
+    async def _load_checkpoints(self) -> Tuple[Set[date], Set[date]]:
+        async with ReadSessionLocal() as db:
+            result = await db.execute(
+                select(BackfillCheckpoint.date_req, BackfillCheckpoint.rates_date)
+            )
+            rows = result.all()
+        done_dates = {date_req for date_req, _ in rows}
+        known_rate_dates = {rates_date for _, rates_date in rows if rates_date}
+        return done_dates, known_rate_dates
+
+    async def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        done_dates, known_rate_dates = await self._load_checkpoints()
+        all_dates = self._dates()
+        pending = [day for day in all_dates if day not in done_dates]
+        logger.info(
+            f"Backfill {self.start}..{self.end}: {len(pending)} дней к загрузке, "
+            f"{len(all_dates) - len(pending)} уже загружено"
+        )
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        client = self.client or get_http_client()
+        dates = iter(pending)
+
+        async def worker():
+            # Общий итератор: каждый воркер берёт следующую свободную дату
+            for day in dates:
+                await self._fetch_day(client, queue, day)
+
+        async def produce():
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            await queue.put(None)
+
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(produce())
+            tg.create_task(self._writer(queue, known_rate_dates))
+
+        elapsed = time.perf_counter() - started
+        result = {
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "days_requested": len(all_dates),
+            "days_skipped": len(all_dates) - len(pending),
+            "days_fetched": self.days_fetched,
+            "days_failed": len(self.failed),
+            "rates_saved": self.rates_saved,
+            "elapsed": round(elapsed, 3),
+            "days_per_second": round(self.days_fetched / elapsed, 2) if elapsed > 0 else 0.0
+        }
+        logger.info(f"Backfill завершен: {result}")
+        return result
+
+    async def _fetch_day(self, client: httpx.AsyncClient, queue: asyncio.Queue, day: date):
+        try:
+            parser = CbrXmlStreamParser()
+            rates: List[RateRecord] = []
+            async with client.stream(
+                "GET",
+                self.cbr_url,
+                params={"date_req": day.strftime("%d/%m/%Y")}
+            ) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    rates.extend(parser.feed(chunk))
+            rates.extend(parser.close())
+            if parser.date is None:
+                raise ValueError("в ответе нет даты курсов")
+            rates_day = parser.date.date()
+        except Exception as e:
+            logger.warning(f"Backfill: не удалось загрузить {day}: {e}")
+            self.failed.append(day)
+            return
+        await queue.put((day, rates_day, rates))
+
+    async def _writer(self, queue: asyncio.Queue, known_rate_dates: Set[date]):
+        checkpoints: List[BackfillCheckpoint] = []
+        rows: List[RateRecord] = []
+
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            day, rates_date, rates = item
+            self.days_fetched += 1
+
+            # В выходные ЦБ отдаёт курсы последнего рабочего дня - не дублируем их
+            rates_count = 0
+            if rates_date not in known_rate_dates:
+                known_rate_dates.add(rates_date)
+                rows.extend(rates)
+                rates_count = len(rates)
+
+            checkpoints.append(BackfillCheckpoint(
+                date_req=day,
+                rates_date=rates_date,
+                rates_count=rates_count
+            ))
+            if len(checkpoints) >= self.batch_days:
+                await self._flush(checkpoints, rows)
+                checkpoints, rows = [], []
+
+        if checkpoints:
+            await self._flush(checkpoints, rows)
+
+    async def _flush(self, checkpoints: List[BackfillCheckpoint], rows: List[RateRecord]):
+        if not rows:
+            async def write(db):
+                db.add_all(checkpoints)
+                await db.flush()
+            await db_writer.submit(write)
+            return
+        async with ReadSessionLocal() as db:
+            # Чекпоинты фиксируются в той же транзакции, что и курсы
+            result = await CurrencyParser(db).save_rates_bulk(rows, source_dates=True, attach=checkpoints)
+            self.rates_saved += result["saved"]
+
+async def run_backfill(start: date, end: date, concurrency: Optional[int] = None) -> Dict[str, Any]:
+    backfill_status["running"] = True
+    try:
+        result = await BackfillRunner(start, end, concurrency=concurrency).run()
+        backfill_status["last_result"] = result
+        return result
+    except Exception as e:
+        logger.error(f"Ошибка backfill: {e}")
+        backfill_status["last_result"] = {"error": str(e)}
+        raise
+    finally:
+        backfill_status["running"] = False
+
+def start_backfill(start: date, end: date, concurrency: Optional[int] = None) -> asyncio.Task:
+    """Запускает backfill в фоне; одновременно выполняется только одна загрузка"""
+    global _backfill_task
+    if end < start:
+        raise ValueError("Дата окончания раньше даты начала")
+    if backfill_status["running"]:
+        raise RuntimeError("Backfill уже выполняется")
+    backfill_status["running"] = True
+    _backfill_task = asyncio.create_task(run_backfill(start, end, concurrency))
+    _backfill_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    return _backfill_task
+
+async def _main(args):
+    from app.db.database import engine, Base
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    try:
+        result = await BackfillRunner(
+            date.fromisoformat(args.start),
+            date.fromisoformat(args.end),
+            concurrency=args.concurrency,
+            batch_days=args.batch_days,
+            cbr_url=args.cbr_url
+        ).run()
+    finally:
+        await db_writer.stop()
+        await close_http_client()
+    print(
+        f"Загружено дней: {result['days_fetched']} из {result['days_requested']} "
+        f"(пропущено {result['days_skipped']}, ошибок {result['days_failed']}), "
+        f"курсов: {result['rates_saved']}, {result['days_per_second']} дней/с"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Загрузка исторических курсов ЦБ РФ")
+    parser.add_argument("--start", required=True, help="Начальная дата, YYYY-MM-DD")
+    parser.add_argument("--end", default=date.today().isoformat(), help="Конечная дата, YYYY-MM-DD")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--batch-days", type=int, default=None)
+    parser.add_argument("--cbr-url", default=None, help="Адрес XML_daily.asp (например, локальный mock)")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,90 @@
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, NamedTuple, Optional
+
+class RateRecord(NamedTuple):
+    code: str
+    name: str
+    rate: float
+    date: Optional[datetime] = None
+
+class CbrXmlStreamParser:
+    """Инкрементальный разбор XML_daily ЦБ РФ.
+
+    Принимает документ кусками байт, поэтому кодировка windows-1251 из XML
+    декларации обрабатывается самим expat без предварительного декодирования
+    всего ответа. Разобранные элементы отсоединяются от корня после каждого
+    куска, так что память не растёт с размером документа, а повторяющиеся
+    строки (коды и названия валют) переиспользуются.
+
+    Из событий "start" нужен только корневой ValCurs (дата документа и
+    ссылка для отсоединения записей), остальные пропускаются сразу.
+    """
+
+    __slots__ = ("_parser", "_root", "_strings", "date")
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root: Optional[ET.Element] = None
+        self._strings: Dict[str, str] = {}
+        self.date: Optional[datetime] = None
+
+    def feed(self, chunk: bytes) -> Iterator[RateRecord]:
+        self._parser.feed(chunk)
+        return self._drain()
+
+    def close(self) -> Iterator[RateRecord]:
+        self._parser.close()
+        return self._drain()
+
+    def _drain(self) -> Iterator[RateRecord]:
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+                    if elem.get("Date"):
+                        self.date = datetime.strptime(elem.get("Date"), "%d.%m.%Y")
+                continue
+            if elem.tag == "Valute":
+                yield self._record(elem)
+        # Разобранные записи больше не нужны - не даём дереву расти.
+        # Недочитанная запись остаётся у TreeBuilder и достраивается им
+        if self._root is not None:
+            del self._root[:]
+
+    def _record(self, elem: ET.Element) -> RateRecord:
+        code = ""
+        name = ""
+        value_str = "0"
+        nominal = 1
+        # Один проход по дочерним элементам вместо нескольких find()
+        for child in elem:
+            tag = child.tag
+            if tag == "CharCode":
+                code = child.text
+            elif tag == "Name":
+                name = child.text
+            elif tag == "Value":
+                value_str = child.text
+            elif tag == "Nominal":
+                nominal = int(child.text)
+
+        strings = self._strings
+        code = strings.setdefault(code, code)
+        name = strings.setdefault(name or code, name or code)
+        # Вычисляем курс за 1 единицу валюты
+        return RateRecord(code, name, float(value_str.replace(",", ".")) / nominal, self.date)
+
+def iter_rate_records(chunks: Iterable[bytes]) -> Iterator[RateRecord]:
+    parser = CbrXmlStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+async def aiter_rate_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[RateRecord]:
+    parser = CbrXmlStreamParser()
+    async for chunk in chunks:
+        for record in parser.feed(chunk):
+            yield record
+    for record in parser.close():
+        yield record
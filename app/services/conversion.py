@@ -0,0 +1,113 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.services.series import series_store
+from app.services.snapshot import RatesSnapshot, snapshot_store
+
+logger = logging.getLogger(__name__)
+
+class ConversionEngine:
+    """Векторная конвертация валют через матрицу кросс-курсов.
+
+    Курсы хранятся в базовой валюте (BASE_CURRENCY) за единицу валюты, поэтому кросс-курс
+    from -> to равен rate[from] / rate[to]. Матрица пересобирается один
+    раз на каждое поколение снимка snapshot_store, а пакет запросов
+    считается одной операцией над массивами индексов.
+    """
+
+    def __init__(self):
+        self.generation = -1
+        self.codes: List[str] = [settings.base_currency]
+        self.index: Dict[str, int] = {settings.base_currency: 0}
+        self.rates = np.ones(1)
+        self.matrix = np.ones((1, 1))
+
+    def refresh(self, snapshot: Optional[RatesSnapshot] = None) -> int:
+        snapshot = snapshot or snapshot_store.current
+        if snapshot.generation == self.generation:
+            return self.generation
+
+        base = settings.base_currency
+        codes = [base] + sorted(code for code in snapshot.rates if code != base)
+        rates = np.array([1.0] + [snapshot.rates[code].value for code in codes[1:]], dtype=np.float64)
+        self.codes = codes
+        self.index = {code: i for i, code in enumerate(codes)}
+        self.rates = rates
+        self.matrix = rates[:, None] / rates[None, :]
+        self.generation = snapshot.generation
+        logger.debug(f"Матрица кросс-курсов пересобрана: {len(codes)} валют, поколение {self.generation}")
+        return self.generation
+
+    def lookup(self, codes: Sequence[str]) -> np.ndarray:
+        """Индексы валют в матрице; -1 для неизвестных кодов"""
+        index = self.index
+        return np.fromiter((index.get(code, -1) for code in codes), dtype=np.int64, count=len(codes))
+
+    def cross_rates(self, from_idx: np.ndarray, to_idx: np.ndarray) -> np.ndarray:
+        known = (from_idx >= 0) & (to_idx >= 0)
+        rates = np.full(len(from_idx), np.nan)
+        rates[known] = self.matrix[from_idx[known], to_idx[known]]
+        return rates
+
+    async def historical_rates(
+        self,
+        db: AsyncSession,
+        codes: np.ndarray,
+        dates: np.ndarray
+    ) -> np.ndarray:
+        """Курс в рублях для пар (код, момент времени) по истории курсов.
+
+        Значения на нужные моменты находятся бинарным поиском в колоночной
+        истории валют series_store (сырые курсы и дневные агрегаты).
+        """
+        rates, _ = await series_store.as_of(db, codes.tolist(), dates)
+        return rates
+
+    async def convert(self, db: AsyncSession, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Конвертирует пакет элементов {from, to, amount, date} за один проход"""
+        self.refresh()
+        count = len(items)
+        from_codes = np.array([item["from"].upper() for item in items], dtype=object)
+        to_codes = np.array([item["to"].upper() for item in items], dtype=object)
+        amounts = np.fromiter((item["amount"] for item in items), dtype=np.float64, count=count)
+        dated = np.fromiter((item.get("date") is not None for item in items), dtype=bool, count=count)
+
+        rates = np.full(count, np.nan)
+        latest = ~dated
+        if latest.any():
+            rates[latest] = self.cross_rates(
+                self.lookup(from_codes[latest].tolist()),
+                self.lookup(to_codes[latest].tolist())
+            )
+        if dated.any():
+            dates = np.array([item["date"] for item in items if item.get("date") is not None], dtype="datetime64[us]")
+            codes = np.concatenate([from_codes[dated], to_codes[dated]])
+            base = await self.historical_rates(db, codes, np.concatenate([dates, dates]))
+            split = int(dated.sum())
+            rates[dated] = base[:split] / base[split:]
+
+        results = amounts * rates
+        missing = np.isnan(rates)
+        rate_list = np.where(missing, None, rates).tolist()
+        result_list = np.where(missing, None, results).tolist()
+
+        return {
+            "generation": self.generation,
+            "results": [
+                {
+                    "from": from_codes[i],
+                    "to": to_codes[i],
+                    "amount": items[i]["amount"],
+                    "rate": rate_list[i],
+                    "result": result_list[i],
+                    **({"error": "Курс не найден"} if missing[i] else {})
+                }
+                for i in range(count)
+            ]
+        }
+
+conversion_engine = ConversionEngine()
@@ -0,0 +1,194 @@
+import argparse
+import asyncio
+import logging
+import sys
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.history import iter_rate_chunks, local_time, parse_codes, stream_rates
+
+# Arrow и Parquet доступны, только если установлен pyarrow
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# Формат -> (media type, расширение файла)
+FORMATS: Dict[str, Tuple[str, str]] = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "ndjson.gz": ("application/gzip", "ndjson.gz"),
+    "csv.gz": ("application/gzip", "csv.gz"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+COLUMNAR_FORMATS = ("arrow", "parquet")
+
+def available_formats() -> List[str]:
+    if pyarrow is None:
+        return [fmt for fmt in FORMATS if fmt not in COLUMNAR_FORMATS]
+    return list(FORMATS)
+
+def check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    if fmt not in available_formats():
+        raise ValueError(f"Формат {fmt} требует пакет pyarrow")
+
+class _ChunkSink:
+    """Файл для писателей pyarrow, байты которого забираются по мере записи.
+
+    Позиция считается от начала потока: Parquet записывает в футер
+    абсолютные смещения групп строк.
+    """
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def _schema():
+    return pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("currency_id", pyarrow.int32()),
+        ("code", pyarrow.string()),
+        ("value", pyarrow.float64()),
+        ("date", pyarrow.timestamp("us")),
+        ("resolution", pyarrow.string())
+    ])
+
+def _record_batch(rows, schema):
+    return pyarrow.record_batch([
+        pyarrow.array([row.id for row in rows], pyarrow.int64()),
+        pyarrow.array([row.currency_id for row in rows], pyarrow.int32()),
+        pyarrow.array([row.code for row in rows], pyarrow.string()),
+        pyarrow.array([row.value for row in rows], pyarrow.float64()),
+        pyarrow.array([row.date for row in rows], pyarrow.timestamp("us")),
+        pyarrow.array([row.resolution for row in rows], pyarrow.string())
+    ], schema=schema)
+
+async def _columnar(fmt: str, chunks: AsyncIterator) -> AsyncIterator[bytes]:
+    schema = _schema()
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode="w"), schema, compression="zstd")
+    else:
+        writer = pyarrow.ipc.new_stream(
+            pyarrow.PythonFile(sink, mode="w"), schema,
+            options=pyarrow.ipc.IpcWriteOptions(compression="zstd")
+        )
+    try:
+        async for rows in chunks:
+            # Для Parquet каждая пачка - отдельная группа строк
+            writer.write_batch(_record_batch(rows, schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+async def _gzip(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for text in chunks:
+        data = compressor.compress(text.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+async def _encode(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    async for text in chunks:
+        yield text.encode()
+
+def export_rates(
+    fmt: str,
+    codes: Optional[List[str]] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    chunk_rows: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Потоковая выгрузка истории курсов (сырые курсы и дневные агрегаты).
+
+    Строки читаются серверным курсором пачками по export_chunk_rows и
+    сразу кодируются, поэтому память не растёт с размером истории.
+    """
+    check_format(fmt)
+    chunk_rows = chunk_rows or settings.export_chunk_rows
+    if fmt in COLUMNAR_FORMATS:
+        return _columnar(fmt, iter_rate_chunks(codes, date_from, date_to, chunk_rows))
+    text = stream_rates(fmt.split(".")[0], codes, date_from, date_to, chunk_rows)
+    return _gzip(text) if fmt.endswith(".gz") else _encode(text)
+
+def export_filename(fmt: str) -> str:
+    return f"rates-{datetime.now():%Y%m%d-%H%M%S}.{FORMATS[fmt][1]}"
+
+async def _main(args):
+    from app.db.database import read_engine
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    written = 0
+    try:
+        async for data in export_rates(
+            args.format,
+            parse_codes([args.code] if args.code else None),
+            local_time(datetime.fromisoformat(args.date_from)) if args.date_from else None,
+            local_time(datetime.fromisoformat(args.date_to)) if args.date_to else None,
+            args.chunk_rows
+        ):
+            output.write(data)
+            written += len(data)
+    finally:
+        if args.output:
+            output.close()
+        await read_engine.dispose()
+    logger.info(f"Выгрузка {args.format}: {written} байт")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка истории курсов")
+    parser.add_argument("--format", default="csv.gz", choices=list(FORMATS))
+    parser.add_argument("--code", default=None, help="Коды валют через запятую")
+    parser.add_argument("--from", dest="date_from", default=None, help="Начало периода, ISO 8601")
+    parser.add_argument("--to", dest="date_to", default=None, help="Конец периода, ISO 8601")
+    parser.add_argument("--chunk-rows", type=int, default=None)
+    parser.add_argument("--output", "-o", default=None, help="Файл; по умолчанию stdout")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    try:
+        check_format(args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    asyncio.run(_main(args))
@@ -0,0 +1,210 @@
+import base64
+import csv
+import io
+import json
+import warnings
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import Select, and_, literal, or_, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import ReadSessionLocal
+from app.db.models import Currency, CurrencyRate, DailyRate
+
+STREAM_CHUNK_ROWS = 1000
+
+def encode_cursor(date: datetime, rate_id: int) -> str:
+    raw = f"{date.isoformat()}|{rate_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date_str, rate_id = raw.split("|")
+        return datetime.fromisoformat(date_str), int(rate_id)
+    except Exception:
+        raise ValueError("Некорректный курсор")
+
+def parse_codes(codes: Optional[List[str]]) -> Optional[List[str]]:
+    """Поддерживает как ?code=USD&code=EUR, так и ?code=USD,EUR"""
+    if not codes:
+        return None
+    return [code.strip().upper() for value in codes for code in value.split(",") if code.strip()]
+
+def local_time(moment: datetime) -> datetime:
+    """История хранится в локальном времени без часового пояса"""
+    return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+
+def parse_moments(values: List[str]) -> np.ndarray:
+    """ISO 8601 моменты в datetime64[us] локального времени.
+
+    Строки без часового пояса разбирает сам numpy - на порядок быстрее,
+    чем массив из datetime. Если хоть у одной строки есть смещение,
+    все идут через datetime.fromisoformat и local_time: numpy переводит
+    такие строки в UTC (в зависимости от версии даже без предупреждения).
+    NaT и пустые строки отклоняются.
+    """
+    joined = "".join(values)
+    # Без пояса в строке нет "+", "Z" и лишних дефисов сверх двух в дате
+    if not ("+" in joined or "Z" in joined or "z" in joined or joined.count("-") > 2 * len(values)):
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")
+                moments = np.array(values, dtype="datetime64[us]")
+        except (ValueError, UserWarning) as e:
+            raise ValueError(f"Некорректный момент времени: {e}")
+        if np.isnat(moments).any():
+            raise ValueError(f"Некорректный момент времени: {values[int(np.isnat(moments).argmax())]!r}")
+        return moments
+    try:
+        moments = [local_time(datetime.fromisoformat(value)) for value in values]
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Некорректный момент времени: {e}")
+    return np.array(moments, dtype="datetime64[us]")
+
+def rate_point_selects(
+    currency_ids=None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    with_code: bool = False
+) -> List[Select]:
+    """Выборки сырых курсов и дневных агрегатов с одинаковыми колонками
+    (id, currency_id, value, date, resolution[, code]) для UNION ALL.
+
+    Дни старше окна хранения лежат в daily_rates: такой день представлен
+    курсом закрытия на момент последнего наблюдения, а id = -currency_id,
+    чтобы пара (date, id) оставалась уникальной для keyset-пагинации.
+    Фильтры применяются к каждой части, поэтому сырые курсы выбираются
+    по индексам (currency_id, date) или (date), агрегаты - по своим.
+    Границы с часовым поясом переводятся в локальное время (local_time).
+    """
+    raw = select(
+        CurrencyRate.id, CurrencyRate.currency_id, CurrencyRate.value, CurrencyRate.date,
+        literal("raw").label("resolution")
+    )
+    daily = select(
+        (-DailyRate.currency_id).label("id"), DailyRate.currency_id, DailyRate.close.label("value"),
+        DailyRate.last_at.label("date"), literal("day").label("resolution")
+    )
+    parts = []
+    for query, id_column, currency_column, date_column in (
+        (raw, CurrencyRate.id, CurrencyRate.currency_id, CurrencyRate.date),
+        (daily, -DailyRate.currency_id, DailyRate.currency_id, DailyRate.last_at)
+    ):
+        if with_code:
+            query = query.add_columns(Currency.code).join(Currency, Currency.id == currency_column)
+        if currency_ids is not None:
+            query = query.where(currency_column.in_(currency_ids))
+        if date_from is not None:
+            query = query.where(date_column >= local_time(date_from))
+        if date_to is not None:
+            query = query.where(date_column <= local_time(date_to))
+        if after is not None:
+            after_date, after_id = after
+            query = query.where(or_(
+                date_column > after_date,
+                and_(date_column == after_date, id_column > after_id)
+            ))
+        parts.append(query)
+    return parts
+
+def rate_points(
+    currency_ids=None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
+    """Сырые курсы и дневные агрегаты одним подзапросом"""
+    return union_all(*rate_point_selects(currency_ids, date_from, date_to)).subquery("rate_points")
+
+def rates_query(
+    codes: Optional[List[str]] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, int]] = None
+):
+    """Запрос истории курсов, упорядоченный по (date, id) для keyset-пагинации.
+
+    Фильтр по валютам переводится в currency_id IN (...), чтобы выборка
+    шла по составному индексу (currency_id, date). Сортировка стоит на
+    самом UNION ALL: SQLite сливает уже упорядоченные по индексам части,
+    не материализуя всю историю во временной таблице.
+    """
+    currency_ids = select(Currency.id).where(Currency.code.in_(codes)) if codes else None
+    query = union_all(*rate_point_selects(currency_ids, date_from, date_to, after, with_code=True))
+    return query.order_by(query.selected_columns.date, query.selected_columns.id)
+
+def row_to_dict(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "currency_id": row.currency_id,
+        "code": row.code,
+        "value": row.value,
+        "date": row.date.isoformat(),
+        "resolution": row.resolution
+    }
+
+async def get_rates_page(
+    db: AsyncSession,
+    codes: Optional[List[str]] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100
+) -> Dict[str, Any]:
+    query = rates_query(codes, date_from, date_to, decode_cursor(cursor) if cursor else None)
+
+    # Запрашиваем на одну строку больше, чтобы понять, есть ли следующая страница
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+
+    return {"items": [row_to_dict(row) for row in rows], "next_cursor": next_cursor}
+
+async def iter_rate_chunks(
+    codes: Optional[List[str]] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    chunk_rows: int = STREAM_CHUNK_ROWS
+) -> AsyncIterator[List[Any]]:
+    """Строки истории курсов пачками по chunk_rows через серверный курсор.
+
+    Сессия открывается внутри генератора: зависимость get_read_db закрывается
+    раньше, чем StreamingResponse дочитает ответ.
+    """
+    query = rates_query(codes, date_from, date_to).execution_options(yield_per=chunk_rows)
+
+    async with ReadSessionLocal() as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+async def stream_rates(
+    fmt: str,
+    codes: Optional[List[str]] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    chunk_rows: int = STREAM_CHUNK_ROWS
+) -> AsyncIterator[str]:
+    """Отдаёт историю курсов кусками NDJSON/CSV, не загружая её целиком"""
+    chunks = iter_rate_chunks(codes, date_from, date_to, chunk_rows)
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["id", "currency_id", "code", "value", "date", "resolution"])
+        async for rows in chunks:
+            for row in rows:
+                writer.writerow([row.id, row.currency_id, row.code, row.value, row.date.isoformat(), row.resolution])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        async for rows in chunks:
+            yield "".join(json.dumps(row_to_dict(row)) + "\n" for row in rows)
@@ -1,95 +1,179 @@
-import httpx
-import xml.etree.ElementTree as ET
-from datetime import datetime
+from datetime import date, datetime
 import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
+from app.config import settings
 from app.db.models import Currency, CurrencyRate
+from app.db.writer import db_writer
+from app.services.anomaly import anomaly_detector
+from app.services.cbr_xml import RateRecord
+from app.services.metrics import parser_phase_duration
+from app.services.providers import commit_state, provider_runner
+from app.services.response_cache import data_generation
+from app.services.series import series_store
+from app.services.snapshot import LatestRate, snapshot_store
 
 logger = logging.getLogger(__name__)
 
+def as_datetime(value: date) -> datetime:
+    """Дата курса из источника (date у backfill) как datetime для currency_rates"""
+    return value if isinstance(value, datetime) else datetime.combine(value, datetime.min.time())
+
 class CurrencyParser:
     def __init__(self, db: AsyncSession):
         self.db = db
-        self.cbr_url = "http://www.cbr.ru/scripts/XML_daily.asp"
+        self._pending_states: Dict[str, Dict[str, Optional[str]]] = {}
+        # Длительность этапов последнего fetch_rates, секунды
+        self.timings: Dict[str, float] = {}
         
-    async def fetch_rates(self):
-        """Получает курсы валют с сайта ЦБ РФ"""
+    async def fetch_rates(self, force: bool = False) -> Optional[List[RateRecord]]:
+        """Получает курсы валют из источников RATE_PROVIDERS (по умолчанию ЦБ РФ).
+
+        Источники опрашиваются параллельно условным GET (If-None-Match /
+        If-Modified-Since) через общий пул соединений, их курсы переводятся
+        в рубли и объединяются по приоритету (app.services.providers).
+        Если ни один источник не прислал новых курсов (304 или то же тело),
+        возвращает None - разбор, запись в БД и уведомления не нужны.
+
+        Временные ошибки повторяются с джиттером в пределах deadline
+        источника, после серии ошибок предохранитель источника отказывает
+        сразу. Если не ответил ни один источник, поднимается UpstreamError.
+        """
+        self.timings = {}
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                # Получаем XML с курсами на сегодня
-                response = await client.get(self.cbr_url)
-                response.raise_for_status()
-                
-                # Парсим XML
-                root = ET.fromstring(response.text)
-                rates = []
-                
-                for valute in root.findall('Valute'):
-                    code = valute.find('CharCode').text
-                    name = valute.find('Name').text
-                    value_str = valute.find('Value').text.replace(',', '.')
-                    nominal = int(valute.find('Nominal').text)
-                    
-                    # Вычисляем курс за 1 единицу валюты
-                    value = float(value_str) / nominal
-                    
-                    rates.append({
-                        "code": code,
-                        "name": name,
-                        "rate": value
-                    })
-                    
-                logger.info(f"Получено {len(rates)} курсов валют с ЦБ РФ")
-                return rates
-                
-        except httpx.TimeoutException:
-            logger.error("Таймаут при подключении к ЦБ РФ")
-            raise Exception("Не удалось подключиться к серверу ЦБ РФ (таймаут)")
-        except httpx.RequestError as e:
-            logger.error(f"Ошибка сети при подключении к ЦБ РФ: {e}")
-            raise Exception(f"Ошибка сети: {e}")
-        except ET.ParseError as e:
-            logger.error(f"Ошибка парсинга XML от ЦБ РФ: {e}")
-            raise Exception("Некорректный ответ от сервера ЦБ РФ")
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка при получении курсов: {e}")
-            raise Exception(f"Ошибка при получении данных: {e}")
+            result = await provider_runner.fetch(force)
+        finally:
+            self.timings = dict(provider_runner.last_timings)
+        if result.rates is None:
+            return None
+        # Валидаторы запоминаются только после успешного сохранения
+        self._pending_states = result.pending_states
+        return result.rates
     
     async def save_rates(self, rates):
         """Сохраняет курсы валют в базу данных"""
+        result = await self.save_rates_bulk(rates, only_changed=settings.delta_ingest)
+        return result["saved"]
+
+    async def save_rates_bulk(
+        self,
+        rates: List[RateRecord],
+        source_dates: bool = False,
+        only_changed: bool = False,
+        attach: Iterable[Any] = ()
+    ) -> Dict[str, Any]:
+        """Пакетно сохраняет курсы валют одной транзакцией.
+
+        Запись выполняется операцией db_writer: карта код -> id загружается
+        одним запросом, недостающие валюты добавляются одним multi-row
+        upsert, а все курсы пишутся одним executemany. ORM-объекты из
+        attach (например, чекпоинты backfill) добавляются в ту же
+        транзакцию. Курсы датируются текущим временем, а при
+        source_dates=True - датой из самой записи.
+
+        Последние известные значения берутся из снимка snapshot_store,
+        который обновляется после коммита. При only_changed=True
+        сохраняются только курсы, отличающиеся от последнего известного
+        значения валюты; их список со старым и новым
+        значением возвращается в "changes". Также возвращает количество
+        новых (inserted) и уже существовавших (updated) валют, получивших курс,
+        и аномальные изменения из anomaly_detector ("alerts"); рассылка
+        аномалий - забота вызывающего (publish_alerts).
+        """
         if not rates:
             raise ValueError("Нет данных для сохранения")
-            
-        saved_count = 0
-        
-        for rate_data in rates:
-            # Ищем валюту по коду
-            result = await self.db.execute(
-                select(Currency).where(Currency.code == rate_data["code"])
-            )
-            currency = result.scalar_one_or_none()
-            
-            # Если валюты нет - создаём
-            if not currency:
-                currency = Currency(
-                    code=rate_data["code"],
-                    name=rate_data["name"]
+
+        started = time.perf_counter()
+        # Исторические курсы (source_dates) не сдвигают последнее известное значение
+        last_rates = None
+        if not source_dates:
+            snapshot = await snapshot_store.ensure_seeded(self.db)
+            last_rates = {code: rate.value for code, rate in snapshot.rates.items()}
+        now = datetime.now()
+
+        async def write(db: AsyncSession):
+            result = await db.execute(select(Currency.code, Currency.id))
+            currency_ids = {code: currency_id for code, currency_id in result.all()}
+
+            selected = rates
+            if only_changed and last_rates is not None:
+                selected = [
+                    rate for rate in rates
+                    if rate.code not in currency_ids or last_rates.get(rate.code) != rate.rate
+                ]
+
+            missing = {}
+            for rate in selected:
+                if rate.code not in currency_ids:
+                    missing.setdefault(rate.code, rate.name)
+
+            if missing:
+                await db.execute(
+                    sqlite_insert(Currency)
+                    .values([{"code": code, "name": name} for code, name in missing.items()])
+                    .on_conflict_do_nothing(index_elements=["code"])
                 )
-                self.db.add(currency)
-                await self.db.commit()
-                await self.db.refresh(currency)
-            
-            # Создаём запись о курсе
-            currency_rate = CurrencyRate(
-                currency_id=currency.id,
-                value=rate_data["rate"],
-                date=datetime.now()
-            )
-            self.db.add(currency_rate)
-            saved_count += 1
-        
-        await self.db.commit()
-        logger.info(f"Сохранено {saved_count} курсов валют")
-        return saved_count
+                result = await db.execute(
+                    select(Currency.code, Currency.id).where(Currency.code.in_(missing))
+                )
+                currency_ids.update(result.all())
+
+            rows = [
+                {
+                    "currency_id": currency_ids[rate.code],
+                    "value": rate.rate,
+                    "date": as_datetime(rate.date) if source_dates and rate.date else now
+                }
+                for rate in selected
+            ]
+            alerts = []
+            if rows:
+                if settings.anomaly_enabled:
+                    # Доигрывание от чекпоинта - до вставки, иначе оно поглотит эту пачку вместе с её аномалиями
+                    await anomaly_detector.ensure_loaded(db)
+                await db.execute(insert(CurrencyRate), rows)
+                if settings.anomaly_enabled:
+                    alerts = await anomaly_detector.observe(db, [
+                        (row["currency_id"], rate.code, row["value"], row["date"])
+                        for rate, row in zip(selected, rows)
+                    ])
+            db.add_all(attach)
+            await db.flush()
+            return selected, rows, missing, alerts
+
+        try:
+            rates, rows, missing, alerts = await db_writer.submit(write)
+        except Exception:
+            # Статистика в памяти могла уйти вперёд откатившейся транзакции
+            anomaly_detector.invalidate()
+            raise
+        series_store.extend(rows)
+        anomaly_detector.record(alerts)
+        await anomaly_detector.checkpoint()
+        if rows:
+            data_generation.bump("rates")
+        if missing:
+            data_generation.bump("currencies")
+
+        if self._pending_states:
+            commit_state(self._pending_states)
+            self._pending_states = {}
+
+        changes = []
+        if last_rates is not None:
+            for rate in rates:
+                if last_rates.get(rate.code) != rate.rate:
+                    changes.append({"code": rate.code, "old": last_rates.get(rate.code), "new": rate.rate})
+            # Новый снимок последних курсов публикуется только после коммита
+            if rates:
+                snapshot_store.publish(LatestRate(rate.code, rate.name, rate.rate, now) for rate in rates)
+
+        inserted = sum(1 for rate in rates if rate.code in missing)
+        updated = len(rows) - inserted
+        logger.info(f"Сохранено {len(rows)} курсов валют (новых валют: {inserted}, обновлено: {updated})")
+        parser_phase_duration.observe(time.perf_counter() - started, phase="save")
+        return {"inserted": inserted, "updated": updated, "saved": len(rows), "changes": changes, "alerts": alerts}
@@ -0,0 +1,111 @@
+import logging
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SamplingProfiler:
+    """Семплирующий профилировщик, включаемый во время работы.
+
+    Фоновый поток раз в interval секунд снимает стек потока event loop
+    (sys._current_frames) и считает одинаковые стеки. Пока профилировщик
+    выключен, накладных расходов нет. Результат - самые частые стеки и
+    функции, а также collapsed-формат для flamegraph.pl / speedscope.
+    Счётчики стеков меняются под _lock, читатели работают с копией.
+    """
+
+    def __init__(self, max_depth: int = 64):
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.interval = 0.01
+        self.started_at: Optional[datetime] = None
+        self.stopped_at: Optional[datetime] = None
+        self._target: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01, thread_id: Optional[int] = None):
+        """Начинает новый сеанс; по умолчанию профилируется вызывающий поток"""
+        if self.running:
+            raise RuntimeError("Профилировщик уже запущен")
+        self.interval = interval
+        with self._lock:
+            self.stacks = Counter()
+            self.samples = 0
+        self.started_at = datetime.now()
+        self.stopped_at = None
+        self._target = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Профилировщик запущен, интервал {interval} с")
+
+    def stop(self):
+        """Ждёт поток до одного интервала - из async-кода вызывать через asyncio.to_thread"""
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.stopped_at = datetime.now()
+        logger.info(f"Профилировщик остановлен, семплов: {self.samples}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            with self._lock:
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def snapshot(self) -> Tuple[Counter, int]:
+        """Копия счётчиков: поток семплирования продолжает писать в свои"""
+        with self._lock:
+            return Counter(self.stacks), self.samples
+
+    def collapsed(self) -> str:
+        stacks, _ = self.snapshot()
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+
+    def report(self, limit: int = 20) -> Dict[str, Any]:
+        stacks, samples = self.snapshot()
+        # Собственное время - последний кадр стека, общее - любое вхождение
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+
+        def top(counter: Counter) -> List[Dict[str, Any]]:
+            return [
+                {"function": function, "samples": count, "ratio": round(count / samples, 4)}
+                for function, count in counter.most_common(limit)
+            ]
+
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": samples,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "stopped_at": self.stopped_at.isoformat() if self.stopped_at else None,
+            "top_self": top(own) if samples else [],
+            "top_total": top(total) if samples else []
+        }
+
+profiler = SamplingProfiler()
@@ -0,0 +1,505 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+from app.services.cbr_xml import CbrXmlStreamParser, RateRecord, iter_rate_records
+from app.services.http_client import close_http_client, get_http_client
+from app.services.metrics import parser_phase_duration, registry
+from app.services.resilience import CircuitOpenError, UpstreamError, call_with_retries, get_breaker, is_retryable
+from app.services.snapshot import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+provider_fetch_duration = registry.histogram(
+    "provider_fetch_duration_seconds", "Получение и разбор курсов одного источника", ("provider", "status")
+)
+
+# Валидаторы последнего сохранённого ответа по URL: ETag, Last-Modified и хэш тела
+_conditional_state: Dict[str, Dict[str, Optional[str]]] = {}
+
+# Любой сбой разбора - ошибка только этого источника, остальные участвуют в объединении
+PARSE_ERRORS = (ET.ParseError, ValueError, KeyError, TypeError, IndexError, AttributeError, ArithmeticError)
+
+class ProviderQuote(NamedTuple):
+    """Курсы одного источника: rates[code] = (название, сколько единиц base стоит 1 единица code)"""
+    provider: str
+    base: str
+    date: Optional[datetime]
+    rates: Dict[str, Tuple[str, float]]
+
+class ResponseParser:
+    """Разбор тела ответа по мере получения кусков.
+
+    Базовая реализация копит куски и разбирает их в close() через
+    provider.parse() - для небольших ответов ЕЦБ и JSON этого достаточно.
+    """
+
+    def __init__(self, provider: "RateProvider"):
+        self.provider = provider
+        self.chunks: List[bytes] = []
+
+    def feed(self, chunk: bytes):
+        self.chunks.append(chunk)
+
+    def close(self) -> ProviderQuote:
+        return self.provider.parse(self.chunks)
+
+class RateProvider:
+    """Источник курсов валют.
+
+    Подкласс задаёт name, title и parse() (или parser() для разбора по мере
+    получения). Базовый класс выполняет условный GET через общий пул
+    соединений с повторами и предохранителем (app.services.resilience)
+    в пределах собственного deadline источника. Тело ответа хэшируется
+    и разбирается в одном проходе по потоку.
+    """
+
+    name = ""
+    title = ""
+
+    def __init__(self, url: str, deadline: Optional[float] = None):
+        self.url = url
+        self.deadline = deadline or settings.upstream_deadline
+
+    def parse(self, chunks: List[bytes]) -> ProviderQuote:
+        raise NotImplementedError
+
+    def parser(self) -> ResponseParser:
+        return ResponseParser(self)
+
+    async def fetch(self, force: bool = False) -> Tuple[Optional[ProviderQuote], Optional[Dict[str, Optional[str]]], float]:
+        """Возвращает (курсы, валидаторы ответа, время разбора).
+
+        Курсы равны None, если сервер ответил 304 или тело совпало с последним
+        сохранённым. Валидаторы запоминаются (commit_state) только после
+        успешного сохранения курсов. Ошибки поднимаются как UpstreamError.
+        """
+        state = _conditional_state.get(self.url, {})
+        headers = {}
+        if not force:
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
+
+        client = get_http_client()
+
+        async def attempt(timeout: float):
+            content_hash = hashlib.sha256()
+            parser = self.parser()
+            parse_time = 0.0
+            error = None
+            async with client.stream("GET", self.url, headers=headers, timeout=timeout) as response:
+                if response.status_code == 304:
+                    return response, None, None, 0.0, None
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    content_hash.update(chunk)
+                    if error is not None:
+                        continue
+                    started = time.perf_counter()
+                    try:
+                        parser.feed(chunk)
+                    except PARSE_ERRORS as e:
+                        # Тело дочитывается ради хэша, ошибка разбора - после сравнения снимков
+                        error = e
+                    parse_time += time.perf_counter() - started
+            return response, content_hash.hexdigest(), parser, parse_time, error
+
+        try:
+            response, content_hash, parser, parse_time, error = await call_with_retries(attempt, get_breaker(self.url), deadline=self.deadline)
+        except CircuitOpenError as e:
+            logger.warning(str(e))
+            raise
+        except httpx.TimeoutException:
+            logger.error(f"Таймаут при подключении к {self.title}")
+            raise UpstreamError(f"Не удалось подключиться к серверу {self.title} (таймаут)")
+        except httpx.HTTPStatusError as e:
+            logger.error(f"{self.title} ответил {e.response.status_code}")
+            raise UpstreamError(f"Сервер {self.title} ответил {e.response.status_code}", retryable=is_retryable(e))
+        except httpx.RequestError as e:
+            logger.error(f"Ошибка сети при подключении к {self.title}: {e}")
+            raise UpstreamError(f"Ошибка сети ({self.title}): {e}")
+
+        if content_hash is None:
+            logger.info(f"Курсы {self.title} не изменились (304)")
+            return None, None, 0.0
+
+        pending_state = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": content_hash
+        }
+        if not force and content_hash == state.get("content_hash"):
+            # Разобранные по ходу чтения курсы отбрасываются
+            logger.info(f"Курсы {self.title} не изменились (тот же снимок)")
+            return None, None, 0.0
+
+        started = time.perf_counter()
+        try:
+            if error is not None:
+                raise error
+            quote = parser.close()
+        except PARSE_ERRORS as e:
+            logger.error(f"Ошибка разбора ответа {self.title}: {e}")
+            raise UpstreamError(f"Некорректный ответ от сервера {self.title}", retryable=False)
+        if not quote.rates:
+            raise UpstreamError(f"В ответе {self.title} нет курсов", retryable=False)
+        return quote, pending_state, parse_time + time.perf_counter() - started
+
+class CbrProvider(RateProvider):
+    """XML_daily ЦБ РФ: рубли за единицу валюты с учётом номинала"""
+
+    name = "cbr"
+    title = "ЦБ РФ"
+
+    def parse(self, chunks: List[bytes]) -> ProviderQuote:
+        return self.quote(list(iter_rate_records(chunks)))
+
+    def parser(self) -> ResponseParser:
+        return CbrResponseParser(self)
+
+    def quote(self, records: List[RateRecord]) -> ProviderQuote:
+        date = records[0].date if records else None
+        return ProviderQuote(self.name, "RUB", date, {record.code: (record.name, record.rate) for record in records})
+
+class CbrResponseParser(ResponseParser):
+    """XML_daily разбирается CbrXmlStreamParser прямо из потока, тело не копится"""
+
+    def __init__(self, provider: CbrProvider):
+        super().__init__(provider)
+        self.stream = CbrXmlStreamParser()
+        self.records: List[RateRecord] = []
+
+    def feed(self, chunk: bytes):
+        self.records.extend(self.stream.feed(chunk))
+
+    def close(self) -> ProviderQuote:
+        self.records.extend(self.stream.close())
+        return self.provider.quote(self.records)
+
+ECB_NS = "{http://www.ecb.int/vocabulary/2002-08-01/eurofxref}"
+
+class EcbProvider(RateProvider):
+    """eurofxref-daily.xml ЕЦБ: единиц валюты за 1 евро"""
+
+    name = "ecb"
+    title = "ЕЦБ"
+
+    def parse(self, chunks: List[bytes]) -> ProviderQuote:
+        root = ET.fromstring(b"".join(chunks))
+        date = None
+        rates = {}
+        for cube in root.iter(f"{ECB_NS}Cube"):
+            if cube.get("time"):
+                date = datetime.strptime(cube.get("time"), "%Y-%m-%d")
+            elif cube.get("currency"):
+                # Переводим в евро за 1 единицу валюты
+                rates[cube.get("currency")] = (cube.get("currency"), 1 / float(cube.get("rate")))
+        return ProviderQuote(self.name, "EUR", date, rates)
+
+class JsonProvider(RateProvider):
+    """JSON {"base": "USD", "date": "2024-01-05", "rates": {"EUR": 0.91}}: единиц валюты за 1 base"""
+
+    name = "json"
+    title = "JSON-источника"
+
+    def parse(self, chunks: List[bytes]) -> ProviderQuote:
+        document = json.loads(b"".join(chunks))
+        date = datetime.fromisoformat(document["date"]) if document.get("date") else None
+        names = document.get("names") or {}
+        rates = {
+            code.upper(): (names.get(code, code.upper()), 1 / float(value))
+            for code, value in document["rates"].items()
+            if float(value) > 0
+        }
+        return ProviderQuote(self.name, document["base"].upper(), date, rates)
+
+PROVIDERS = {provider.name: provider for provider in (CbrProvider, EcbProvider, JsonProvider)}
+
+def build_providers() -> List[RateProvider]:
+    """Источники из RATE_PROVIDERS в порядке приоритета"""
+    urls = {"cbr": settings.cbr_url, "ecb": settings.ecb_url, "json": settings.json_rates_url}
+    providers = []
+    for name in (name.strip().lower() for name in settings.rate_providers.split(",")):
+        if not name:
+            continue
+        if name not in PROVIDERS:
+            raise ValueError(f"Неизвестный источник курсов: {name}")
+        if not urls[name]:
+            logger.warning(f"Источник {name} пропущен: не задан URL")
+            continue
+        providers.append(PROVIDERS[name](urls[name], settings.provider_deadlines.get(name)))
+    if not providers:
+        raise ValueError("Не настроен ни один источник курсов (RATE_PROVIDERS)")
+    return providers
+
+def cross_rate(quote: ProviderQuote, base: str, anchors: Dict[str, float]) -> Optional[float]:
+    """Сколько единиц base стоит 1 единица базовой валюты источника"""
+    if quote.base == base:
+        return 1.0
+    if base in quote.rates:
+        return 1 / quote.rates[base][1]
+    return anchors.get(quote.base)
+
+def normalize(quotes: List[ProviderQuote], base: str, anchors: Dict[str, float]) -> Dict[str, Dict[str, Tuple[str, float]]]:
+    """Переводит курсы источников в base за 1 единицу валюты.
+
+    Источники в другой базе пересчитываются через кросс-курс: курс base
+    в самом ответе, курс их базовой валюты от источника в base из этого
+    же запуска или, в последнюю очередь, из снимка последних курсов
+    (anchors). Источник без кросс-курса пропускается.
+    """
+    anchors = dict(anchors)
+    fresh = set()
+    normalized: Dict[str, Dict[str, Tuple[str, float]]] = {}
+    # Сначала источники, пересчитываемые без кросс-курсов: они дают кросс-курсы остальным
+    for quote in sorted(quotes, key=lambda quote: (quote.base != base, base not in quote.rates)):
+        factor = cross_rate(quote, base, anchors)
+        if factor is None:
+            logger.warning(f"Курсы {quote.provider} пропущены: нет курса {quote.base} в {base}")
+            continue
+        rates = {code: (name, value * factor) for code, (name, value) in quote.rates.items() if code != base}
+        if quote.base != base:
+            rates.setdefault(quote.base, (quote.base, factor))
+        normalized[quote.provider] = rates
+        for code, (_, value) in rates.items():
+            if code not in fresh:
+                anchors[code] = value
+                fresh.add(code)
+    return normalized
+
+def merge(normalized: Dict[str, Dict[str, Tuple[str, float]]], priority: List[str], dates: Dict[str, Optional[datetime]]):
+    """Объединяет курсы: для каждой валюты берётся источник с наибольшим приоритетом.
+
+    Название валюты берётся у первого источника, который его знает
+    (ECB и JSON обычно отдают вместо названия код).
+    """
+    merged: Dict[str, RateRecord] = {}
+    names: Dict[str, str] = {}
+    contributed = {name: 0 for name in normalized}
+    for provider in priority:
+        for code, (name, value) in normalized.get(provider, {}).items():
+            if name != code:
+                names.setdefault(code, name)
+            if code not in merged:
+                merged[code] = RateRecord(code, name, value, dates.get(provider))
+                contributed[provider] += 1
+    records = [record._replace(name=names.get(code, record.name)) for code, record in merged.items()]
+    return records, contributed
+
+class ProviderState:
+    """Задержка, свежесть и последний результат одного источника"""
+
+    __slots__ = (
+        "name", "url", "priority", "status", "latency", "checked_at", "failed_at", "error",
+        "quote", "fetched_at", "merged", "requests_total", "failures_total"
+    )
+
+    def __init__(self, name: str):
+        self.name = name
+        self.url: Optional[str] = None
+        self.priority = 0
+        self.status = "idle"
+        self.latency: Optional[float] = None
+        # Последнее успешное обращение (в том числе 304)
+        self.checked_at: Optional[datetime] = None
+        self.failed_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        # Последние полученные курсы и когда они получены
+        self.quote: Optional[ProviderQuote] = None
+        self.fetched_at: Optional[datetime] = None
+        self.merged = 0
+        self.requests_total = 0
+        self.failures_total = 0
+
+    def usable_quote(self) -> Optional[ProviderQuote]:
+        """Прошлые курсы источника, пока они не старше rates_stale_after"""
+        if self.quote is None or self.checked_at is None:
+            return None
+        if (datetime.now() - self.checked_at).total_seconds() > settings.rates_stale_after:
+            return None
+        return self.quote
+
+    def as_dict(self) -> Dict[str, Any]:
+        age = (datetime.now() - self.checked_at).total_seconds() if self.checked_at else None
+        return {
+            "priority": self.priority,
+            "url": self.url,
+            "status": self.status,
+            "latency": round(self.latency, 6) if self.latency is not None else None,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "stale": self.error is not None or age is None or age > settings.rates_stale_after,
+            "source_date": self.quote.date.date().isoformat() if self.quote and self.quote.date else None,
+            "base": self.quote.base if self.quote else None,
+            "rates": len(self.quote.rates) if self.quote else 0,
+            "merged": self.merged,
+            "error": self.error,
+            "failed_at": self.failed_at.isoformat() if self.failed_at else None,
+            "requests_total": self.requests_total,
+            "failures_total": self.failures_total
+        }
+
+class FetchResult(NamedTuple):
+    # None - ни один источник не прислал новых курсов
+    rates: Optional[List[RateRecord]]
+    pending_states: Dict[str, Dict[str, Optional[str]]]
+    timings: Dict[str, float]
+
+class ProviderRunner:
+    """Опрашивает все источники RATE_PROVIDERS параллельно и объединяет их курсы.
+
+    Каждый источник ограничен своим deadline (PROVIDER_DEADLINES, по
+    умолчанию UPSTREAM_DEADLINE) и предохранителем, поэтому медленный
+    или недоступный источник не задерживает остальные. Курсы переводятся
+    в BASE_CURRENCY и объединяются по приоритету. Источник, ответивший
+    304 или временно недоступный, участвует в объединении прошлыми курсами,
+    пока они не устарели. Ошибка поднимается, только если не ответил ни
+    один источник.
+    """
+
+    def __init__(self):
+        self.states: Dict[str, ProviderState] = {}
+        # Длительность этапов последнего fetch, секунды
+        self.last_timings: Dict[str, float] = {}
+
+    def state(self, name: str) -> ProviderState:
+        state = self.states.get(name)
+        if state is None:
+            state = self.states[name] = ProviderState(name)
+        return state
+
+    async def _fetch_one(self, provider: RateProvider, force: bool):
+        state = self.state(provider.name)
+        state.url = provider.url
+        state.requests_total += 1
+        started = time.perf_counter()
+        try:
+            quote, pending_state, parse_time = await provider.fetch(force)
+        except UpstreamError as e:
+            state.latency = time.perf_counter() - started
+            state.status = "failed"
+            state.error = str(e)
+            state.failed_at = datetime.now()
+            state.failures_total += 1
+            provider_fetch_duration.observe(state.latency, provider=provider.name, status="failed")
+            raise
+        state.latency = time.perf_counter() - started
+        state.status = "unchanged" if quote is None else "ok"
+        state.error = None
+        state.checked_at = datetime.now()
+        if quote is not None:
+            state.quote = quote
+            state.fetched_at = state.checked_at
+        provider_fetch_duration.observe(state.latency, provider=provider.name, status=state.status)
+        return quote, pending_state, parse_time
+
+    async def fetch(self, force: bool = False, providers: Optional[List[RateProvider]] = None) -> FetchResult:
+        providers = providers or build_providers()
+        for priority, provider in enumerate(providers):
+            self.state(provider.name).priority = priority
+        timings = self.last_timings = {}
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(self._fetch_one(provider, force) for provider in providers), return_exceptions=True
+        )
+        timings["fetch"] = time.perf_counter() - started
+        parser_phase_duration.observe(timings["fetch"], phase="fetch")
+
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for error in errors:
+            if not isinstance(error, UpstreamError):
+                raise error
+        if len(errors) == len(providers):
+            # Ошибка источника с наибольшим приоритетом (с Retry-After, если разомкнут предохранитель)
+            raise errors[0]
+
+        quotes: List[ProviderQuote] = []
+        pending_states = {}
+        changed = False
+        parse_time = 0.0
+        for provider, result in zip(providers, results):
+            if isinstance(result, BaseException):
+                quote = self.state(provider.name).usable_quote()
+            else:
+                quote, pending_state, seconds = result
+                parse_time += seconds
+                if quote is None:
+                    quote = self.state(provider.name).quote
+                else:
+                    changed = True
+                    pending_states[provider.url] = pending_state
+            if quote is not None:
+                quotes.append(quote)
+        timings["parse"] = parse_time
+        parser_phase_duration.observe(parse_time, phase="parse")
+
+        if not changed:
+            return FetchResult(None, {}, timings)
+
+        started = time.perf_counter()
+        anchors = {code: rate.value for code, rate in snapshot_store.current.rates.items()}
+        normalized = normalize(quotes, settings.base_currency.upper(), anchors)
+        rates, contributed = merge(
+            normalized,
+            [provider.name for provider in providers],
+            {quote.provider: quote.date for quote in quotes}
+        )
+        for name, count in contributed.items():
+            self.state(name).merged = count
+        timings["merge"] = time.perf_counter() - started
+
+        logger.info(
+            f"Получено {len(rates)} курсов валют из источников: "
+            + ", ".join(f"{name} {count}" for name, count in contributed.items())
+        )
+        return FetchResult(rates, pending_states, timings)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: state.as_dict()
+            for name, state in sorted(self.states.items(), key=lambda item: item[1].priority)
+        }
+
+def commit_state(pending_states: Dict[str, Dict[str, Optional[str]]]):
+    """Запоминает валидаторы ответов после успешного сохранения курсов"""
+    _conditional_state.update(pending_states)
+
+provider_runner = ProviderRunner()
+
+async def _main(args):
+    for name in ("rate_providers", "cbr_url", "ecb_url", "json_rates_url", "base_currency"):
+        value = getattr(args, name)
+        if value:
+            setattr(settings, name, value)
+    try:
+        result = await provider_runner.fetch(force=True)
+    finally:
+        await close_http_client()
+    output = {
+        "rates": {record.code: record.rate for record in sorted(result.rates or [], key=lambda record: record.code)},
+        "providers": provider_runner.stats(),
+        "timings": {stage: round(seconds, 6) for stage, seconds in result.timings.items()}
+    }
+    print(json.dumps(output, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Получение и объединение курсов из всех источников (без записи в БД)")
+    parser.add_argument("--providers", dest="rate_providers", default=None, help="Источники через запятую, по приоритету")
+    parser.add_argument("--cbr-url", default=None)
+    parser.add_argument("--ecb-url", default=None)
+    parser.add_argument("--json-url", dest="json_rates_url", default=None)
+    parser.add_argument("--base", dest="base_currency", default=None, help="Базовая валюта курсов")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from app.config import settings
+from app.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+upstream_retries = registry.counter("upstream_retries_total", "Повторные запросы к источнику курсов", ("upstream",))
+upstream_failures = registry.counter(
+    "upstream_failures_total", "Неудачные запросы к источнику курсов после всех повторов", ("upstream", "reason")
+)
+
+class UpstreamError(Exception):
+    """Источник курсов недоступен или ответил ошибкой"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+class CircuitOpenError(UpstreamError):
+    """Запрос не отправлялся: предохранитель разомкнут после серии ошибок"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Источник {name} временно отключён после серии ошибок, повтор через {retry_after:.0f} с")
+        self.retry_after = retry_after
+
+def is_retryable(error: Exception) -> bool:
+    """Повторять имеет смысл сетевые ошибки, таймауты, 5xx и 429"""
+    if isinstance(error, UpstreamError):
+        return error.retryable
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(error, httpx.TransportError)
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Экспоненциальная задержка с полным джиттером: U(0, min(cap, base * 2^attempt))"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class CircuitBreaker:
+    """Предохранитель для внешнего источника.
+
+    После `failure_threshold` неудачных вызовов подряд размыкается на
+    `reset_timeout` секунд: вызовы сразу получают CircuitOpenError и не
+    занимают слот парсинга ожиданием таймаута. Затем пропускает один
+    пробный вызов (half_open): успех замыкает цепь, ошибка снова
+    размыкает её.
+    """
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.upstream_breaker_threshold
+        self.reset_timeout = reset_timeout if reset_timeout is not None else settings.upstream_breaker_reset
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.opened_total = 0
+        self.rejected_total = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        """Пропускает вызов или бросает CircuitOpenError"""
+        if self.state == "open":
+            if self.retry_after() > 0:
+                self.rejected_total += 1
+                raise CircuitOpenError(self.name, self.retry_after())
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.trial_in_flight:
+                self.rejected_total += 1
+                raise CircuitOpenError(self.name, self.reset_timeout)
+            self.trial_in_flight = True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Источник {self.name} снова доступен")
+        self.state = "closed"
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.trial_in_flight = False
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened_total += 1
+                logger.warning(f"Источник {self.name}: предохранитель разомкнут на {self.reset_timeout} с")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_after": round(self.retry_after(), 3) if self.state == "open" else 0.0,
+            "opened_total": self.opened_total,
+            "rejected_total": self.rejected_total
+        }
+
+async def call_with_retries(
+    call: Callable[[float], Awaitable[T]],
+    breaker: CircuitBreaker,
+    retries: Optional[int] = None,
+    deadline: Optional[float] = None
+) -> T:
+    """Выполняет call(timeout) через предохранитель с повторами.
+
+    Повторяются только временные ошибки (is_retryable), между попытками -
+    экспоненциальная задержка с джиттером. Общее время ограничено
+    `deadline`: таймаут каждой попытки урезается до остатка, и если на
+    следующую попытку времени не хватает, возвращается последняя ошибка.
+    """
+    retries = settings.upstream_retries if retries is None else retries
+    deadline = deadline or settings.upstream_deadline
+    finish = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        breaker.allow()
+        remaining = finish - time.monotonic()
+        try:
+            result = await call(min(settings.upstream_timeout, remaining))
+        except Exception as e:
+            if not is_retryable(e):
+                # Ответ получен, источник жив: ошибка данных не размыкает цепь
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            delay = backoff_delay(attempt, settings.upstream_backoff_base, settings.upstream_backoff_max)
+            if attempt >= retries or breaker.state == "open" or time.monotonic() + delay >= finish:
+                upstream_failures.inc(upstream=breaker.name, reason=type(e).__name__)
+                raise
+            attempt += 1
+            upstream_retries.inc(upstream=breaker.name)
+            logger.warning(f"{breaker.name}: {type(e).__name__} {e}; повтор {attempt}/{retries} через {delay:.2f} с")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+def breakers_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.config import settings
+from app.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+http_cache_responses = registry.counter(
+    "http_cache_responses_total", "Ответы из кэша готовых тел: hit, miss и not_modified (304)", ("resource", "result")
+)
+
+class DataGenerations:
+    """Номера поколений данных по ресурсам (RESOURCES).
+
+    Обработчики CRUD, парсер и сжатие истории увеличивают номер после
+    коммита изменений; закэшированный ответ с другим номером
+    собирается заново.
+    """
+
+    RESOURCES = ("currencies", "rates")
+
+    def __init__(self):
+        self.values: Dict[str, int] = {}
+
+    def get(self, resource: str) -> int:
+        return self.values.get(resource, 0)
+
+    def bump(self, *resources: str):
+        for resource in resources:
+            self.values[resource] = self.values.get(resource, 0) + 1
+
+    def bump_all(self):
+        """Изменения пришли извне (другой воркер): сбросить всё"""
+        self.bump(*self.RESOURCES)
+
+data_generation = DataGenerations()
+
+def encode_json(content: Any) -> bytes:
+    # Тот же вывод, что у JSONResponse FastAPI
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode()
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Слабое сравнение для If-None-Match (RFC 9110, 13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+class CachedBody:
+    __slots__ = ("version", "body", "etag")
+
+    def __init__(self, version: Hashable, body: bytes):
+        self.version = version
+        self.body = body
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+class ResponseCache:
+    """Готовые JSON-тела горячих GET-ресурсов со строгим ETag.
+
+    Ответ собирается и сериализуется один раз на версию данных
+    (поколение из data_generation или номер снимка курсов) и дальше
+    отдаётся готовыми байтами без обращения к БД. Запрос с совпавшим
+    If-None-Match получает 304 без тела. Cache-Control позволяет
+    клиентам и CDN переиспользовать ответ http_cache_max_age секунд и
+    ещё http_cache_stale_while_revalidate секунд обновлять его в фоне.
+    Записи вытесняются по LRU сверх http_cache_entries.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or settings.http_cache_entries
+        self.entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.coalesced = 0
+        # Идущие сборки: ключ -> (версия, future с CachedBody)
+        self.pending: Dict[Hashable, Tuple[Hashable, asyncio.Future]] = {}
+
+    def cache_control(self) -> str:
+        return (
+            f"public, max-age={settings.http_cache_max_age}, "
+            f"stale-while-revalidate={settings.http_cache_stale_while_revalidate}"
+        )
+
+    async def respond(self, request: Request, key: tuple, version: Hashable, build: Callable[[], Any]) -> Response:
+        """Ответ для ресурса key в версии version; build() собирает содержимое при промахе.
+
+        Версия читается до сборки: если данные изменятся во время
+        build(), запись окажется устаревшей и следующий запрос соберёт её
+        заново, а не наоборот.
+        """
+        resource = key[0]
+        entry = self.entries.get(key)
+        if entry is not None and entry.version == version:
+            self.hits += 1
+            http_cache_responses.inc(resource=resource, result="hit")
+            self.entries.move_to_end(key)
+        else:
+            self.misses += 1
+            http_cache_responses.inc(resource=resource, result="miss")
+            entry = await self._rebuild(key, version, build)
+
+        headers = {"ETag": entry.etag, "Cache-Control": self.cache_control()}
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            self.not_modified += 1
+            http_cache_responses.inc(resource=resource, result="not_modified")
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    async def _rebuild(self, key: tuple, version: Hashable, build: Callable[[], Any]) -> CachedBody:
+        """Single-flight: одновременные промахи по ключу и версии ждут одну сборку"""
+        pending = self.pending.get(key)
+        if pending is not None and pending[0] == version:
+            self.coalesced += 1
+            return await asyncio.shield(pending[1])
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = (version, future)
+        try:
+            content = build()
+            if inspect.isawaitable(content):
+                content = await content
+            entry = CachedBody(version, encode_json(content))
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            # Ошибка (404, 400) не кэшируется, ожидающие получают её же
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            if self.pending.get(key, (None, None))[1] is future:
+                del self.pending[key]
+        future.set_result(entry)
+
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / requests, 4) if requests else None,
+            "generations": dict(data_generation.values)
+        }
+
+response_cache = ResponseCache()
@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.database import ReadSessionLocal
+from app.db.models import CurrencyRate, DailyRate
+from app.db.writer import db_writer
+from app.services.response_cache import data_generation
+from app.services.series import series_store
+
+logger = logging.getLogger(__name__)
+
+def aggregate_days(rows) -> Dict[date, Dict[str, Any]]:
+    """Дневные open/close/min/max/count по строкам (value, date), упорядоченным по времени"""
+    days: Dict[date, Dict[str, Any]] = {}
+    for row in rows:
+        day = days.get(row.date.date())
+        if day is None:
+            days[row.date.date()] = {
+                "open": row.value, "close": row.value, "min": row.value, "max": row.value,
+                "count": 1, "first_at": row.date, "last_at": row.date
+            }
+            continue
+        day["close"] = row.value
+        day["last_at"] = row.date
+        day["min"] = min(day["min"], row.value)
+        day["max"] = max(day["max"], row.value)
+        day["count"] += 1
+    return days
+
+def merge_daily(existing: DailyRate, day: Dict[str, Any]):
+    """Вливает агрегат в уже сохранённый день.
+
+    День может сжиматься за несколько проходов (граница пачки, поздний
+    backfill), поэтому open/close выбираются по времени наблюдения.
+    """
+    if day["first_at"] < existing.first_at:
+        existing.open = day["open"]
+        existing.first_at = day["first_at"]
+    if day["last_at"] >= existing.last_at:
+        existing.close = day["close"]
+        existing.last_at = day["last_at"]
+    existing.min = min(existing.min, day["min"])
+    existing.max = max(existing.max, day["max"])
+    existing.count += day["count"]
+
+class RateCompactor:
+    """Сжимает старую историю currency_rates в дневные агрегаты daily_rates.
+
+    Курсы новее retention_raw_days хранятся как есть. Более старые
+    переносятся в daily_rates и удаляются пачками по retention_chunk_rows
+    строк одной валюты: каждая пачка - отдельная операция db_writer, так
+    что запись парсера и API не ждёт всего прохода. Последний курс валюты
+    не сжимается, чтобы снимок последних курсов строился по currency_rates.
+    """
+
+    def __init__(self, raw_days: Optional[int] = None, chunk_rows: Optional[int] = None):
+        self.raw_days = raw_days if raw_days is not None else settings.retention_raw_days
+        self.chunk_rows = chunk_rows or settings.retention_chunk_rows
+        self.running = False
+        self.runs = 0
+        self.last_result: Optional[Dict[str, Any]] = None
+
+    def cutoff(self, now: Optional[datetime] = None) -> datetime:
+        """Начало первого дня, который хранится в полном разрешении"""
+        today = (now or datetime.now()).date()
+        return datetime.combine(today - timedelta(days=self.raw_days), datetime.min.time())
+
+    async def run(self, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        if self.running:
+            logger.info("Сжатие истории уже выполняется")
+            return None
+        self.running = True
+        started = time.perf_counter()
+        cutoff = self.cutoff(now)
+        result = {"cutoff": cutoff.isoformat(), "currencies": 0, "rows_compacted": 0, "days_written": 0, "chunks": 0}
+        try:
+            async with ReadSessionLocal() as db:
+                currency_ids = await self._candidates(db, cutoff)
+            for currency_id in currency_ids:
+                rows, days, chunks = await self._compact_currency(currency_id, cutoff)
+                if rows:
+                    result["currencies"] += 1
+                    result["rows_compacted"] += rows
+                    result["days_written"] += days
+                    result["chunks"] += chunks
+                    series_store.invalidate(currency_id)
+        finally:
+            if result["rows_compacted"]:
+                data_generation.bump("rates")
+            self.running = False
+        result["duration"] = round(time.perf_counter() - started, 3)
+        self.runs += 1
+        self.last_result = result
+        logger.info(
+            f"Сжатие истории до {cutoff.date()}: {result['rows_compacted']} курсов -> "
+            f"{result['days_written']} дневных агрегатов, валют {result['currencies']}, {result['duration']} с"
+        )
+        return result
+
+    async def _candidates(self, db: AsyncSession, cutoff: datetime) -> List[int]:
+        result = await db.execute(
+            select(CurrencyRate.currency_id)
+            .where(CurrencyRate.currency_id.is_not(None), CurrencyRate.date < cutoff)
+            .group_by(CurrencyRate.currency_id)
+        )
+        return [currency_id for currency_id, in result.all()]
+
+    async def _compact_currency(self, currency_id: int, cutoff: datetime):
+        rows_total = days_total = chunks = 0
+        while True:
+            rows, days = await db_writer.submit(lambda db: self._compact_chunk(db, currency_id, cutoff))
+            if not rows:
+                break
+            rows_total += rows
+            days_total += days
+            chunks += 1
+            if rows < self.chunk_rows:
+                break
+        return rows_total, days_total, chunks
+
+    async def _compact_chunk(self, db: AsyncSession, currency_id: int, cutoff: datetime):
+        """Одна пачка: агрегирует самые старые курсы валюты и удаляет их"""
+        latest = (
+            select(CurrencyRate.id)
+            .where(CurrencyRate.currency_id == currency_id)
+            .order_by(CurrencyRate.date.desc(), CurrencyRate.id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+        conditions = (
+            CurrencyRate.currency_id == currency_id,
+            CurrencyRate.date < cutoff,
+            CurrencyRate.id != latest
+        )
+        result = await db.execute(
+            select(CurrencyRate.id, CurrencyRate.value, CurrencyRate.date)
+            .where(*conditions)
+            .order_by(CurrencyRate.date, CurrencyRate.id)
+            .limit(self.chunk_rows)
+        )
+        rows = result.all()
+        if not rows:
+            return 0, 0
+
+        days = aggregate_days(rows)
+        existing = await db.execute(
+            select(DailyRate).where(DailyRate.currency_id == currency_id, DailyRate.day.in_(list(days)))
+        )
+        stored = {daily.day: daily for daily in existing.scalars()}
+        for day, values in days.items():
+            if day in stored:
+                merge_daily(stored[day], values)
+            else:
+                db.add(DailyRate(currency_id=currency_id, day=day, **values))
+
+        # Выборка упорядочена по (date, id), поэтому пачка - это всё до последней строки включительно
+        last = rows[-1]
+        await db.execute(
+            delete(CurrencyRate)
+            .where(*conditions)
+            .where(or_(
+                CurrencyRate.date < last.date,
+                and_(CurrencyRate.date == last.date, CurrencyRate.id <= last.id)
+            ))
+        )
+        await db.flush()
+        return len(rows), len(days) - len(stored)
+
+    async def stats(self) -> Dict[str, Any]:
+        async with ReadSessionLocal() as db:
+            raw_rows = (await db.execute(select(func.count()).select_from(CurrencyRate))).scalar()
+            daily_rows = (await db.execute(select(func.count()).select_from(DailyRate))).scalar()
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "raw_days": self.raw_days,
+            "chunk_rows": self.chunk_rows,
+            "raw_rows": raw_rows,
+            "daily_rows": daily_rows,
+            "last_result": self.last_result
+        }
+
+rate_compactor = RateCompactor()
+
+async def _main(args):
+    from app.db.database import engine, Base
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    try:
+        result = await RateCompactor(args.raw_days, args.chunk_rows).run()
+    finally:
+        await db_writer.stop()
+    print(
+        f"Сжато курсов: {result['rows_compacted']} в {result['days_written']} дневных агрегатов "
+        f"(валют {result['currencies']}, пачек {result['chunks']}), {result['duration']} с"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сжатие старой истории курсов в дневные агрегаты")
+    parser.add_argument("--raw-days", type=int, default=None, help="Сколько дней хранить курсы без сжатия")
+    parser.add_argument("--chunk-rows", type=int, default=None)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
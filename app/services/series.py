@@ -0,0 +1,180 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.database import ReadSessionLocal
+from app.db.models import Currency
+from app.services.history import rate_points
+
+logger = logging.getLogger(__name__)
+
+class CurrencySeries:
+    """Колоночная история одной валюты: отсортированные метки времени и значения.
+
+    Массивы выделяются с запасом, поэтому добавление новых точек
+    амортизированно O(1), а уже выданные читателям срезы не меняются.
+    """
+
+    __slots__ = ("timestamps", "values", "size")
+
+    def __init__(self, timestamps: np.ndarray, values: np.ndarray):
+        self.size = len(timestamps)
+        capacity = max(16, self.size * 2)
+        self.timestamps = np.empty(capacity, dtype="datetime64[us]")
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.timestamps[:self.size] = timestamps
+        self.values[:self.size] = values
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.timestamps[:self.size], self.values[:self.size]
+
+    @property
+    def last_timestamp(self) -> Optional[np.datetime64]:
+        return self.timestamps[self.size - 1] if self.size else None
+
+    def as_of(self, timestamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Значение и время последней точки не позже каждого момента (NaN и NaT - раньше начала истории).
+
+        Бинарный поиск по отсортированным меткам: O(k log n) для k моментов.
+        """
+        stamps, values = self.view()
+        positions = np.searchsorted(stamps, timestamps, side="right") - 1
+        found = positions >= 0
+        result = np.full(len(timestamps), np.nan)
+        at = np.full(len(timestamps), np.datetime64("NaT"), dtype="datetime64[us]")
+        result[found] = values[positions[found]]
+        at[found] = stamps[positions[found]]
+        return result, at
+
+    def append(self, timestamp: datetime, value: float) -> bool:
+        """Добавляет точку в конец; False, если она нарушает порядок"""
+        ts = np.datetime64(timestamp, "us")
+        if self.size and ts < self.timestamps[self.size - 1]:
+            return False
+        if self.size and ts == self.timestamps[self.size - 1] and value == self.values[self.size - 1]:
+            # Строка уже попала в загрузку из БД до своего extend()
+            return True
+        if self.size == len(self.timestamps):
+            capacity = len(self.timestamps) * 2
+            timestamps = np.empty(capacity, dtype="datetime64[us]")
+            values = np.empty(capacity, dtype=np.float64)
+            timestamps[:self.size] = self.timestamps[:self.size]
+            values[:self.size] = self.values[:self.size]
+            self.timestamps, self.values = timestamps, values
+        self.timestamps[self.size] = ts
+        self.values[self.size] = value
+        self.size += 1
+        return True
+
+class SeriesStore:
+    """Кэш колоночной истории курсов по currency_id.
+
+    История валюты (сырые курсы и дневные агрегаты старых периодов)
+    загружается из БД при первом обращении, после чего
+    парсер дописывает в неё новые курсы через extend(). Точки, пришедшие
+    не по порядку (например, из backfill), сбрасывают кэш этой валюты.
+    По сериям отвечает и as_of - курс на момент времени.
+    """
+
+    def __init__(self, load_attempts: int = 3):
+        self._series: Dict[int, CurrencySeries] = {}
+        self._lock = asyncio.Lock()
+        # Счётчик extend() по валюте: строки, записанные во время загрузки
+        # серии, могли не попасть в выборку и не попасть в кэш
+        self._extended: Dict[int, int] = {}
+        self.load_attempts = load_attempts
+
+    async def get(self, db: AsyncSession, currency_id: int) -> CurrencySeries:
+        series = self._series.get(currency_id)
+        if series is not None:
+            return series
+        async with self._lock:
+            series = self._series.get(currency_id)
+            for attempt in range(self.load_attempts):
+                if series is not None:
+                    break
+                generation = self._extended.get(currency_id, 0)
+                series = await self._load(db if attempt == 0 else None, currency_id)
+                if self._extended.get(currency_id, 0) != generation:
+                    # Во время загрузки дописывались строки - выборка может их не содержать
+                    logger.info(f"История валюты {currency_id} изменилась во время загрузки, повтор")
+                    series = None
+                    continue
+                self._series[currency_id] = series
+                logger.info(f"История валюты {currency_id} загружена в кэш: {series.size} точек")
+            if series is None:
+                # Запись не утихает: отдаём свежую выборку без кэширования
+                series = await self._load(None, currency_id)
+        return series
+
+    async def _load(self, db: Optional[AsyncSession], currency_id: int) -> CurrencySeries:
+        """Выборка истории; без db - в новой сессии, чтобы увидеть свежий снимок БД"""
+        points = rate_points([currency_id])
+        query = select(points.c.date, points.c.value).order_by(points.c.date, points.c.id)
+        if db is None:
+            async with ReadSessionLocal() as session:
+                rows = (await session.execute(query)).all()
+        else:
+            rows = (await db.execute(query)).all()
+        return CurrencySeries(
+            np.array([row.date for row in rows], dtype="datetime64[us]"),
+            np.array([row.value for row in rows], dtype=np.float64)
+        )
+
+    async def as_of(self, db: AsyncSession, codes: Sequence[str], timestamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Курс в базовой валюте для пар (код, момент): последний курс не позже момента.
+
+        codes - по коду на каждый момент или один код для всех. Моменты
+        группируются по валюте и ищутся бинарным поиском в её серии.
+        Возвращает значения и время найденных курсов; NaN и NaT - если
+        валюта неизвестна или момент раньше её истории.
+        """
+        values = np.full(len(timestamps), np.nan)
+        found_at = np.full(len(timestamps), np.datetime64("NaT"), dtype="datetime64[us]")
+        if not len(codes):
+            return values, found_at
+        groups: Dict[str, int] = {}
+        if len(codes) == 1:
+            groups[codes[0]] = 0
+            inverse = np.zeros(len(timestamps), dtype=np.int64)
+        else:
+            inverse = np.fromiter(
+                (groups.setdefault(code, len(groups)) for code in codes), dtype=np.int64, count=len(codes)
+            )
+
+        result = await db.execute(select(Currency.code, Currency.id).where(Currency.code.in_(list(groups))))
+        currency_ids = dict(result.all())
+        # Перестановка, собирающая моменты одной валюты подряд
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(groups) + 1))
+        for code, group in groups.items():
+            positions = order[bounds[group]:bounds[group + 1]]
+            if code == settings.base_currency:
+                values[positions] = 1.0
+                found_at[positions] = timestamps[positions]
+            elif code in currency_ids:
+                series = await self.get(db, currency_ids[code])
+                values[positions], found_at[positions] = series.as_of(timestamps[positions])
+        return values, found_at
+
+    def extend(self, rows: Iterable[Dict]):
+        """Дописывает сохранённые строки CurrencyRate в уже загруженные серии"""
+        for row in rows:
+            self._extended[row["currency_id"]] = self._extended.get(row["currency_id"], 0) + 1
+            series = self._series.get(row["currency_id"])
+            if series is not None and not series.append(row["date"], row["value"]):
+                self.invalidate(row["currency_id"])
+
+    def invalidate(self, currency_id: Optional[int] = None):
+        if currency_id is None:
+            self._series.clear()
+        else:
+            self._series.pop(currency_id, None)
+
+series_store = SeriesStore()
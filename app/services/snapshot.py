@@ -0,0 +1,139 @@
+import logging
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.models import Currency, CurrencyRate
+
+logger = logging.getLogger(__name__)
+
+class LatestRate(NamedTuple):
+    code: str
+    name: str
+    value: float
+    date: datetime
+
+class RatesSnapshot:
+    """Неизменяемый снимок последних курсов.
+
+    Все поля заполняются при создании и больше не меняются, поэтому
+    читатель, получивший ссылку на снимок, никогда не увидит его
+    наполовину обновлённым. Ответы API собираются заранее.
+    """
+
+    __slots__ = ("generation", "rates", "created_at", "payload")
+
+    def __init__(self, generation: int, rates: Dict[str, LatestRate]):
+        self.generation = generation
+        self.rates: Mapping[str, LatestRate] = MappingProxyType(rates)
+        self.created_at = datetime.now()
+        self.payload: Mapping[str, Dict[str, Any]] = MappingProxyType({
+            code: {
+                "code": rate.code,
+                "name": rate.name,
+                "value": rate.value,
+                "date": rate.date.isoformat()
+            }
+            for code, rate in sorted(rates.items())
+        })
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "generation": self.generation,
+            "updated_at": self.created_at.isoformat(),
+            "rates": list(self.payload.values())
+        }
+
+class SnapshotStore:
+    """Хранилище последнего снимка курсов в памяти процесса.
+
+    Публикация создаёт новый снимок (copy-on-write) и атомарно заменяет
+    ссылку на него, увеличивая номер поколения.
+
+    Отдельно хранится, когда источник последний раз успешно подтвердил
+    курсы: если ЦБ РФ недоступен, снимок продолжает отдаваться, но
+    freshness() помечает его как устаревший и показывает возраст.
+    """
+
+    def __init__(self):
+        self._current = RatesSnapshot(0, {})
+        self.seeded = False
+        self.checked_at: Optional[datetime] = None
+        self.failed_at: Optional[datetime] = None
+        self.upstream_error: Optional[str] = None
+
+    @property
+    def current(self) -> RatesSnapshot:
+        return self._current
+
+    def publish(self, rates: Iterable[LatestRate], remove: Iterable[str] = ()) -> RatesSnapshot:
+        merged = dict(self._current.rates)
+        for code in remove:
+            merged.pop(code, None)
+        for rate in rates:
+            merged[rate.code] = rate
+        self._current = RatesSnapshot(self._current.generation + 1, merged)
+        return self._current
+
+    async def seed(self, db: AsyncSession) -> RatesSnapshot:
+        """Заполняет снимок последним курсом каждой валюты из БД"""
+        latest = (
+            select(CurrencyRate.currency_id, func.max(CurrencyRate.date).label("date"))
+            .group_by(CurrencyRate.currency_id)
+            .subquery()
+        )
+        result = await db.execute(
+            select(Currency.code, Currency.name, CurrencyRate.value, CurrencyRate.date)
+            .join(CurrencyRate, CurrencyRate.currency_id == Currency.id)
+            .join(latest, (latest.c.currency_id == CurrencyRate.currency_id) & (latest.c.date == CurrencyRate.date))
+        )
+        rates = {row.code: LatestRate(row.code, row.name, row.value, row.date) for row in result.all()}
+        self._current = RatesSnapshot(self._current.generation + 1, rates)
+        self.seeded = True
+        logger.info(f"Снимок курсов загружен из БД: {len(rates)} валют")
+        return self._current
+
+    async def ensure_seeded(self, db: AsyncSession) -> RatesSnapshot:
+        if not self.seeded:
+            await self.seed(db)
+        return self._current
+
+    def mark_checked(self):
+        """Источник ответил успешно (в том числе 304 - курсы не изменились)"""
+        self.checked_at = datetime.now()
+        self.upstream_error = None
+
+    def mark_failed(self, error: Exception):
+        self.failed_at = datetime.now()
+        self.upstream_error = str(error)
+
+    def freshness(self, with_age: bool = True) -> Dict[str, Any]:
+        """Свежесть снимка; with_age=False - без age_seconds, для закэшированных ответов"""
+        age = (datetime.now() - self.checked_at).total_seconds() if self.checked_at else None
+        freshness = {
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "stale": self.upstream_error is not None or (age is not None and age > settings.rates_stale_after),
+            "upstream_error": self.upstream_error,
+            "failed_at": self.failed_at.isoformat() if self.failed_at else None
+        }
+        if not with_age:
+            del freshness["age_seconds"]
+        return freshness
+
+    def version(self) -> tuple:
+        """Версия ответов с последними курсами: снимок и всё, что меняет freshness(with_age=False)"""
+        freshness = self.freshness(with_age=False)
+        return (self._current.generation, freshness["checked_at"], freshness["failed_at"], freshness["stale"])
+
+    def get(self, code: str) -> Optional[Dict[str, Any]]:
+        return self._current.payload.get(code.upper())
+
+    def codes(self) -> List[str]:
+        return list(self._current.rates)
+
+snapshot_store = SnapshotStore()
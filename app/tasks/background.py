@@ -1,49 +1,31 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime
 import logging
-from app.services.parser import CurrencyParser
-from app.db.database import AsyncSessionLocal
-from app.websocket.manager import manager
-from app.nats.client import nats_client
+from app.config import settings
+from app.services.retention import rate_compactor
+from app.tasks.jobs import parse_jobs
+from app.tasks.leader import leader
 
 logger = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
 
 async def parse_and_save_rates():
-    try:
-        logger.info("Запуск автоматического парсинга...")
-        
-        async with AsyncSessionLocal() as db:
-            parser = CurrencyParser(db)
-            rates = await parser.fetch_rates()
-            saved_count = await parser.save_rates(rates)
-            
-            await manager.broadcast({
-                "type": "rates_updated",
-                "data": {
-                    "rates_count": saved_count,
-                    "timestamp": datetime.now().isoformat()
-                }
-            })
-            
-            if nats_client and nats_client.is_connected:
-                await nats_client.publish(
-                    subject="currency.updates",
-                    payload={
-                        "event": "auto_parse_completed",
-                        "rates_count": saved_count,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                )
-            
-            logger.info(f"Автопарсинг завершен. Курсов: {saved_count}")
-            return saved_count
-            
-    except Exception as e:
-        logger.error(f"Ошибка фоновой задачи: {e}")
+    if settings.cluster_mode and not leader.is_leader:
+        logger.debug("Автопарсинг пропущен: воркер не является лидером")
         return 0
 
+    logger.info("Запуск автоматического парсинга...")
+    # Если парсинг уже идёт (например, ручной), ждём его вместо второго запроса к ЦБ РФ
+    job = await parse_jobs.run("auto")
+    if job.error or not job.result["changed"]:
+        return 0
+    return job.result["saved"]
+
+async def compact_rates_history():
+    if settings.cluster_mode and not leader.is_leader:
+        return None
+    return await rate_compactor.run()
+
 def start_background_scheduler():
     scheduler.remove_all_jobs()
     
@@ -54,6 +36,25 @@ def start_background_scheduler():
         id='auto_currency_parser',
         replace_existing=True
     )
+
+    if settings.retention_enabled:
+        scheduler.add_job(
+            compact_rates_history,
+            'interval',
+            seconds=settings.retention_interval,
+            id='rates_compaction',
+            replace_existing=True
+        )
+
+    if settings.cluster_mode:
+        # Парсер запускает только воркер, удерживающий аренду лидера
+        scheduler.add_job(
+            leader.try_acquire,
+            'interval',
+            seconds=max(1, settings.leader_lease_ttl // 3),
+            id='leader_lease_renewal',
+            replace_existing=True
+        )
     
     if not scheduler.running:
         scheduler.start()
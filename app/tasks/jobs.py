@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.db.database import ReadSessionLocal
+from app.nats.client import nats_client
+from app.services.anomaly import publish_alerts
+from app.services.parser import CurrencyParser
+from app.services.resilience import UpstreamError
+from app.services.snapshot import snapshot_store
+from app.websocket.manager import manager
+
+logger = logging.getLogger(__name__)
+
+class ParseJob:
+    """Один запуск парсинга курсов ЦБ РФ и его результат"""
+
+    __slots__ = (
+        "id", "trigger", "force", "status", "callers", "created_at", "started_at",
+        "finished_at", "timings", "result", "error", "exception", "future"
+    )
+
+    def __init__(self, trigger: str, force: bool):
+        self.id = uuid.uuid4().hex
+        self.trigger = trigger
+        self.force = force
+        self.status = "pending"
+        # Сколько запусков (ручных и по расписанию) объединено в этот
+        self.callers = 1
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.timings: Dict[str, float] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.exception: Optional[Exception] = None
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "trigger": self.trigger,
+            "force": self.force,
+            "status": self.status,
+            "callers": self.callers,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "timings": {stage: round(seconds, 6) for stage, seconds in self.timings.items()},
+            "result": self.result,
+            "error": self.error
+        }
+
+class ParseJobCoordinator:
+    """Single-flight для парсинга: одновременно выполняется не больше одного запуска.
+
+    Вызов во время уже идущего запуска не начинает новый, а присоединяется
+    к текущему и получает его результат. Исключение - force-запуск поверх
+    обычного: обычный мог ответить "не изменилось" по ETag, поэтому
+    force ставится следующим, и к нему присоединяются остальные force-вызовы.
+    Последние запуски хранятся для GET /api/v1/tasks/jobs/{job_id}.
+    """
+
+    def __init__(self, history_size: int = 100):
+        self.history_size = history_size
+        self.jobs: "OrderedDict[str, ParseJob]" = OrderedDict()
+        self.current: Optional[ParseJob] = None
+        self.next: Optional[ParseJob] = None
+        self._task: Optional[asyncio.Task] = None
+        self.coalesced_total = 0
+
+    def submit(self, trigger: str, force: bool = False) -> ParseJob:
+        """Ставит запуск (или присоединяется к идущему) и сразу возвращает его"""
+        if self.current is not None and (self.current.force or not force):
+            return self._join(self.current)
+        if self.next is not None:
+            return self._join(self.next)
+
+        job = ParseJob(trigger, force)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.history_size:
+            self.jobs.popitem(last=False)
+        if self.current is None:
+            self._start(job)
+        else:
+            self.next = job
+        return job
+
+    async def run(self, trigger: str, force: bool = False) -> ParseJob:
+        """Запускает парсинг и ждёт завершения; ошибки остаются в job.error"""
+        job = self.submit(trigger, force)
+        await asyncio.shield(job.future)
+        return job
+
+    def get(self, job_id: str) -> Optional[ParseJob]:
+        return self.jobs.get(job_id)
+
+    def recent(self) -> List[Dict[str, Any]]:
+        return [job.as_dict() for job in reversed(self.jobs.values())]
+
+    def _join(self, job: ParseJob) -> ParseJob:
+        job.callers += 1
+        self.coalesced_total += 1
+        return job
+
+    def _start(self, job: ParseJob):
+        self.current = job
+        self._task = asyncio.create_task(self._execute(job))
+
+    async def _execute(self, job: ParseJob):
+        job.status = "running"
+        job.started_at = datetime.now()
+        try:
+            job.result = await self._parse(job)
+            job.status = "completed"
+            snapshot_store.mark_checked()
+        except asyncio.CancelledError:
+            logger.warning(f"Парсинг ({job.trigger}) отменён")
+            job.error = "Парсинг отменён"
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка парсинга ({job.trigger}): {e}")
+            job.error = str(e)
+            job.exception = e
+            job.status = "failed"
+            if isinstance(e, UpstreamError):
+                # Последний удачный снимок остаётся доступным и помечается устаревшим
+                snapshot_store.mark_failed(e)
+        finally:
+            # Ожидающие запуска получают результат и при отмене задачи
+            job.finished_at = datetime.now()
+            job.timings["total"] = (job.finished_at - job.started_at).total_seconds()
+            job.future.set_result(job)
+
+            self.current = None
+            if self.next is not None:
+                cancelled = job.status == "cancelled"
+                job, self.next = self.next, None
+                if cancelled:
+                    # Задачу отменяют при остановке приложения: следующий запуск не начинается
+                    self._cancel(job)
+                else:
+                    self._start(job)
+
+    def _cancel(self, job: ParseJob):
+        job.error = "Парсинг отменён"
+        job.status = "cancelled"
+        job.finished_at = datetime.now()
+        job.future.set_result(job)
+
+    async def _parse(self, job: ParseJob) -> Dict[str, Any]:
+        async with ReadSessionLocal() as db:
+            parser = CurrencyParser(db)
+            try:
+                rates = await parser.fetch_rates(force=job.force)
+            finally:
+                job.timings.update(parser.timings)
+            if rates is None:
+                return {"changed": False, "saved": 0, "changes": [], "alerts": []}
+
+            started = time.perf_counter()
+            result = await parser.save_rates_bulk(rates, only_changed=settings.delta_ingest)
+            job.timings["save"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        if result["changes"]:
+            await manager.broadcast({
+                "type": "rates_updated",
+                "data": {
+                    "rates_count": result["saved"],
+                    "changes": result["changes"],
+                    "timestamp": datetime.now().isoformat()
+                }
+            }, codes=[change["code"] for change in result["changes"]])
+
+            await nats_client.publish(
+                subject="currency.updates",
+                payload={
+                    "event": f"{job.trigger}_parse_completed",
+                    "job_id": job.id,
+                    "rates_count": result["saved"],
+                    "changes": result["changes"],
+                    "timestamp": datetime.now().isoformat()
+                }
+            )
+        await publish_alerts(result["alerts"], source=job.trigger)
+        job.timings["notify"] = time.perf_counter() - started
+
+        logger.info(f"Парсинг ({job.trigger}) завершен. Курсов: {result['saved']}, изменений: {len(result['changes'])}")
+        return {"changed": True, "saved": result["saved"], "changes": result["changes"], "alerts": result["alerts"]}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "current": self.current.id if self.current else None,
+            "next": self.next.id if self.next else None,
+            "jobs": len(self.jobs),
+            "coalesced_total": self.coalesced_total
+        }
+
+parse_jobs = ParseJobCoordinator()
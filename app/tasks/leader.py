@@ -0,0 +1,74 @@
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.config import settings
+from app.db.writer import db_writer
+from app.db.models import LeaderLease
+
+logger = logging.getLogger(__name__)
+
+class LeaderElector:
+    """Выбор лидера среди воркеров через аренду (lease) в общей БД.
+
+    Лидер продлевает аренду каждые ttl/3 секунд. Если он пропал, запись
+    истекает через ttl, и её забирает первый воркер, попытавшийся её
+    продлить. Захват и продление - один атомарный upsert с условием.
+    """
+
+    def __init__(self, name: str = "scheduler", ttl: Optional[int] = None, holder: Optional[str] = None):
+        self.name = name
+        self.ttl = ttl or settings.leader_lease_ttl
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+
+    async def try_acquire(self) -> bool:
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=self.ttl)
+
+        async def renew(db):
+            statement = sqlite_insert(LeaderLease).values(
+                name=self.name,
+                holder=self.holder,
+                expires_at=expires_at
+            )
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=["name"],
+                set_={"holder": statement.excluded.holder, "expires_at": statement.excluded.expires_at},
+                where=or_(LeaderLease.holder == self.holder, LeaderLease.expires_at < now)
+            ))
+            result = await db.execute(select(LeaderLease.holder).where(LeaderLease.name == self.name))
+            return result.scalar_one_or_none()
+
+        try:
+            is_leader = await db_writer.submit(renew) == self.holder
+        except Exception as e:
+            logger.error(f"Ошибка продления аренды лидера: {e}")
+            is_leader = False
+
+        if is_leader != self.is_leader:
+            logger.info(f"{self.holder}: {'стал лидером' if is_leader else 'больше не лидер'} ({self.name})")
+        self.is_leader = is_leader
+        return is_leader
+
+    async def release(self):
+        if not self.is_leader:
+            return
+        async def release(db):
+            await db.execute(
+                delete(LeaderLease).where(LeaderLease.name == self.name, LeaderLease.holder == self.holder)
+            )
+
+        try:
+            await db_writer.submit(release)
+        except Exception as e:
+            logger.error(f"Ошибка освобождения аренды лидера: {e}")
+        self.is_leader = False
+
+leader = LeaderElector()
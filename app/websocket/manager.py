@@ -1,39 +1,287 @@
+import asyncio
+import json
 import logging
-from typing import List
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
 from fastapi import WebSocket
 
+from app.config import settings
+from app.services.metrics import registry, ws_broadcast_duration
+from app.services.snapshot import snapshot_store
+
 logger = logging.getLogger(__name__)
 
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+# События с курсами: более позднее заменяет более раннее, политика coalesce выбрасывает только их
+COALESCED_EVENTS = frozenset({"rates_updated"})
+# Списки в data, которые подписчикам кодов валют сужаются до их кодов
+NARROWED_LISTS = ("changes", "alerts")
+
+ws_dropped_messages = registry.counter("ws_dropped_messages_total", "Сообщения, выброшенные при переполнении очередей")
+
+def encode_message(message: dict) -> str:
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+def normalize_topic(topic: str) -> str:
+    """Коды валют приводятся к верхнему регистру, типы событий - как есть"""
+    topic = topic.strip()
+    return topic.upper() if len(topic) == 3 and topic.isalpha() else topic
+
+class ClientConnection:
+    """Подключение с собственной ограниченной очередью отправки.
+
+    Очередь разбирается отдельной задачей, поэтому медленный клиент
+    задерживает только себя. При переполнении действует политика
+    менеджера: drop_oldest - выбросить самое старое сообщение,
+    coalesce - оставить только последнее событие с курсами (служебные
+    сообщения - subscribed, snapshot, ошибки - сохраняются),
+    disconnect - отключить клиента. Элемент очереди - (текст, можно ли
+    выбросить при coalesce).
+    """
+
+    __slots__ = ("websocket", "queue", "wakeup", "task", "sent", "dropped", "topics")
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.topics: Set[str] = set()
+        self.queue: Deque[Tuple[str, bool]] = deque()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+
+    async def run(self, manager: "ConnectionManager"):
+        try:
+            while True:
+                if not self.queue:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                await self.websocket.send_text(self.queue.popleft()[0])
+                self.sent += 1
+        except Exception as e:
+            logger.error(f"WebSocket ошибка отправки: {e}")
+            manager.disconnect(self.websocket)
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        
+    """Рассылка событий WebSocket-клиентам с подпиской на топики.
+
+    Топик - код валюты (USD) или тип события (rates_updated). Клиенты без
+    подписок получают все события, остальные - только совпавшие: индекс
+    топик -> подписчики позволяет не перебирать все подключения.
+    """
+
+    def __init__(self, queue_size: Optional[int] = None, overflow_policy: Optional[str] = None):
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.subscribers: Dict[str, Set[ClientConnection]] = {}
+        self.unfiltered: Set[ClientConnection] = set()
+        # ClusterRelay другого воркера, если включён кластерный режим
+        self.relay = None
+        self.queue_size = queue_size or settings.ws_queue_size
+        self.overflow_policy = overflow_policy or settings.ws_overflow_policy
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {self.overflow_policy}")
+        self.messages_total = 0
+        self.dropped_total = 0
+        self.slow_disconnects = 0
+
+    @property
+    def active_connections(self):
+        return list(self.connections)
+
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
-        
+        connection = ClientConnection(websocket)
+        self.connections[websocket] = connection
+        self.unfiltered.add(connection)
+        connection.task = asyncio.create_task(connection.run(self))
+
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        self.unsubscribe(connection, list(connection.topics))
+        self.unfiltered.discard(connection)
+        if connection.task and connection.task is not asyncio.current_task():
+            connection.task.cancel()
+
+    def subscribe(self, connection: ClientConnection, topics: Iterable[str]) -> List[str]:
+        added = []
+        for topic in map(normalize_topic, topics):
+            if topic and topic not in connection.topics:
+                connection.topics.add(topic)
+                self.subscribers.setdefault(topic, set()).add(connection)
+                added.append(topic)
+        if connection.topics:
+            self.unfiltered.discard(connection)
+        return added
+
+    def unsubscribe(self, connection: ClientConnection, topics: Iterable[str]) -> List[str]:
+        removed = []
+        for topic in map(normalize_topic, topics):
+            if topic in connection.topics:
+                connection.topics.discard(topic)
+                subscribers = self.subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(connection)
+                    if not subscribers:
+                        del self.subscribers[topic]
+                removed.append(topic)
+        if not connection.topics and connection.websocket in self.connections:
+            self.unfiltered.add(connection)
+        return removed
+
+    def _initial_snapshot(self, topics: Iterable[str]) -> Dict[str, Any]:
+        snapshot = snapshot_store.current
+        topics = set(topics)
+        if "rates_updated" in topics:
+            rates = list(snapshot.payload.values())
+        else:
+            rates = [snapshot.payload[code] for code in sorted(topics) if code in snapshot.payload]
+        return {
+            "type": "snapshot",
+            "data": {"generation": snapshot.generation, "rates": rates},
+            "timestamp": snapshot.created_at.isoformat()
+        }
+
+    async def handle_client_message(self, websocket: WebSocket, data: str):
+        """Команды клиента: {"action": "subscribe" | "unsubscribe", "topics": [...]}"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
         try:
-            await websocket.send_json(message)
-        except Exception as e:
-            logger.error(f"WebSocket ошибка отправки: {e}")
-            self.disconnect(websocket)
-            
-    async def broadcast(self, message: dict):
-        disconnected = []
-        
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"WebSocket broadcast ошибка: {e}")
-                disconnected.append(connection)
-                
-        for connection in disconnected:
-            self.disconnect(connection)
+            command = json.loads(data)
+            action = command["action"]
+            topics = command.get("topics") or []
+            if isinstance(topics, str):
+                topics = [topics]
+        except Exception:
+            self._enqueue(connection, encode_message({"type": "error", "message": "Некорректная команда"}))
+            return
+
+        if action == "subscribe":
+            added = self.subscribe(connection, topics)
+            self._enqueue(connection, encode_message({"type": "subscribed", "topics": sorted(connection.topics)}))
+            snapshot = self._initial_snapshot(added)
+            if snapshot["data"]["rates"]:
+                self._enqueue(connection, encode_message(snapshot))
+        elif action == "unsubscribe":
+            self.unsubscribe(connection, topics)
+            self._enqueue(connection, encode_message({"type": "unsubscribed", "topics": sorted(connection.topics)}))
+        else:
+            self._enqueue(connection, encode_message({"type": "error", "message": f"Неизвестное действие: {action}"}))
+
+    def _enqueue(self, connection: ClientConnection, text: str, coalesce: bool = False):
+        queue = connection.queue
+        if len(queue) >= self.queue_size:
+            if self.overflow_policy == "disconnect":
+                logger.warning("WebSocket клиент не успевает за сообщениями - отключаем")
+                self.slow_disconnects += 1
+                self.disconnect(connection.websocket)
+                asyncio.create_task(self._close(connection.websocket))
+                return
+            dropped = 0
+            if self.overflow_policy == "coalesce":
+                # Новое событие с курсами заменяет все ожидающие, служебное - все, кроме последнего
+                last = None if coalesce else next((item for item in reversed(queue) if item[1]), None)
+                kept = [item for item in queue if not item[1] or item is last]
+                dropped = len(queue) - len(kept)
+                if dropped:
+                    queue.clear()
+                    queue.extend(kept)
+            if len(queue) >= self.queue_size:
+                # drop_oldest, а также coalesce, когда очередь заняли служебные сообщения
+                queue.popleft()
+                dropped += 1
+            connection.dropped += dropped
+            self.dropped_total += dropped
+            ws_dropped_messages.inc(dropped)
+        queue.append((text, coalesce))
+        connection.wakeup.set()
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    async def send_personal_message(self, message: dict, websocket: WebSocket):
+        connection = self.connections.get(websocket)
+        if connection:
+            self._enqueue(connection, encode_message(message))
+
+    async def broadcast(self, message: dict, codes: Optional[Iterable[str]] = None):
+        """Рассылает событие локальным клиентам и, в кластере, другим воркерам"""
+        codes = list(codes or ())
+        started = time.perf_counter()
+        await self.deliver_local(message, codes)
+        ws_broadcast_duration.observe(time.perf_counter() - started)
+        if self.relay is not None:
+            await self.relay.relay(message, codes)
+
+    async def deliver_local(self, message: dict, codes: Optional[Iterable[str]] = None):
+        """Рассылает событие клиентам без подписок и подписчикам его топиков.
+
+        Подписчики кодов валют (без подписки на тип события) получают
+        списки data["changes"] и data["alerts"], суженные до своих кодов;
+        если от них ничего не осталось, сообщение не отправляется. Каждый вариант
+        сообщения сериализуется один раз, отправкой занимаются задачи клиентов.
+        """
+        self.messages_total += 1
+        recipients = set(self.unfiltered)
+        recipients.update(self.subscribers.get(message.get("type"), ()))
+        text = encode_message(message)
+        coalesce = message.get("type") in COALESCED_EVENTS
+        for connection in recipients:
+            self._enqueue(connection, text, coalesce)
+
+        narrowed: Dict[frozenset, List[ClientConnection]] = {}
+        for code in set(codes or ()):
+            for connection in self.subscribers.get(code, ()):
+                if connection not in recipients:
+                    narrowed.setdefault(frozenset(connection.topics), []).append(connection)
+                    recipients.add(connection)
+
+        for topics, connections in narrowed.items():
+            message_for_topics = self._narrow(message, topics)
+            if message_for_topics is None:
+                continue
+            text = encode_message(message_for_topics)
+            for connection in connections:
+                self._enqueue(connection, text, coalesce)
+
+    def _narrow(self, message: dict, topics: frozenset) -> Optional[dict]:
+        data = message.get("data")
+        if not isinstance(data, dict):
+            return message
+        lists = {key: data[key] for key in NARROWED_LISTS if isinstance(data.get(key), list)}
+        if not lists:
+            return message
+        narrowed = {key: [item for item in items if item.get("code") in topics] for key, items in lists.items()}
+        if not any(narrowed.values()):
+            return None
+        return {**message, "data": {**data, **narrowed}}
+
+    def stats(self) -> Dict[str, Any]:
+        depths = [len(connection.queue) for connection in self.connections.values()]
+        return {
+            "connections": len(depths),
+            "topics": len(self.subscribers),
+            "unfiltered_connections": len(self.unfiltered),
+            "overflow_policy": self.overflow_policy,
+            "queue_size": self.queue_size,
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "messages_total": self.messages_total,
+            "dropped_total": self.dropped_total,
+            "slow_disconnects": self.slow_disconnects
+        }
 
 manager = ConnectionManager()
+
+registry.gauge("ws_connections", "Активные WebSocket-подключения", collect=lambda: len(manager.connections))
+registry.gauge(
+    "ws_queue_depth", "Сообщения в очередях WebSocket-клиентов",
+    collect=lambda: sum(len(connection.queue) for connection in manager.connections.values())
+)
@@ -0,0 +1,84 @@
+"""Поиск курса на момент времени: series_store.as_of и POST /api/v1/rates/asof.
+
+История - `points` курсов на валюту с шагом в час, запросы - `queries`
+случайных моментов по всем валютам (и по одной валюте).
+
+    python -m benchmarks.bench_asof --points 50000 --queries 100000 --repeat 10
+"""
+import argparse
+import asyncio
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+import httpx
+import numpy as np
+
+from benchmarks.common import latency_metrics, measure, metric, reset_database, use_temp_database
+
+CODES = ["USD", "EUR", "CNY", "GBP", "JPY", "CHF", "TRY", "KZT"]
+
+async def seed(points: int, start: datetime):
+    from app.db.database import AsyncSessionLocal
+    from app.services.cbr_xml import RateRecord
+    from app.services.parser import CurrencyParser
+
+    await reset_database()
+    async with AsyncSessionLocal() as db:
+        parser = CurrencyParser(db)
+        for offset in range(0, points, 10_000):
+            await parser.save_rates_bulk([
+                RateRecord(code, code, 10 + i + hour * 0.001, start + timedelta(hours=hour))
+                for hour in range(offset, min(points, offset + 10_000))
+                for i, code in enumerate(CODES)
+            ], source_dates=True)
+
+async def run(points: int = 50_000, queries: int = 100_000, repeat: int = 10) -> Dict[str, Any]:
+    from app.db.database import ReadSessionLocal
+    from app.main import app
+    from app.services.series import series_store
+
+    start = datetime(2020, 1, 1)
+    await seed(points, start)
+
+    rng = random.Random(1)
+    moments = [start + timedelta(minutes=rng.randint(-60, points * 60)) for _ in range(queries)]
+    codes = [rng.choice(CODES) for _ in range(queries)]
+    timestamps = np.array(moments, dtype="datetime64[us]")
+
+    async with ReadSessionLocal() as db:
+        # Первый вызов загружает истории валют в память
+        build = await measure(lambda: series_store.as_of(db, CODES, timestamps[:len(CODES)]), 1)
+        mixed = await measure(lambda: series_store.as_of(db, codes, timestamps), repeat)
+        single = await measure(lambda: series_store.as_of(db, ["USD"], timestamps), repeat)
+
+    body = {"code": codes, "at": [moment.isoformat() for moment in moments]}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+        async def batch():
+            response = await client.post("/api/v1/rates/asof", json=body)
+            response.raise_for_status()
+
+        http = await measure(batch, repeat)
+
+    return {
+        "index_build_ms": metric(build[0] * 1000, "ms"),
+        **latency_metrics("lookup_mixed", mixed),
+        "lookup_mixed_per_s": metric(queries / min(mixed), "lookups/s", "higher"),
+        **latency_metrics("lookup_single", single),
+        **latency_metrics("http_batch", http)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=50_000, help="Курсов в истории каждой валюты")
+    parser.add_argument("--queries", type=int, default=100_000, help="Моментов в пакете")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    use_temp_database(args.database_url)
+    print(json.dumps(asyncio.run(run(args.points, args.queries, args.repeat)), indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
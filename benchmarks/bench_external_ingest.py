@@ -0,0 +1,111 @@
+"""Пропускная способность приёма внешних курсов из NATS.
+
+    python -m benchmarks.bench_external_ingest --messages 50000 --currencies 50
+    python -m benchmarks.bench_external_ingest --nats-url nats://localhost:4222
+
+Без --nats-url сообщения идут через InMemoryBroker (замер самого
+конвейера: очередь, проверка, пачки, запись в БД). БД - временный
+SQLite-файл, если не указан --database-url.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, Optional
+
+from benchmarks.common import metric, reset_database, use_temp_database
+
+def build_messages(count: int, currencies: int, per_message: int, invalid_ratio: float):
+    codes = ["".join(chr(65 + (i // 26 ** k) % 26) for k in (2, 1, 0)) for i in range(currencies)]
+    rng = random.Random(42)
+    messages = []
+    for _ in range(count):
+        if rng.random() < invalid_ratio:
+            messages.append(b'{"code": "??", "rate": -1}')
+            continue
+        items = [
+            {"code": rng.choice(codes), "rate": round(rng.uniform(1, 200), 4), "nominal": 1}
+            for _ in range(per_message)
+        ]
+        payload = items[0] if per_message == 1 else {"rates": items}
+        messages.append(json.dumps(payload).encode())
+    return messages
+
+async def run(
+    messages: int = 50_000,
+    currencies: int = 50,
+    per_message: int = 1,
+    invalid_ratio: float = 0.01,
+    batch_size: int = 500,
+    batch_interval: float = 0.1,
+    queue_size: int = 10_000,
+    concurrency: int = 4,
+    nats_url: Optional[str] = None
+) -> Dict[str, Any]:
+    from app.config import settings
+    from app.nats.cluster import BrokerMessage, InMemoryBroker
+    from app.nats.ingest import ExternalRateIngestor
+
+    await reset_database()
+    if nats_url:
+        from app.nats.client import nats_client
+        await nats_client.connect(nats_url)
+        broker = nats_client
+    else:
+        broker = InMemoryBroker()
+
+    ingestor = ExternalRateIngestor(
+        batch_size=batch_size,
+        batch_interval=batch_interval,
+        queue_size=queue_size,
+        concurrency=concurrency
+    )
+    if not await ingestor.start(broker):
+        raise SystemExit("Нет подписки на тему внешних курсов")
+
+    payloads = build_messages(messages, currencies, per_message, invalid_ratio)
+    started = time.perf_counter()
+    if nats_url:
+        for data in payloads:
+            await broker.nc.publish(settings.nats_subject_external, data)
+        await broker.nc.flush()
+        while ingestor.received_total < len(payloads):
+            await asyncio.sleep(0.01)
+    else:
+        callback = ingestor.handle_message
+        for data in payloads:
+            await callback(BrokerMessage(settings.nats_subject_external, data))
+    await ingestor.stop(timeout=60)
+    elapsed = time.perf_counter() - started
+
+    if nats_url:
+        await broker.disconnect()
+
+    stats = ingestor.stats()
+    print(
+        f"{len(payloads)} сообщений за {elapsed:.2f} с: {len(payloads) / elapsed:,.0f} сообщений/с; "
+        f"пачек {stats['batches_total']}, записано курсов {stats['saved_total']}, "
+        f"изменений {stats['changes_total']}, отклонено {stats['rejected_total']}"
+    )
+    return {"messages_per_s": metric(len(payloads) / elapsed, "msg/s", "higher")}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--currencies", type=int, default=50)
+    parser.add_argument("--per-message", type=int, default=1)
+    parser.add_argument("--invalid-ratio", type=float, default=0.01)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--batch-interval", type=float, default=0.1)
+    parser.add_argument("--queue-size", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--nats-url", default=None)
+    parser.add_argument("--database-url", default=None)
+    args = vars(parser.parse_args())
+
+    use_temp_database(args.pop("database_url"))
+    asyncio.run(run(**args))
+
+if __name__ == "__main__":
+    main()
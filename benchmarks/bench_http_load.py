@@ -0,0 +1,156 @@
+"""Нагрузочный сценарий HTTP: чтение курсов и CRUD валют.
+
+    python -m benchmarks.bench_http_load --concurrency 32 --duration 10
+    python -m benchmarks.bench_http_load --target http://localhost:8000 --no-crud
+    python -m benchmarks.bench_http_load --no-crud --conditional   # опрос с If-None-Match
+
+Без --target приложение поднимается в этом же процессе через uvicorn на
+временной БД (без NATS и планировщика), заполненной курсами заглушки ЦБ РФ.
+Клиент и сервер делят один event loop, поэтому абсолютные числа ниже,
+чем у отдельного сервера, но подходят для сравнения с базовой линией.
+"""
+import argparse
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.common import latency_metrics, metric, reset_database, serve, use_temp_database
+from benchmarks.mock_cbr import build_daily_xml
+
+READ_OPERATIONS = [
+    ("list_currencies", "GET", "/api/v1/currencies"),
+    ("get_currency", "GET", "/api/v1/currencies/1"),
+    ("latest_rates", "GET", "/api/v1/rates/latest"),
+    ("latest_rate", "GET", "/api/v1/rates/latest/USD"),
+    ("rates_history", "GET", "/api/v1/rates?code=USD&limit=100"),
+]
+
+async def seed(days: int, valutes: int):
+    from app.db.database import AsyncSessionLocal
+    from app.services.cbr_xml import iter_rate_records
+    from app.services.parser import CurrencyParser
+
+    await reset_database()
+    async with AsyncSessionLocal() as db:
+        parser = CurrencyParser(db)
+        start = date(2024, 1, 1)
+        for i in range(days):
+            day = start + timedelta(days=i)
+            rates = list(iter_rate_records([build_daily_xml(day, valutes)]))
+            await parser.save_rates_bulk([rate._replace(date=day) for rate in rates], source_dates=True)
+        # Последний день ещё раз как текущие курсы - для снимка /rates/latest
+        await parser.save_rates_bulk(rates)
+
+@asynccontextmanager
+async def local_app():
+    from app.main import app
+
+    async with serve(app) as base_url:
+        yield base_url
+
+async def worker(
+    client: httpx.AsyncClient,
+    worker_id: int,
+    deadline: float,
+    crud: bool,
+    conditional: bool,
+    samples: Dict[str, List[float]],
+    errors: Dict[str, int],
+    statuses: Dict[int, int]
+):
+    async def call(name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            errors[name] = errors.get(name, 0) + 1
+            return None
+        samples.setdefault(name, []).append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code >= 400:
+            errors[name] = errors.get(name, 0) + 1
+        return response
+
+    # Как опрашивающий клиент: повторный запрос с ETag прошлого ответа
+    etags: Dict[str, str] = {}
+    iteration = 0
+    while time.perf_counter() < deadline:
+        for name, method, url in READ_OPERATIONS:
+            headers = {"If-None-Match": etags[url]} if conditional and url in etags else None
+            response = await call(name, method, url, headers=headers)
+            if response is not None and response.headers.get("ETag"):
+                etags[url] = response.headers["ETag"]
+        if crud:
+            # Код уникален для воркера, валюта удаляется в конце итерации
+            code = "Q" + chr(65 + worker_id % 26) + chr(65 + iteration % 26)
+            response = await call("create_currency", "POST", "/api/v1/currencies", json={"code": code, "name": "Bench"})
+            if response is not None and response.status_code == 200:
+                currency_id = response.json()["id"]
+                await call("update_currency", "PATCH", f"/api/v1/currencies/{currency_id}", json={"name": "Bench 2"})
+                await call("delete_currency", "DELETE", f"/api/v1/currencies/{currency_id}")
+        iteration += 1
+
+async def run(
+    concurrency: int = 16,
+    duration: float = 5.0,
+    crud: bool = True,
+    conditional: bool = False,
+    target: Optional[str] = None,
+    days: int = 30,
+    valutes: int = 43
+) -> Dict[str, Any]:
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    statuses: Dict[int, int] = {}
+
+    async def load(base_url: str) -> float:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            started = time.perf_counter()
+            deadline = started + duration
+            await asyncio.gather(*(
+                worker(client, i, deadline, crud, conditional, samples, errors, statuses) for i in range(concurrency)
+            ))
+            return time.perf_counter() - started
+
+    if target:
+        elapsed = await load(target)
+    else:
+        await seed(days, valutes)
+        async with local_app() as base_url:
+            elapsed = await load(base_url)
+
+    total = sum(len(values) for values in samples.values())
+    results = {
+        "requests_per_s": metric(total / elapsed, "req/s", "higher"),
+        "error_ratio": metric(sum(errors.values()) / max(total, 1), "ratio")
+    }
+    if conditional:
+        results["not_modified_ratio"] = metric(statuses.get(304, 0) / max(total, 1), "ratio", "higher")
+    for name, values in samples.items():
+        results.update(latency_metrics(name, values))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--no-crud", action="store_true", help="Только чтение")
+    parser.add_argument("--conditional", action="store_true", help="Повторные запросы с If-None-Match")
+    parser.add_argument("--target", default=None, help="URL уже запущенного сервера")
+    parser.add_argument("--days", type=int, default=30, help="Дней истории в локальной БД")
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    if not args.target:
+        use_temp_database(args.database_url)
+    results = asyncio.run(run(args.concurrency, args.duration, not args.no_crud, args.conditional, args.target, args.days))
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Запись курсов и полный цикл fetch_rates против локальной заглушки ЦБ РФ.
+
+    python -m benchmarks.bench_save_rates --valutes 1000 --repeat 20 --latency 0.02
+"""
+import argparse
+import asyncio
+import json
+from datetime import date, timedelta
+from typing import Any, Dict
+
+from benchmarks.common import latency_metrics, measure, metric, reset_database, serve, use_temp_database
+from benchmarks.mock_cbr import build_daily_xml, create_app
+
+async def run(valutes: int = 1000, repeat: int = 20, latency: float = 0.0) -> Dict[str, Any]:
+    from app.config import settings
+    from app.db.database import AsyncSessionLocal
+    from app.services.cbr_xml import iter_rate_records
+    from app.services.parser import CurrencyParser
+
+    await reset_database()
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(repeat)]
+    documents = [list(iter_rate_records([build_daily_xml(day, valutes)])) for day in days]
+
+    async def save(rates, only_changed: bool):
+        async with AsyncSessionLocal() as db:
+            await CurrencyParser(db).save_rates_bulk(rates, only_changed=only_changed)
+
+    # Первая запись добавляет валюты, дальше - только курсы
+    await save(documents[0], False)
+    iterator = iter(documents)
+    full = await measure(lambda: save(next(iterator), False), repeat)
+    # Повтор последнего документа: с only_changed ничего не пишется
+    unchanged = await measure(lambda: save(documents[-1], True), repeat)
+
+    results = {
+        **latency_metrics("save_full", full),
+        "save_full_rows_per_s": metric(valutes / min(full), "rows/s", "higher"),
+        **latency_metrics("save_unchanged", unchanged)
+    }
+
+    mock = create_app(valutes, latency)
+    async with serve(mock) as base_url:
+        url = f"{base_url}/scripts/XML_daily.asp"
+        previous_url = settings.cbr_url
+        settings.cbr_url = url
+        try:
+            async def fetch(force: bool):
+                async with AsyncSessionLocal() as db:
+                    await CurrencyParser(db).fetch_rates(force=force)
+
+            results.update(latency_metrics("fetch_full", await measure(lambda: fetch(True), repeat)))
+            # Валидаторы запоминаются после сохранения, дальше заглушка отвечает 304
+            async with AsyncSessionLocal() as db:
+                parser = CurrencyParser(db)
+                await parser.save_rates_bulk(await parser.fetch_rates(force=True), only_changed=True)
+            results.update(latency_metrics("fetch_not_modified", await measure(lambda: fetch(False), repeat)))
+        finally:
+            settings.cbr_url = previous_url
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--valutes", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка заглушки ЦБ РФ, секунды")
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    use_temp_database(args.database_url)
+    print(json.dumps(asyncio.run(run(args.valutes, args.repeat, args.latency)), indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Задержка POST /api/v1/tasks/run при сбоях ЦБ РФ (заглушка с инъекцией сбоев).
+
+Фазы: штатная работа, доля ответов 5xx, зависания источника и полный отказ.
+При полном отказе после нескольких запусков размыкается предохранитель,
+и endpoint отвечает 503 сразу, не дожидаясь таймаутов.
+
+    python -m benchmarks.bench_upstream_faults --runs 20 --hang-seconds 5
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.common import latency_metrics, metric, reset_database, serve, use_temp_database
+from benchmarks.mock_cbr import FaultInjector, create_app
+
+PHASES = [
+    ("healthy", {}),
+    ("errors", {"error_rate": 0.3}),
+    ("hangs", {"hang_rate": 0.3}),
+    ("outage", {"error_rate": 1.0})
+]
+
+async def run(runs: int = 20, hang_seconds: float = 5.0, deadline: float = 2.0) -> Dict[str, Any]:
+    from app.config import settings
+    from app.main import app
+    from app.services import resilience
+
+    await reset_database()
+    faults = FaultInjector(seed=1, hang_seconds=hang_seconds)
+    previous = {
+        name: getattr(settings, name)
+        for name in ("cbr_url", "upstream_timeout", "upstream_deadline", "upstream_backoff_base", "upstream_breaker_reset")
+    }
+    results: Dict[str, Any] = {}
+    async with serve(create_app(faults=faults)) as mock_url:
+        settings.cbr_url = f"{mock_url}/scripts/XML_daily.asp"
+        # Уменьшенные таймауты, чтобы фаза с зависаниями укладывалась в секунды
+        settings.upstream_timeout = deadline / 3
+        settings.upstream_deadline = deadline
+        settings.upstream_backoff_base = 0.05
+        settings.upstream_breaker_reset = 3600.0
+        resilience._breakers.clear()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+                for phase, fault_settings in PHASES:
+                    faults.configure(**{"error_rate": 0.0, "hang_rate": 0.0, **fault_settings})
+                    samples: List[float] = []
+                    statuses: Dict[int, int] = {}
+                    for _ in range(runs):
+                        started = time.perf_counter()
+                        response = await client.post("/api/v1/tasks/run", params={"force": "true"})
+                        samples.append(time.perf_counter() - started)
+                        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    results.update(latency_metrics(f"task_{phase}", samples))
+                    results[f"task_{phase}_ok_ratio"] = metric(statuses.get(200, 0) / runs, "ratio", "higher")
+        finally:
+            for name, value in previous.items():
+                setattr(settings, name, value)
+            resilience._breakers.clear()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20, help="Запусков парсинга в каждой фазе")
+    parser.add_argument("--hang-seconds", type=float, default=5.0, help="Сколько висит зависший запрос")
+    parser.add_argument("--deadline", type=float, default=2.0, help="UPSTREAM_DEADLINE на время замера")
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    use_temp_database(args.database_url)
+    print(json.dumps(asyncio.run(run(args.runs, args.hang_seconds, args.deadline)), indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
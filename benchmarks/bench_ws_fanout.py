@@ -0,0 +1,110 @@
+"""Рассылка WebSocket-событий тысячам клиентов через ConnectionManager.
+
+    python -m benchmarks.bench_ws_fanout --clients 5000 --events 50
+
+Клиенты - объекты с интерфейсом WebSocket в этом же процессе: замеряется
+сам менеджер (очереди, подписки, сериализация, задачи отправки), без
+сетевого стека. Половина клиентов без подписок, остальные подписаны на
+1-3 кода валют и получают суженные события.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from benchmarks.common import latency_metrics, metric
+
+class FakeWebSocket:
+    __slots__ = ("received", "send_delay", "on_receive")
+
+    def __init__(self, send_delay: float, on_receive):
+        self.received = 0
+        self.send_delay = send_delay
+        self.on_receive = on_receive
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.received += 1
+        self.on_receive()
+
+    async def close(self, code: int = 1000):
+        pass
+
+async def run(clients: int = 2000, events: int = 50, currencies: int = 43, send_delay: float = 0.0) -> Dict[str, Any]:
+    from app.websocket.manager import ConnectionManager
+
+    rng = random.Random(7)
+    codes = [f"C{i:02d}" for i in range(currencies)]
+    manager = ConnectionManager(queue_size=events + 10)
+    pending = 0
+    drained = asyncio.Event()
+
+    def on_receive():
+        nonlocal pending
+        pending -= 1
+        if pending <= 0:
+            drained.set()
+
+    sockets = []
+    for i in range(clients):
+        websocket = FakeWebSocket(send_delay, on_receive)
+        await manager.connect(websocket)
+        if i % 2:
+            manager.subscribe(manager.connections[websocket], rng.sample(codes, rng.randint(1, 3)))
+        sockets.append(websocket)
+
+    broadcast_samples: List[float] = []
+    delivery_samples: List[float] = []
+    delivered = 0
+    started_total = time.perf_counter()
+    for _ in range(events):
+        changed = rng.sample(codes, 5)
+        message = {
+            "type": "rates_updated",
+            "data": {
+                "rates_count": len(changed),
+                "changes": [{"code": code, "old": 1.0, "new": rng.uniform(1, 100)} for code in changed]
+            }
+        }
+        before = sum(len(connection.queue) for connection in manager.connections.values())
+        started = time.perf_counter()
+        await manager.broadcast(message, codes=changed)
+        broadcast_samples.append(time.perf_counter() - started)
+
+        queued = sum(len(connection.queue) for connection in manager.connections.values()) - before
+        pending += queued
+        delivered += queued
+        if pending > 0:
+            drained.clear()
+            await drained.wait()
+        delivery_samples.append(time.perf_counter() - started)
+    elapsed = time.perf_counter() - started_total
+
+    for websocket in sockets:
+        manager.disconnect(websocket)
+
+    return {
+        **latency_metrics("broadcast", broadcast_samples),
+        **latency_metrics("delivery", delivery_samples),
+        "messages_per_s": metric(delivered / elapsed, "msg/s", "higher"),
+        "dropped_total": metric(manager.dropped_total, "messages")
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--currencies", type=int, default=43)
+    parser.add_argument("--send-delay", type=float, default=0.0, help="Задержка отправки одного сообщения, секунды")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.clients, args.events, args.currencies, args.send_delay))
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
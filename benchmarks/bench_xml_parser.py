@@ -0,0 +1,75 @@
+"""Сравнение потокового парсера XML ЦБ РФ с прежней реализацией.
+
+    python -m benchmarks.bench_xml_parser --rows 100000
+"""
+import argparse
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from datetime import date
+from typing import Any, Dict
+
+from app.services.cbr_xml import iter_rate_records
+from benchmarks.common import metric
+from benchmarks.mock_cbr import build_daily_xml
+
+def legacy_parse(content: bytes):
+    """Прежний разбор из CurrencyParser.fetch_rates: весь текст + find() x4 + dict"""
+    root = ET.fromstring(content.decode("windows-1251"))
+    rates = []
+    for valute in root.findall('Valute'):
+        code = valute.find('CharCode').text
+        name = valute.find('Name').text
+        value_str = valute.find('Value').text.replace(',', '.')
+        nominal = int(valute.find('Nominal').text)
+        rates.append({"code": code, "name": name, "rate": float(value_str) / nominal})
+    return rates
+
+def streaming_parse(content: bytes, chunk_size: int):
+    chunks = (content[i:i + chunk_size] for i in range(0, len(content), chunk_size))
+    return list(iter_rate_records(chunks))
+
+def measure(func, *args, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(result), best, peak
+
+def run(rows: int = 100_000, chunk_size: int = 64 * 1024, repeat: int = 3) -> Dict[str, Any]:
+    """Только потоковый парсер - для сравнения с базовой линией в benchmarks.suite"""
+    content = build_daily_xml(date(2024, 1, 10), rows)
+    count, elapsed, peak = measure(streaming_parse, content, chunk_size, repeat=repeat)
+    return {
+        "parse_ms": metric(elapsed * 1000, "ms"),
+        "parse_rows_per_s": metric(count / elapsed, "rows/s", "higher"),
+        "parse_peak_mb": metric(peak / 1024 / 1024, "MB")
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = build_daily_xml(date(2024, 1, 10), args.rows)
+    print(f"Документ: {args.rows} строк, {len(content) / 1024 / 1024:.1f} МБ")
+
+    results = {
+        "legacy": measure(legacy_parse, content, repeat=args.repeat),
+        "streaming": measure(streaming_parse, content, args.chunk_size, repeat=args.repeat)
+    }
+    for name, (rows, elapsed, peak) in results.items():
+        print(
+            f"{name:>10}: {rows} записей, {elapsed * 1000:.1f} мс, "
+            f"{rows / elapsed:,.0f} записей/с, пик памяти {peak / 1024 / 1024:.1f} МБ"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Общие части бенчмарков: временная БД, статистика замеров, запуск ASGI-приложений.
+
+Настройки приложения читаются при импорте app.config, поэтому
+use_temp_database() нужно вызвать до первого импорта модулей app.
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+def use_temp_database(database_url: Optional[str] = None) -> str:
+    if not database_url:
+        path = os.path.join(tempfile.mkdtemp(prefix="currency_bench_"), "bench.db")
+        database_url = f"sqlite+aiosqlite:///{path}"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("DB_ECHO", "false")
+    return database_url
+
+async def reset_database():
+    """Пустые таблицы и сброшенные кэши - каждый сценарий начинает с нуля"""
+    from app.db.database import Base, engine
+    from app.services.anomaly import anomaly_detector
+    from app.services.series import series_store
+    from app.services.snapshot import snapshot_store
+    from app.db.database import AsyncSessionLocal
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        await snapshot_store.seed(db)
+    series_store.invalidate()
+    anomaly_detector.invalidate()
+
+def metric(value: float, unit: str, better: str = "lower") -> Dict[str, Any]:
+    return {"value": round(value, 6), "unit": unit, "better": better}
+
+def latency_metrics(prefix: str, samples: List[float]) -> Dict[str, Dict[str, Any]]:
+    """Медиана и p95 в миллисекундах"""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        f"{prefix}_p50_ms": metric(statistics.median(ordered) * 1000, "ms"),
+        f"{prefix}_p95_ms": metric(p95 * 1000, "ms")
+    }
+
+async def measure(func: Callable[[], Awaitable[Any]], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+@asynccontextmanager
+async def serve(app, host: str = "127.0.0.1"):
+    """Запускает ASGI-приложение через uvicorn в текущем цикле; отдаёт базовый URL"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=0, log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://{host}:{port}"
+    finally:
+        server.should_exit = True
+        await task
@@ -0,0 +1,283 @@
+"""Локальная заглушка сервера ЦБ РФ для backfill и бенчмарков.
+
+Отдаёт XML_daily.asp в кодировке windows-1251 с детерминированными курсами
+на запрошенную дату (date_req=DD/MM/YYYY). Как и настоящий ЦБ, на выходные
+возвращает курсы последнего рабочего дня.
+
+Рядом отдаются ECB-подобный eurofxref-daily.xml и JSON-источник
+(/latest.json?base=USD) с согласованными кросс-курсами, чтобы проверять
+опрос нескольких источников.
+
+Для проверки устойчивости к сбоям заглушка умеет отвечать ошибкой 5xx,
+зависать и отдавать битый XML с заданной вероятностью. Настройки можно
+менять на лету: POST /__faults {"error_rate": 0.5, "fail_next": 3}.
+
+    python -m benchmarks.mock_cbr --port 8001 --valutes 40 --latency 0.05
+    python -m benchmarks.mock_cbr --error-rate 0.3 --hang-rate 0.1 --hang-seconds 30
+"""
+import argparse
+import asyncio
+import json
+import random
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+
+from fastapi import Body, FastAPI, Header, Response
+
+VALUTES = [
+    ("036", "AUD", 1, "Австралийский доллар"),
+    ("944", "AZN", 1, "Азербайджанский манат"),
+    ("826", "GBP", 1, "Фунт стерлингов Соединенного королевства"),
+    ("051", "AMD", 100, "Армянских драмов"),
+    ("933", "BYN", 1, "Белорусский рубль"),
+    ("975", "BGN", 1, "Болгарский лев"),
+    ("986", "BRL", 1, "Бразильский реал"),
+    ("348", "HUF", 100, "Венгерских форинтов"),
+    ("704", "VND", 10000, "Вьетнамских донгов"),
+    ("344", "HKD", 1, "Гонконгский доллар"),
+    ("981", "GEL", 1, "Грузинский лари"),
+    ("208", "DKK", 1, "Датская крона"),
+    ("784", "AED", 1, "Дирхам ОАЭ"),
+    ("840", "USD", 1, "Доллар США"),
+    ("978", "EUR", 1, "Евро"),
+    ("818", "EGP", 10, "Египетских фунтов"),
+    ("356", "INR", 10, "Индийских рупий"),
+    ("360", "IDR", 10000, "Индонезийских рупий"),
+    ("398", "KZT", 100, "Казахстанских тенге"),
+    ("124", "CAD", 1, "Канадский доллар"),
+    ("634", "QAR", 1, "Катарский риал"),
+    ("417", "KGS", 10, "Киргизских сомов"),
+    ("156", "CNY", 1, "Китайский юань"),
+    ("498", "MDL", 10, "Молдавских леев"),
+    ("554", "NZD", 1, "Новозеландский доллар"),
+    ("578", "NOK", 10, "Норвежских крон"),
+    ("985", "PLN", 1, "Польский злотый"),
+    ("946", "RON", 1, "Румынский лей"),
+    ("960", "XDR", 1, "СДР (специальные права заимствования)"),
+    ("702", "SGD", 1, "Сингапурский доллар"),
+    ("972", "TJS", 10, "Таджикских сомони"),
+    ("764", "THB", 10, "Таиландских батов"),
+    ("949", "TRY", 10, "Турецких лир"),
+    ("934", "TMT", 1, "Новый туркменский манат"),
+    ("860", "UZS", 10000, "Узбекских сумов"),
+    ("980", "UAH", 10, "Украинских гривен"),
+    ("203", "CZK", 10, "Чешских крон"),
+    ("752", "SEK", 10, "Шведских крон"),
+    ("756", "CHF", 1, "Швейцарский франк"),
+    ("941", "RSD", 100, "Сербских динаров"),
+    ("710", "ZAR", 10, "Южноафриканских рэндов"),
+    ("410", "KRW", 1000, "Вон Республики Корея"),
+    ("392", "JPY", 100, "Японских иен"),
+]
+
+def valute_list(count: int):
+    """Реальный список валют, дополненный синтетическими кодами до `count`"""
+    valutes = VALUTES[:count]
+    for i in range(count - len(valutes)):
+        char_code = "X" + chr(65 + i // 26 % 26) + chr(65 + i % 26)
+        valutes.append((f"{i % 1000:03d}", char_code, 1, f"Валюта {i}"))
+    return valutes
+
+def business_day(day: date) -> date:
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+# Валюты, которых нет у ЦБ РФ: их отдаёт только JSON-источник
+EXTRA_CODES = ["MXN", "ILS", "PHP", "ISK"]
+
+def daily_values(day: date, count: int = len(VALUTES)):
+    """Детерминированные курсы на дату: (num_code, char_code, nominal, name, рублей за nominal)"""
+    rng = random.Random(day.toordinal())
+    return [
+        (num_code, char_code, nominal, name, (10 + (i * 7.3) % 90) * (1 + rng.uniform(-0.02, 0.02)))
+        for i, (num_code, char_code, nominal, name) in enumerate(valute_list(count))
+    ]
+
+def unit_rates(day: date, count: int = len(VALUTES)) -> Dict[str, float]:
+    """Рублей за 1 единицу валюты, округлённые как в XML_daily"""
+    return {
+        char_code: round(value, 4) / nominal
+        for _, char_code, nominal, _, value in daily_values(day, max(count, len(VALUTES)))
+    }
+
+def build_daily_xml(day: date, count: int = len(VALUTES)) -> bytes:
+    """Собирает документ XML_daily на дату в кодировке windows-1251"""
+    parts = [
+        '<?xml version="1.0" encoding="windows-1251"?>',
+        f'<ValCurs Date="{day.strftime("%d.%m.%Y")}" name="Foreign Currency Market">'
+    ]
+    for i, (num_code, char_code, nominal, name, value) in enumerate(daily_values(day, count)):
+        value_str = f"{value:.4f}".replace(".", ",")
+        parts.append(
+            f'<Valute ID="R{i:05d}"><NumCode>{num_code}</NumCode><CharCode>{char_code}</CharCode>'
+            f'<Nominal>{nominal}</Nominal><Name>{name}</Name><Value>{value_str}</Value>'
+            f'<VunitRate>{value_str}</VunitRate></Valute>'
+        )
+    parts.append('</ValCurs>')
+    return "".join(parts).encode("windows-1251")
+
+def build_ecb_xml(day: date, count: int = len(VALUTES)) -> bytes:
+    """eurofxref-daily.xml: единиц валюты за 1 евро, кросс-курсы согласованы с XML_daily"""
+    rates = unit_rates(day, count)
+    eur = rates["EUR"]
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<gesmes:Envelope xmlns:gesmes="http://www.gesmes.org/xml/2002-08-01" '
+        'xmlns="http://www.ecb.int/vocabulary/2002-08-01/eurofxref">',
+        '<gesmes:subject>Reference rates</gesmes:subject>',
+        f'<Cube><Cube time="{day.isoformat()}">'
+    ]
+    for code, value in rates.items():
+        if code != "EUR":
+            parts.append(f'<Cube currency="{code}" rate="{eur / value:.4f}"/>')
+    parts.append('</Cube></Cube></gesmes:Envelope>')
+    return "".join(parts).encode()
+
+def build_rates_json(day: date, base: str = "USD", count: int = len(VALUTES)) -> bytes:
+    """JSON-источник: единиц валюты за 1 base, включая RUB и валюты из EXTRA_CODES"""
+    rates = unit_rates(day, count)
+    rng = random.Random(-day.toordinal())
+    for code in EXTRA_CODES:
+        rates[code] = rng.uniform(1, 50)
+    rates["RUB"] = 1.0
+    base_rub = rates[base]
+    return json.dumps({
+        "base": base,
+        "date": day.isoformat(),
+        "rates": {code: round(base_rub / value, 6) for code, value in rates.items() if code != base}
+    }).encode()
+
+class FaultInjector:
+    """Сбои заглушки: доли запросов с ошибкой, зависанием и битым XML.
+
+    fail_next - сколько ближайших запросов гарантированно ответят ошибкой
+    (удобно для детерминированной проверки повторов и предохранителя).
+    """
+
+    FIELDS = ("error_rate", "error_status", "hang_rate", "hang_seconds", "garbage_rate", "fail_next")
+
+    def __init__(self, seed: Optional[int] = None, **settings):
+        self.error_rate = 0.0
+        self.error_status = 503
+        self.hang_rate = 0.0
+        self.hang_seconds = 30.0
+        self.garbage_rate = 0.0
+        self.fail_next = 0
+        self.rng = random.Random(seed)
+        self.counters = {"requests": 0, "errors": 0, "hangs": 0, "garbage": 0}
+        self.configure(**settings)
+
+    def configure(self, **settings):
+        for name, value in settings.items():
+            if name not in self.FIELDS:
+                raise ValueError(f"Неизвестная настройка сбоев: {name}")
+            setattr(self, name, value)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**{name: getattr(self, name) for name in self.FIELDS}, "counters": dict(self.counters)}
+
+    async def apply(self) -> Optional[Response]:
+        """Ответ-сбой для текущего запроса или None, если отвечать штатно"""
+        self.counters["requests"] += 1
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            self.counters["errors"] += 1
+            return Response(status_code=self.error_status)
+        roll = self.rng.random()
+        if roll < self.error_rate:
+            self.counters["errors"] += 1
+            return Response(status_code=self.error_status)
+        roll -= self.error_rate
+        if roll < self.hang_rate:
+            self.counters["hangs"] += 1
+            await asyncio.sleep(self.hang_seconds)
+            return None
+        roll -= self.hang_rate
+        if roll < self.garbage_rate:
+            self.counters["garbage"] += 1
+            return Response(content=b"<ValCurs><Valute>", media_type="application/xml")
+        return None
+
+def create_app(valutes: int = len(VALUTES), latency: float = 0.0, faults: Optional[FaultInjector] = None) -> FastAPI:
+    app = FastAPI(title="Mock CBR")
+    app.state.faults = faults = faults or FaultInjector()
+
+    @app.get("/__faults")
+    async def get_faults():
+        return faults.as_dict()
+
+    @app.post("/__faults")
+    async def set_faults(settings: Dict[str, Any] = Body(...)):
+        try:
+            faults.configure(**settings)
+        except ValueError as e:
+            return Response(status_code=400, content=str(e))
+        return faults.as_dict()
+
+    async def delay_or_fault() -> Optional[Response]:
+        if latency:
+            await asyncio.sleep(latency)
+        return await faults.apply()
+
+    def conditional(feed: str, day: date, media_type: str, build, if_none_match: Optional[str]) -> Response:
+        etag = f'"{feed}{day.isoformat()}-{valutes}"'
+        if if_none_match == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=build(), media_type=media_type, headers={"ETag": etag})
+
+    @app.get("/scripts/XML_daily.asp")
+    async def xml_daily(date_req: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+        failure = await delay_or_fault()
+        if failure is not None:
+            return failure
+        day = business_day(datetime.strptime(date_req, "%d/%m/%Y").date() if date_req else date.today())
+        return conditional(
+            "", day, "application/xml; charset=windows-1251", lambda: build_daily_xml(day, valutes), if_none_match
+        )
+
+    @app.get("/stats/eurofxref/eurofxref-daily.xml")
+    async def ecb_daily(if_none_match: Optional[str] = Header(None)):
+        failure = await delay_or_fault()
+        if failure is not None:
+            return failure
+        day = business_day(date.today())
+        return conditional("ecb-", day, "application/xml", lambda: build_ecb_xml(day, valutes), if_none_match)
+
+    @app.get("/latest.json")
+    async def latest_json(base: str = "USD", if_none_match: Optional[str] = Header(None)):
+        failure = await delay_or_fault()
+        if failure is not None:
+            return failure
+        day = business_day(date.today())
+        base = base.upper()
+        return conditional(
+            f"json-{base}-", day, "application/json", lambda: build_rates_json(day, base, valutes), if_none_match
+        )
+
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Локальная заглушка ЦБ РФ")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--valutes", type=int, default=len(VALUTES), help="Количество валют в ответе")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, секунды")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 5xx")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Доля зависающих запросов")
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--garbage-rate", type=float, default=0.0, help="Доля ответов с битым XML")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    faults = FaultInjector(
+        args.seed,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        garbage_rate=args.garbage_rate
+    )
+    uvicorn.run(create_app(args.valutes, args.latency, faults), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,184 @@
+"""Набор бенчмарков с машиночитаемым результатом и сравнением с базовой линией.
+
+    python -m benchmarks.suite                                  # все сценарии, профиль quick
+    python -m benchmarks.suite --profile full --output results.json
+    python -m benchmarks.suite --only xml_parse,save_rates --baseline benchmarks/baseline.json
+    python -m benchmarks.suite --update-baseline                # перезаписать benchmarks/baseline.json
+
+При сравнении метрика считается регрессией, если ухудшилась больше чем на
+--tolerance (доля). Для задержек в миллисекундах разница меньше
+--min-delta-ms не учитывается - это шум. Хвостовые задержки (p95) сильно
+зависят от загрузки машины, поэтому показываются, но регрессией считаются
+только с --include-tail. При регрессиях код выхода 1.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Any, Dict, List
+
+from benchmarks.common import use_temp_database
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Параметры сценариев для профилей: quick - для проверки изменений, full - для замеров
+PROFILES = {
+    "quick": {
+        "xml_parse": {"rows": 20_000, "repeat": 3},
+        "save_rates": {"valutes": 500, "repeat": 10, "latency": 0.0},
+        "external_ingest": {"messages": 20_000},
+        "http_load": {"concurrency": 16, "duration": 3.0},
+        "http_poll": {"concurrency": 16, "duration": 3.0, "crud": False, "conditional": True},
+        "ws_fanout": {"clients": 2000, "events": 20},
+        "upstream_faults": {"runs": 10, "hang_seconds": 5.0, "deadline": 1.0},
+        "asof_lookup": {"points": 20_000, "queries": 100_000, "repeat": 5}
+    },
+    "full": {
+        "xml_parse": {"rows": 100_000, "repeat": 5},
+        "save_rates": {"valutes": 2000, "repeat": 30, "latency": 0.0},
+        "external_ingest": {"messages": 100_000},
+        "http_load": {"concurrency": 64, "duration": 15.0},
+        "http_poll": {"concurrency": 64, "duration": 15.0, "crud": False, "conditional": True},
+        "ws_fanout": {"clients": 10_000, "events": 50},
+        "upstream_faults": {"runs": 40, "hang_seconds": 10.0, "deadline": 2.0},
+        "asof_lookup": {"points": 100_000, "queries": 100_000, "repeat": 20}
+    }
+}
+
+async def run_scenario(name: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    if name == "xml_parse":
+        from benchmarks.bench_xml_parser import run
+        return run(**params)
+    if name == "save_rates":
+        from benchmarks.bench_save_rates import run
+    elif name == "external_ingest":
+        from benchmarks.bench_external_ingest import run
+    elif name in ("http_load", "http_poll"):
+        from benchmarks.bench_http_load import run
+    elif name == "ws_fanout":
+        from benchmarks.bench_ws_fanout import run
+    elif name == "upstream_faults":
+        from benchmarks.bench_upstream_faults import run
+    elif name == "asof_lookup":
+        from benchmarks.bench_asof import run
+    else:
+        raise ValueError(f"Неизвестный сценарий: {name}")
+    return await run(**params)
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+async def run_suite(profile: str, only: List[str]) -> Dict[str, Any]:
+    scenarios = {}
+    for name, params in PROFILES[profile].items():
+        if only and name not in only:
+            continue
+        print(f"== {name} {params}", file=sys.stderr)
+        scenarios[name] = await run_scenario(name, params)
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "profile": profile,
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform()
+        },
+        "scenarios": scenarios
+    }
+
+def compare(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float,
+    min_delta_ms: float,
+    include_tail: bool = False
+) -> List[Dict[str, Any]]:
+    rows = []
+    for scenario, metrics in results["scenarios"].items():
+        base_metrics = baseline.get("scenarios", {}).get(scenario, {})
+        for name, current in metrics.items():
+            base = base_metrics.get(name)
+            if base is None or not base["value"]:
+                continue
+            change = (current["value"] - base["value"]) / base["value"]
+            worse = change > tolerance if current["better"] == "lower" else change < -tolerance
+            if worse and current["unit"] == "ms" and abs(current["value"] - base["value"]) < min_delta_ms:
+                worse = False
+            if worse and name.endswith("_p95_ms") and not include_tail:
+                worse = False
+            rows.append({
+                "scenario": scenario,
+                "metric": name,
+                "baseline": base["value"],
+                "current": current["value"],
+                "unit": current["unit"],
+                "change": change,
+                "regression": worse
+            })
+    return rows
+
+def print_comparison(rows: List[Dict[str, Any]]):
+    for row in rows:
+        mark = "РЕГРЕССИЯ" if row["regression"] else ""
+        print(
+            f"{row['scenario']:>16} {row['metric']:<32} {row['baseline']:>12.3f} -> {row['current']:>12.3f} "
+            f"{row['unit']:<7} {row['change'] * 100:+7.1f}% {mark}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--only", default="", help="Сценарии через запятую: " + ",".join(PROFILES["quick"]))
+    parser.add_argument("--output", default=None, help="Куда записать результаты (JSON)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--min-delta-ms", type=float, default=0.5)
+    parser.add_argument("--include-tail", action="store_true", help="Считать регрессией и рост p95")
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    use_temp_database(args.database_url)
+    only = [name.strip() for name in args.only.split(",") if name.strip()]
+    results = asyncio.run(run_suite(args.profile, only))
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Базовая линия обновлена: {args.baseline}", file=sys.stderr)
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"Базовая линия не найдена: {args.baseline}", file=sys.stderr)
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["meta"].get("profile") != results["meta"]["profile"]:
+        print("Профиль базовой линии отличается - сравнение приблизительное", file=sys.stderr)
+    rows = compare(results, baseline, args.tolerance, args.min_delta_ms, args.include_tail)
+    print_comparison(rows)
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"Регрессий: {len(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
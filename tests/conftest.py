@@ -0,0 +1,27 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# Настройки читаются при импорте app.config, поэтому временная БД задаётся до него
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='currency_test_'), 'test.db')}"
+os.environ.setdefault("DB_ECHO", "false")
+
+@pytest.fixture(scope="session")
+def loop():
+    # Один цикл на все тесты: движок БД и писатель привязаны к нему
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+@pytest.fixture
+def run(loop):
+    return loop.run_until_complete
+
+@pytest.fixture
+def database(run):
+    """Пустая БД и сброшенные кэши"""
+    from benchmarks.common import reset_database
+
+    run(reset_database())
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta, timezone
+
+from app.db.database import ReadSessionLocal
+from app.services.analytics import get_analytics
+from app.services.cbr_xml import RateRecord
+from app.services.parser import CurrencyParser
+
+def test_aware_bounds_match_local_bounds(run, database):
+    start = datetime(2024, 1, 1)
+
+    async def scenario():
+        async with ReadSessionLocal() as db:
+            await CurrencyParser(db).save_rates_bulk([
+                RateRecord("USD", "Доллар США", 90.0 + hour, start + timedelta(hours=hour)) for hour in range(72)
+            ], source_dates=True)
+            date_from, date_to = datetime(2024, 1, 2, 6), datetime(2024, 1, 2, 18)
+            local = await get_analytics(db, "USD", date_from=date_from, date_to=date_to)
+            aware = await get_analytics(
+                db, "USD",
+                date_from=date_from.astimezone(timezone(timedelta(hours=5))),
+                date_to=date_to.astimezone(timezone(timedelta(hours=5)))
+            )
+            return local, aware
+
+    local, aware = run(scenario())
+    assert local["summary"]["first"] == 120.0
+    assert aware["summary"] == local["summary"]
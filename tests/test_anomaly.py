@@ -0,0 +1,62 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+from app.db.database import ReadSessionLocal
+from app.services.anomaly import AnomalyDetector, anomaly_detector
+from app.services.cbr_xml import RateRecord
+from app.services.parser import CurrencyParser
+
+def save_walk(run, days: int, jump_day: int, checkpoint_day: int, restart_day: int = -1):
+    """Случайное блуждание USD и EUR со скачком USD на 8% в jump_day; перед restart_day состояние сбрасывается"""
+    rng = random.Random(3)
+    values = {"USD": 90.0, "EUR": 100.0}
+    alerts = []
+    for day in range(days):
+        rates = []
+        for code in values:
+            values[code] *= math.exp(rng.gauss(0, 0.003))
+            if day == jump_day and code == "USD":
+                values[code] *= 1.08
+            rates.append(RateRecord(code, code, round(values[code], 4), datetime(2024, 1, 1) + timedelta(days=day)))
+        if day == restart_day:
+            anomaly_detector.invalidate()
+
+        async def save():
+            async with ReadSessionLocal() as db:
+                return await CurrencyParser(db).save_rates_bulk(rates, source_dates=True)
+
+        alerts += run(save())["alerts"]
+        if day == checkpoint_day:
+            run(anomaly_detector.checkpoint(force=True))
+    return alerts
+
+def states():
+    return {currency_id: state.as_row(currency_id) for currency_id, state in anomaly_detector.states.items()}
+
+def test_jump_is_flagged_once(run, database):
+    alerts = save_walk(run, days=200, jump_day=150, checkpoint_day=100)
+    assert [(alert["code"], alert["date"]) for alert in alerts] == [("USD", "2024-05-30T00:00:00")]
+    assert alerts[0]["zscore"] > 4 and alerts[0]["ewma_zscore"] > 4
+
+def test_first_batch_after_restart_is_checked(run, database):
+    # Состояние загружается до записи пачки: скачок в ней не доигрывается молча
+    alerts = save_walk(run, days=160, jump_day=150, checkpoint_day=100, restart_day=150)
+    assert [(alert["code"], alert["date"]) for alert in alerts] == [("USD", "2024-05-30T00:00:00")]
+
+def test_restart_replays_rates_after_checkpoint(run, database):
+    save_walk(run, days=120, jump_day=-1, checkpoint_day=60)
+    expected = states()
+
+    anomaly_detector.invalidate()
+
+    async def reload():
+        async with ReadSessionLocal() as db:
+            await anomaly_detector.ensure_loaded(db)
+
+    run(reload())
+    assert states() == expected
+
+    rebuilt = AnomalyDetector()
+    run(rebuilt.rebuild())
+    assert {currency_id: state.as_row(currency_id) for currency_id, state in rebuilt.states.items()} == expected
@@ -0,0 +1,83 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import numpy as np
+import pytest
+
+from app.db.database import ReadSessionLocal
+from app.services.cbr_xml import RateRecord
+from app.services.parser import CurrencyParser
+from app.services.series import series_store
+
+START = datetime(2024, 3, 1)
+
+@pytest.fixture
+def host_timezone():
+    """Часовой пояс хоста не UTC: расхождение GET и POST видно только так"""
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "America/New_York"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+def seed_hourly(run, hours: int = 48):
+    async def save():
+        async with ReadSessionLocal() as db:
+            await CurrencyParser(db).save_rates_bulk([
+                RateRecord("USD", "Доллар США", 90.0 + hour, START + timedelta(hours=hour)) for hour in range(hours)
+            ], source_dates=True)
+    run(save())
+
+def request(run, method: str, url: str, **kwargs) -> httpx.Response:
+    from app.main import app
+
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+    return run(send())
+
+@pytest.mark.parametrize("moment", ["2024-03-01T12:30:00", "2024-03-01T12:30:00+03:00", "2024-03-01T20:30:00Z"])
+def test_get_and_post_agree(run, database, host_timezone, moment):
+    seed_hourly(run)
+    single = request(run, "GET", "/api/v1/rates/asof", params={"code": "USD", "at": moment})
+    batch = request(run, "POST", "/api/v1/rates/asof", json={"code": ["USD"], "at": [moment], "with_dates": True})
+    assert single.status_code == 200 and batch.status_code == 200
+    assert batch.json()["values"] == [single.json()["value"]]
+    assert batch.json()["rate_dates"][0] == datetime.fromisoformat(single.json()["rate_date"]).isoformat(timespec="microseconds")
+
+def test_post_rejects_nat(run, database):
+    seed_hourly(run)
+    response = request(run, "POST", "/api/v1/rates/asof", json={"code": ["USD"], "at": ["NaT"]})
+    assert response.status_code == 400
+
+def test_rows_saved_during_series_load_reach_the_cache(run, database):
+    seed_hourly(run, hours=10)
+    load = series_store._load
+
+    async def racing_load(db, currency_id):
+        series = await load(db, currency_id)
+        if db is not None:
+            # Запись, закоммиченная после выборки, но до кэширования серии
+            async with ReadSessionLocal() as session:
+                await CurrencyParser(session).save_rates_bulk(
+                    [RateRecord("USD", "Доллар США", 200.0, START + timedelta(hours=10))], source_dates=True
+                )
+        return series
+
+    async def lookup():
+        series_store.invalidate()
+        series_store._load = racing_load
+        try:
+            async with ReadSessionLocal() as db:
+                values, _ = await series_store.as_of(db, ["USD"], np.array([START + timedelta(hours=11)], dtype="datetime64[us]"))
+        finally:
+            series_store._load = load
+        return values
+
+    assert run(lookup()).tolist() == [200.0]
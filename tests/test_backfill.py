@@ -0,0 +1,53 @@
+from datetime import date, datetime
+
+import httpx
+import pytest
+from fastapi import FastAPI, Response
+
+from app.services.backfill import MAX_CONCURRENCY, BackfillRunner, backfill_status
+from benchmarks.mock_cbr import build_daily_xml
+
+BROKEN_DAY = date(2024, 1, 3)
+
+def cbr_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/scripts/XML_daily.asp")
+    async def daily(date_req: str):
+        day = datetime.strptime(date_req, "%d/%m/%Y").date()
+        content = build_daily_xml(day, 5)
+        if day == BROKEN_DAY:
+            # Страница без даты курсов
+            content = content.replace(f' Date="{day:%d.%m.%Y}"'.encode(), b"")
+        return Response(content, media_type="application/xml")
+
+    return app
+
+def test_page_without_date_fails_only_its_day(run, database):
+    async def backfill():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=cbr_app()), base_url="http://cbr") as client:
+            runner = BackfillRunner(
+                date(2024, 1, 1), date(2024, 1, 5), concurrency=2, cbr_url="http://cbr/scripts/XML_daily.asp", client=client
+            )
+            return runner, await runner.run()
+
+    runner, result = run(backfill())
+    assert runner.failed == [BROKEN_DAY]
+    assert result["days_fetched"] == 4
+    assert result["rates_saved"] == 20
+
+@pytest.mark.parametrize("concurrency", [0, -5, MAX_CONCURRENCY + 1])
+def test_concurrency_out_of_range_is_rejected(run, concurrency):
+    from app.main import app
+
+    with pytest.raises(ValueError):
+        BackfillRunner(date(2024, 1, 1), date(2024, 1, 5), concurrency=concurrency)
+
+    async def post():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/api/v1/tasks/backfill", json={
+                "start": "2024-01-01", "end": "2024-01-05", "concurrency": concurrency
+            })
+
+    assert run(post()).status_code == 422
+    assert not backfill_status["running"]
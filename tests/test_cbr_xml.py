@@ -0,0 +1,24 @@
+from datetime import date, datetime
+
+from app.services.cbr_xml import CbrXmlStreamParser, iter_rate_records
+from benchmarks.mock_cbr import build_daily_xml
+
+def test_parsed_records_are_detached_from_root():
+    content = build_daily_xml(date(2024, 1, 10), 2000)
+    parser = CbrXmlStreamParser()
+    count = 0
+    for offset in range(0, len(content), 4096):
+        count += sum(1 for _ in parser.feed(content[offset:offset + 4096]))
+        # В дереве остаётся не больше одной недочитанной записи
+        assert len(parser._root) <= 1
+    count += sum(1 for _ in parser.close())
+    assert count == 2000
+    assert parser.date == datetime(2024, 1, 10)
+    assert len(parser._root) == 0
+
+def test_chunked_daily_matches_whole_document():
+    content = build_daily_xml(date(2024, 1, 10), 50)
+    whole = list(iter_rate_records([content]))
+    chunked = list(iter_rate_records(content[offset:offset + 7] for offset in range(0, len(content), 7)))
+    assert chunked == whole
+    assert len(whole) == 50
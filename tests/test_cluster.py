@@ -0,0 +1,70 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app.db.database import AsyncSessionLocal
+from app.db.models import LeaderLease
+from app.nats.cluster import ClusterRelay, InMemoryBroker
+from app.tasks.leader import LeaderElector
+from app.websocket.manager import ConnectionManager
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.sent.append(json.loads(text))
+
+def test_relay_delivers_to_other_workers_once(run):
+    broker = InMemoryBroker()
+    workers = [ConnectionManager(queue_size=100, overflow_policy="drop_oldest") for _ in range(2)]
+    relays = [ClusterRelay(worker, origin=origin) for worker, origin in zip(workers, ("a", "b"))]
+    sockets = [FakeWebSocket(), FakeWebSocket()]
+    event = {"type": "heartbeat", "data": {"n": 1}}
+
+    async def scenario():
+        for worker, relay, websocket in zip(workers, relays, sockets):
+            assert await relay.attach(broker)
+            await worker.connect(websocket)
+        await workers[0].broadcast(event)
+        await asyncio.sleep(0.01)
+        for worker, websocket in zip(workers, sockets):
+            worker.disconnect(websocket)
+
+    run(scenario())
+
+    # Своё эхо от брокера отброшено: у отправителя событие ровно одно
+    assert sockets[0].sent == [event]
+    assert sockets[1].sent == [event]
+    assert (relays[0].relayed, relays[0].received) == (1, 0)
+    # Полученное событие дальше не пересылается
+    assert (relays[1].relayed, relays[1].received) == (0, 1)
+
+def test_leader_lease_takeover(run, database):
+    first = LeaderElector(ttl=30, holder="worker-a")
+    second = LeaderElector(ttl=30, holder="worker-b")
+
+    async def expire():
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(LeaderLease).values(expires_at=datetime.now() - timedelta(seconds=1)))
+            await db.commit()
+
+    assert run(first.try_acquire())
+    assert not run(second.try_acquire())
+    # Продление своей аренды
+    assert run(first.try_acquire())
+
+    # Лидер пропал: после истечения аренды её забирает другой воркер
+    run(expire())
+    assert run(second.try_acquire())
+    assert not run(first.try_acquire())
+    assert (first.is_leader, second.is_leader) == (False, True)
+
+    run(second.release())
+    assert not second.is_leader
+    assert run(first.try_acquire())
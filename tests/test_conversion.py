@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+
+from app.db.database import AsyncSessionLocal
+from app.db.models import Currency, CurrencyRate
+from app.services.conversion import ConversionEngine
+from app.services.snapshot import snapshot_store
+
+def test_batch_convert_latest_dated_and_unknown(run, database):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            usd = Currency(code="USD", name="Доллар США")
+            eur = Currency(code="EUR", name="Евро")
+            db.add_all([usd, eur])
+            await db.flush()
+            db.add_all([
+                CurrencyRate(currency_id=usd.id, value=90.0, date=datetime(2024, 1, 1)),
+                CurrencyRate(currency_id=eur.id, value=99.0, date=datetime(2024, 1, 1)),
+                CurrencyRate(currency_id=usd.id, value=92.0, date=datetime(2024, 1, 3)),
+                CurrencyRate(currency_id=eur.id, value=100.0, date=datetime(2024, 1, 3))
+            ])
+            await db.commit()
+            await snapshot_store.seed(db)
+
+            return await ConversionEngine().convert(db, [
+                {"from": "usd", "to": "RUB", "amount": 2},
+                {"from": "EUR", "to": "USD", "amount": 1},
+                {"from": "USD", "to": "EUR", "amount": 1, "date": datetime(2024, 1, 2, 12)},
+                {"from": "USD", "to": "RUB", "amount": 1, "date": datetime(2023, 12, 31)},
+                {"from": "XXX", "to": "RUB", "amount": 1},
+                {"from": "XXX", "to": "RUB", "amount": 1, "date": datetime(2024, 1, 2)}
+            ])
+
+    results = run(scenario())["results"]
+    assert results[0]["from"] == "USD"
+    assert results[0]["result"] == 184.0
+    assert results[1]["rate"] == pytest.approx(100.0 / 92.0)
+    # Дата между курсами: действует курс на 1 января
+    assert results[2]["rate"] == pytest.approx(90.0 / 99.0)
+    # До начала истории и неизвестный код - без курса, с ошибкой
+    for result in results[3:]:
+        assert result["rate"] is None and result["result"] is None
+        assert "error" in result
+    assert all("error" not in result for result in results[:3])
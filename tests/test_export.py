@@ -0,0 +1,52 @@
+import gzip
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from app.db.database import ReadSessionLocal
+from app.services.cbr_xml import RateRecord
+from app.services.export import export_rates
+from app.services.parser import CurrencyParser
+
+START = datetime(2024, 1, 1)
+OFFSET = timezone(timedelta(hours=5))
+DATE_FROM, DATE_TO = datetime(2024, 1, 2, 6), datetime(2024, 1, 2, 18)
+
+@pytest.fixture
+def hourly(run, database):
+    async def save():
+        async with ReadSessionLocal() as db:
+            await CurrencyParser(db).save_rates_bulk([
+                RateRecord("USD", "Доллар США", 90.0 + hour, START + timedelta(hours=hour)) for hour in range(72)
+            ], source_dates=True)
+    run(save())
+
+def test_export_endpoint_aware_bounds_match_local_bounds(run, hourly):
+    from app.main import app
+
+    async def export(date_from: datetime, date_to: datetime) -> list:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/api/v1/rates/export", params={
+                "format": "csv.gz", "code": "USD", "from": date_from.isoformat(), "to": date_to.isoformat()
+            })
+            return gzip.decompress(response.content).decode().splitlines()
+
+    local = run(export(DATE_FROM, DATE_TO))
+    aware = run(export(DATE_FROM.astimezone(OFFSET), DATE_TO.astimezone(OFFSET)))
+    assert len(local) == 14
+    assert local[1].split(",")[4] == "2024-01-02T06:00:00"
+    assert aware == local
+
+def test_columnar_export_aware_bounds_match_local_bounds(run, hourly):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+
+    async def export(date_from: datetime, date_to: datetime):
+        body = b"".join([chunk async for chunk in export_rates("arrow", ["USD"], date_from, date_to)])
+        return pyarrow.ipc.open_stream(body).read_all()
+
+    local = run(export(DATE_FROM, DATE_TO))
+    aware = run(export(DATE_FROM.astimezone(OFFSET), DATE_TO.astimezone(OFFSET)))
+    assert local.num_rows == 13
+    assert aware.equals(local)
@@ -0,0 +1,49 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from app.db.database import ReadSessionLocal
+from app.services.cbr_xml import RateRecord
+from app.services.parser import CurrencyParser
+
+START = datetime(2024, 1, 1)
+# Смещение, заведомо отличное от часового пояса хоста
+OFFSET = timezone(timedelta(hours=5))
+
+def seed_hourly(run, hours: int = 72):
+    async def save():
+        async with ReadSessionLocal() as db:
+            await CurrencyParser(db).save_rates_bulk([
+                RateRecord("USD", "Доллар США", 90.0 + hour, START + timedelta(hours=hour)) for hour in range(hours)
+            ], source_dates=True)
+    run(save())
+
+def get(run, url: str, params: dict) -> httpx.Response:
+    from app.main import app
+
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(url, params=params)
+    return run(send())
+
+def bounds(aware: bool) -> dict:
+    date_from, date_to = datetime(2024, 1, 2, 6), datetime(2024, 1, 2, 18)
+    if aware:
+        date_from, date_to = date_from.astimezone(OFFSET), date_to.astimezone(OFFSET)
+    return {"from": date_from.isoformat(), "to": date_to.isoformat()}
+
+def test_rates_page_aware_bounds_match_local_bounds(run, database):
+    seed_hourly(run)
+    local = get(run, "/api/v1/rates", {"code": "USD", **bounds(False)}).json()
+    aware = get(run, "/api/v1/rates", {"code": "USD", **bounds(True)}).json()
+    assert local["items"][0]["date"] == "2024-01-02T06:00:00"
+    assert len(local["items"]) == 13
+    assert aware["items"] == local["items"]
+
+def test_rates_stream_aware_bounds_match_local_bounds(run, database):
+    seed_hourly(run)
+    local = get(run, "/api/v1/rates/stream", {"code": "USD", **bounds(False)}).text.splitlines()
+    aware = get(run, "/api/v1/rates/stream", {"code": "USD", **bounds(True)}).text.splitlines()
+    assert json.loads(local[0])["value"] == 120.0
+    assert aware == local
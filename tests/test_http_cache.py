@@ -0,0 +1,41 @@
+import httpx
+
+def test_etag_is_invalidated_by_currency_crud(run, database):
+    from app.main import app
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            async def get(url: str, etag: str = None) -> httpx.Response:
+                return await client.get(url, headers={"If-None-Match": etag} if etag else None)
+
+            listing = await get("/api/v1/currencies")
+            assert listing.status_code == 200
+            etag = listing.headers["ETag"]
+            assert "max-age" in listing.headers["Cache-Control"]
+            assert (await get("/api/v1/currencies", etag)).status_code == 304
+
+            created = await client.post("/api/v1/currencies", json={"code": "USD", "name": "Доллар США"})
+            currency_id = created.json()["id"]
+            listing = await get("/api/v1/currencies", etag)
+            assert listing.status_code == 200
+            assert [currency["code"] for currency in listing.json()] == ["USD"]
+            etag = listing.headers["ETag"]
+
+            item = await get(f"/api/v1/currencies/{currency_id}")
+            item_etag = item.headers["ETag"]
+            assert (await get(f"/api/v1/currencies/{currency_id}", item_etag)).status_code == 304
+
+            await client.patch(f"/api/v1/currencies/{currency_id}", json={"name": "Доллар"})
+            item = await get(f"/api/v1/currencies/{currency_id}", item_etag)
+            assert item.status_code == 200
+            assert item.json()["name"] == "Доллар"
+            assert (await get("/api/v1/currencies", etag)).status_code == 200
+            etag = (await get("/api/v1/currencies")).headers["ETag"]
+
+            await client.delete(f"/api/v1/currencies/{currency_id}")
+            listing = await get("/api/v1/currencies", etag)
+            assert listing.status_code == 200
+            assert listing.json() == []
+            assert (await get(f"/api/v1/currencies/{currency_id}")).status_code == 404
+
+    run(scenario())
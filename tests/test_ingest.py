@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from app.db.database import ReadSessionLocal
+from app.db.models import CurrencyRate
+from app.nats.ingest import ExternalRateIngestor
+from app.services.cbr_xml import RateRecord
+from app.services.parser import CurrencyParser
+
+def test_failed_flush_keeps_batch_for_next_flush(run, database, monkeypatch):
+    ingestor = ExternalRateIngestor(batch_size=10, batch_interval=1.0, queue_size=10, concurrency=1)
+    save_rates_bulk = CurrencyParser.save_rates_bulk
+
+    async def failing_save(parser, records, **kwargs):
+        # Пока пачка пишется, декодер успевает принять более новый курс USD
+        ingestor.pending["USD"] = RateRecord("USD", "Доллар США", 92.0, datetime(2024, 1, 1, 12))
+        ingestor._pending_messages += 1
+        raise RuntimeError("database is locked")
+
+    ingestor.pending = {
+        "USD": RateRecord("USD", "Доллар США", 91.0, datetime(2024, 1, 1, 10)),
+        "EUR": RateRecord("EUR", "Евро", 99.0, datetime(2024, 1, 1, 10))
+    }
+    ingestor._pending_messages = 2
+    monkeypatch.setattr(CurrencyParser, "save_rates_bulk", failing_save)
+    assert run(ingestor.flush()) == 0
+
+    assert ingestor.failed_batches == 1
+    assert {code: record.rate for code, record in ingestor.pending.items()} == {"USD": 92.0, "EUR": 99.0}
+    assert ingestor._pending_messages == 3
+
+    monkeypatch.setattr(CurrencyParser, "save_rates_bulk", save_rates_bulk)
+    run(ingestor.flush())
+    assert ingestor.pending == {} and ingestor.batches_total == 1
+    assert ingestor.last_batch_size == 3
+
+    async def count():
+        async with ReadSessionLocal() as db:
+            return await db.scalar(select(func.count()).select_from(CurrencyRate))
+
+    assert run(count()) == 2
@@ -0,0 +1,34 @@
+import asyncio
+
+from app.tasks.jobs import ParseJobCoordinator
+
+def test_cancelled_parse_resolves_jobs_and_frees_coordinator(run):
+    coordinator = ParseJobCoordinator()
+    started = []
+
+    async def parse(job):
+        started.append(job.id)
+        await asyncio.sleep(3600)
+
+    coordinator._parse = parse
+
+    async def scenario():
+        job = coordinator.submit("manual")
+        queued = coordinator.submit("manual", force=True)
+        await asyncio.sleep(0)
+        coordinator._task.cancel()
+        # Ожидающий run() получает результат, а не зависает
+        await asyncio.wait_for(asyncio.shield(job.future), 1.0)
+        await asyncio.wait_for(asyncio.shield(queued.future), 1.0)
+        assert coordinator._task.cancelled()
+        fresh = coordinator.submit("scheduler")
+        await asyncio.sleep(0)
+        return job, queued, fresh
+
+    job, queued, fresh = run(scenario())
+    assert job.status == "cancelled" and job.error
+    assert queued.status == "cancelled" and queued.finished_at is not None
+    assert started == [job.id, fresh.id]
+    assert coordinator.current is fresh and coordinator.next is None
+    coordinator._task.cancel()
+    run(asyncio.sleep(0))
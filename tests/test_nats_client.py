@@ -0,0 +1,62 @@
+from app.nats.client import NatsClient
+
+class FakeSubscription:
+    def __init__(self, server, subject, queue, cb):
+        self.server, self.subject, self.queue, self.cb = server, subject, queue, cb
+
+    async def unsubscribe(self):
+        self.server.subs.remove(self)
+
+class FakeNats:
+    """Соединение NATS: connect падает, пока reachable=False"""
+
+    def __init__(self):
+        self.reachable = False
+        self.is_connected = False
+        self.is_reconnecting = False
+        self.is_connecting = False
+        self.subs = []
+
+    async def connect(self, servers):
+        if not self.reachable:
+            raise ConnectionRefusedError("nats недоступен")
+        self.is_connected = True
+
+    async def subscribe(self, subject, queue="", cb=None):
+        sub = FakeSubscription(self, subject, queue, cb)
+        self.subs.append(sub)
+        return sub
+
+def make_client() -> NatsClient:
+    client = NatsClient()
+    client.nc = FakeNats()
+    client.publisher.start = lambda: None
+    return client
+
+async def handler(msg):
+    pass
+
+def test_subscription_made_while_offline_is_restored_once(run):
+    client = make_client()
+    run(client.connect())
+    subscription = run(client.subscribe("currency.external.updates", handler, queue="currency-ingest"))
+    assert subscription is not None and not subscription.active
+    assert client.nc.subs == []
+
+    client.nc.reachable = True
+    run(client.connect())
+    assert subscription.active
+    # Повторное подключение (как из NatsPublisher._reconnect) не плодит обработчиков
+    client.nc.is_connected = False
+    run(client.connect())
+    subjects = sorted(sub.subject for sub in client.nc.subs)
+    assert subjects == ["currency.external.updates", "currency.updates"]
+
+def test_unsubscribe_is_not_restored(run):
+    client = make_client()
+    client.nc.reachable = True
+    run(client.connect())
+    subscription = run(client.subscribe("currency.cluster.events", handler))
+    run(subscription.unsubscribe())
+    run(client.connect())
+    assert [sub.subject for sub in client.nc.subs] == ["currency.updates"]
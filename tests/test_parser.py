@@ -0,0 +1,71 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+from app.db.database import ReadSessionLocal
+from app.db.models import Currency, CurrencyRate
+from app.services.anomaly import anomaly_detector
+from app.services.cbr_xml import RateRecord
+from app.services.parser import CurrencyParser
+
+async def save(rates, **kwargs):
+    async with ReadSessionLocal() as db:
+        return await CurrencyParser(db).save_rates_bulk(rates, **kwargs)
+
+def test_save_rates_bulk_accepts_date_records(run, database):
+    # Backfill датирует курсы date, а не datetime
+    start = date(2024, 1, 1)
+    for i in range(3):
+        result = run(save([
+            RateRecord("USD", "Доллар США", 90.0 + i, start + timedelta(days=i)),
+            RateRecord("EUR", "Евро", 100.0 - i, start + timedelta(days=i))
+        ], source_dates=True))
+        assert result["saved"] == 2
+
+    async def stored_dates():
+        async with ReadSessionLocal() as db:
+            return (await db.execute(select(CurrencyRate.date).order_by(CurrencyRate.date))).scalars().all()
+
+    dates = run(stored_dates())
+    assert dates[0] == datetime(2024, 1, 1)
+    assert all(type(value) is datetime for value in dates)
+    assert {state.last_at for state in anomaly_detector.states.values()} == {datetime(2024, 1, 3)}
+
+def test_save_rates_bulk_mixes_date_and_datetime_records(run, database):
+    run(save([RateRecord("USD", "Доллар США", 90.0, datetime(2024, 1, 1, 12, 30))], source_dates=True))
+    result = run(save([RateRecord("USD", "Доллар США", 91.0, date(2024, 1, 2))], source_dates=True))
+    assert result["saved"] == 1
+
+def test_save_rates_bulk_counts_new_and_existing_currencies(run, database):
+    result = run(save([
+        RateRecord("USD", "Доллар США", 90.0),
+        RateRecord("EUR", "Евро", 100.0)
+    ]))
+    assert (result["inserted"], result["updated"], result["saved"]) == (2, 0, 2)
+
+    # Повтор кода в пакете добавляет одну валюту, но оба курса
+    result = run(save([
+        RateRecord("USD", "Доллар США", 91.0),
+        RateRecord("CNY", "Юань", 12.0),
+        RateRecord("CNY", "Юань", 12.5)
+    ]))
+    assert (result["inserted"], result["updated"], result["saved"]) == (2, 1, 3)
+
+    async def currency_codes():
+        async with ReadSessionLocal() as db:
+            return (await db.execute(select(Currency.code).order_by(Currency.code))).scalars().all()
+
+    assert run(currency_codes()) == ["CNY", "EUR", "USD"]
+
+def test_save_rates_bulk_only_changed(run, database):
+    run(save([RateRecord("USD", "Доллар США", 90.0), RateRecord("EUR", "Евро", 100.0)]))
+    result = run(save([
+        RateRecord("USD", "Доллар США", 90.0),
+        RateRecord("EUR", "Евро", 101.0),
+        RateRecord("GBP", "Фунт", 115.0)
+    ], only_changed=True))
+    assert result["saved"] == 2
+    assert result["changes"] == [
+        {"code": "EUR", "old": 100.0, "new": 101.0},
+        {"code": "GBP", "old": None, "new": 115.0}
+    ]
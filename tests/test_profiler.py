@@ -0,0 +1,42 @@
+import threading
+import time
+
+import httpx
+
+from app.services.profiler import SamplingProfiler
+
+def busy(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+def test_reports_while_sampling():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy, args=(stop,), daemon=True)
+    worker.start()
+    profiler = SamplingProfiler()
+    profiler.start(interval=0.0005, thread_id=worker.ident)
+    try:
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            profiler.report()
+            profiler.collapsed()
+    finally:
+        profiler.stop()
+        stop.set()
+    report = profiler.report()
+    assert report["samples"] > 0 and not report["running"]
+    assert report["top_self"]
+
+def test_debug_routes_require_profiler_enabled(run, monkeypatch):
+    from app.config import settings
+    from app.main import app
+
+    async def call(method: str, url: str) -> int:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return (await client.request(method, url)).status_code
+
+    routes = [("POST", "/api/v1/debug/profiler/start"), ("GET", "/api/v1/debug/profiler"), ("POST", "/api/v1/debug/profiler/stop")]
+    assert [run(call(method, url)) for method, url in routes] == [404, 404, 404]
+
+    monkeypatch.setattr(settings, "profiler_enabled", True)
+    assert [run(call(method, url)) for method, url in routes] == [200, 200, 200]
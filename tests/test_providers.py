@@ -0,0 +1,71 @@
+from datetime import date
+
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+
+from app.services.providers import CbrProvider, EcbProvider, JsonProvider, ProviderRunner, commit_state
+from benchmarks.common import serve
+from benchmarks.mock_cbr import build_daily_xml
+
+ECB_ZERO_RATE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gesmes:Envelope xmlns:gesmes="http://www.gesmes.org/xml/2002-08-01" xmlns="http://www.ecb.int/vocabulary/2002-08-01/eurofxref">
+<Cube><Cube time="2024-01-05"><Cube currency="USD" rate="0"/></Cube></Cube>
+</gesmes:Envelope>"""
+
+def upstream_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/cbr")
+    async def cbr():
+        return Response(build_daily_xml(date(2024, 1, 5), 10), media_type="application/xml")
+
+    @app.get("/cbr/chunked")
+    async def cbr_chunked():
+        content = build_daily_xml(date(2024, 1, 5), 10)
+
+        async def chunks():
+            for offset in range(0, len(content), 64):
+                yield content[offset:offset + 64]
+        return StreamingResponse(chunks(), media_type="application/xml")
+
+    @app.get("/ecb")
+    async def ecb():
+        return Response(ECB_ZERO_RATE, media_type="application/xml")
+
+    @app.get("/json")
+    async def rates_list():
+        return {"base": "USD", "date": "2024-01-05", "rates": [["EUR", 0.91]]}
+
+    return app
+
+def test_malformed_provider_does_not_fail_the_run(run):
+    async def fetch():
+        async with serve(upstream_app()) as base_url:
+            runner = ProviderRunner()
+            providers = [
+                CbrProvider(f"{base_url}/cbr", 5.0),
+                EcbProvider(f"{base_url}/ecb", 5.0),
+                JsonProvider(f"{base_url}/json", 5.0)
+            ]
+            return runner, await runner.fetch(force=True, providers=providers)
+
+    runner, result = run(fetch())
+    assert len(result.rates) == 10
+    stats = runner.stats()
+    assert stats["cbr"]["status"] == "ok"
+    assert stats["ecb"]["status"] == "failed" and stats["json"]["status"] == "failed"
+
+def test_streamed_body_is_parsed_and_unchanged_snapshot_skipped(run):
+    async def fetch():
+        async with serve(upstream_app()) as base_url:
+            provider = CbrProvider(f"{base_url}/cbr/chunked", 5.0)
+            first = await provider.fetch()
+            commit_state({provider.url: first[1]})
+            return first, await provider.fetch()
+
+    (quote, pending_state, _), second = run(fetch())
+    assert len(quote.rates) == 10
+    assert quote.rates == CbrProvider("").parse([build_daily_xml(date(2024, 1, 5), 10)]).rates
+    assert pending_state["content_hash"]
+    # Тот же хэш тела: курсы, разобранные по ходу чтения, не возвращаются
+    assert second == (None, None, 0.0)
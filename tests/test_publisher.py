@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+from app.config import settings
+from app.nats.publisher import NatsPublisher
+
+class FakeNats:
+    def __init__(self):
+        self.is_connected = False
+        self.is_reconnecting = False
+        self.is_connecting = False
+        self.published = []
+
+    async def publish(self, subject: str, data: bytes):
+        self.published.append((subject, json.loads(data)))
+
+    async def flush(self, timeout: float = None):
+        pass
+
+class FakeClient:
+    """NatsClient без сервера: connect() удаётся, только когда online"""
+
+    def __init__(self):
+        self.nc = FakeNats()
+        self.online = False
+
+    async def connect(self, servers: str):
+        self.nc.is_connected = self.online
+
+async def wait_published(client: FakeClient, count: int):
+    for _ in range(200):
+        if len(client.nc.published) >= count:
+            return
+        await asyncio.sleep(0.01)
+
+def spilled_lines(path) -> list:
+    return [json.loads(line)["p"]["n"] for line in path.read_text(encoding="utf-8").splitlines()]
+
+def test_overflow_spills_to_file_and_replays_in_order(run, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "nats_reconnect_interval", 0.01)
+    spill = tmp_path / "outbox.ndjson"
+    client = FakeClient()
+    publisher = NatsPublisher(client, max_size=2, batch_size=10, flush_interval=0.01, spill_path=str(spill))
+
+    for n in range(5):
+        publisher.enqueue("currency.updates", {"n": n})
+    assert len(publisher.outbox) == 2
+    assert publisher.spilled == 3
+    assert spilled_lines(spill) == [2, 3, 4]
+
+    async def scenario():
+        publisher.start()
+        await asyncio.sleep(0.05)
+        # NATS недоступен: ничего не отправлено и не потеряно
+        assert client.nc.published == []
+        client.online = True
+        await wait_published(client, 5)
+        await publisher.stop()
+
+    run(scenario())
+    assert [payload["n"] for _, payload in client.nc.published] == [0, 1, 2, 3, 4]
+    assert publisher.spilled == 0
+    assert spill.read_text(encoding="utf-8") == ""
+    assert publisher.dropped_total == 0
+
+def test_leftovers_spill_on_stop_and_replay_after_restart(run, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "nats_reconnect_interval", 0.01)
+    spill = tmp_path / "outbox.ndjson"
+    offline = FakeClient()
+    publisher = NatsPublisher(offline, max_size=10, batch_size=10, flush_interval=0.01, spill_path=str(spill))
+
+    async def shutdown():
+        publisher.start()
+        publisher.enqueue("currency.updates", {"n": 1})
+        publisher.enqueue("currency.updates", {"n": 2})
+        await publisher.stop()
+
+    run(shutdown())
+    assert spilled_lines(spill) == [1, 2]
+
+    # Новый процесс находит spill-файл и отправляет его после подключения
+    online = FakeClient()
+    online.online = True
+    restarted = NatsPublisher(online, max_size=10, batch_size=10, flush_interval=0.01, spill_path=str(spill))
+    assert restarted.spilled == 2
+
+    async def replay():
+        restarted.start()
+        await wait_published(online, 2)
+        await restarted.stop()
+
+    run(replay())
+    assert [payload["n"] for _, payload in online.nc.published] == [1, 2]
+    assert restarted.spilled == 0
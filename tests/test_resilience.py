@@ -0,0 +1,70 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.resilience import CircuitBreaker, CircuitOpenError, call_with_retries
+from benchmarks.mock_cbr import FaultInjector, create_app
+
+def test_breaker_opens_and_half_opens_against_mock(run):
+    faults = FaultInjector(seed=1)
+    breaker = CircuitBreaker("mock", failure_threshold=3, reset_timeout=0.05)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(valutes=5, faults=faults)), base_url="http://cbr") as client:
+            async def fetch(timeout: float):
+                response = await client.get("/scripts/XML_daily.asp", timeout=timeout)
+                response.raise_for_status()
+                return response
+
+            async def call():
+                return await call_with_retries(fetch, breaker, retries=0)
+
+            faults.configure(fail_next=3)
+            for _ in range(3):
+                with pytest.raises(httpx.HTTPStatusError):
+                    await call()
+            assert breaker.state == "open"
+
+            # Разомкнутый предохранитель не пускает запрос к источнику
+            with pytest.raises(CircuitOpenError):
+                await call()
+            assert faults.counters["requests"] == 3
+
+            # Пробный запрос после reset_timeout неудачен - цепь снова разомкнута
+            await asyncio.sleep(0.06)
+            faults.configure(fail_next=1)
+            with pytest.raises(httpx.HTTPStatusError):
+                await call()
+            assert breaker.state == "open"
+            assert breaker.opened_total == 2
+
+            # Удачный пробный запрос замыкает цепь
+            await asyncio.sleep(0.06)
+            response = await call()
+            assert response.status_code == 200
+            assert breaker.state == "closed"
+            assert breaker.failures == 0
+            assert faults.counters["requests"] == 5
+
+    run(scenario())
+
+def test_retries_transient_errors_within_one_call(run, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "upstream_backoff_base", 0.001)
+    faults = FaultInjector(seed=1, fail_next=2)
+    breaker = CircuitBreaker("mock-retries", failure_threshold=5, reset_timeout=60)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(valutes=5, faults=faults)), base_url="http://cbr") as client:
+            async def fetch(timeout: float):
+                response = await client.get("/scripts/XML_daily.asp", timeout=timeout)
+                response.raise_for_status()
+                return response.status_code
+
+            return await call_with_retries(fetch, breaker, retries=2)
+
+    assert run(scenario()) == 200
+    assert faults.counters["requests"] == 3
+    assert breaker.state == "closed"
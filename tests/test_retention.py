@@ -0,0 +1,25 @@
+from app.config import settings
+from app.tasks.background import scheduler, start_background_scheduler
+
+def scheduled_jobs(run) -> set:
+    async def start():
+        start_background_scheduler()
+        jobs = {job.id for job in scheduler.get_jobs()}
+        scheduler.remove_all_jobs()
+        scheduler.shutdown(wait=False)
+        return jobs
+
+    return run(start())
+
+def test_compaction_is_scheduled_only_when_enabled(run, monkeypatch):
+    monkeypatch.setattr(settings, "cluster_mode", False)
+    monkeypatch.setattr(settings, "retention_enabled", False)
+    assert "rates_compaction" not in scheduled_jobs(run)
+
+    monkeypatch.setattr(settings, "retention_enabled", True)
+    assert "rates_compaction" in scheduled_jobs(run)
+
+def test_retention_is_opt_in():
+    from app.config import Settings
+
+    assert Settings.model_fields["retention_enabled"].default is False
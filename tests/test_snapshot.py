@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from app.db.database import AsyncSessionLocal
+from app.db.models import Currency, CurrencyRate
+from app.services.snapshot import LatestRate, SnapshotStore
+
+def test_publish_bumps_generation_copy_on_write():
+    store = SnapshotStore()
+    first = store.publish([LatestRate("USD", "Доллар США", 90.0, datetime(2024, 1, 1))])
+    second = store.publish([LatestRate("EUR", "Евро", 100.0, datetime(2024, 1, 1))])
+
+    assert (first.generation, second.generation) == (1, 2)
+    # Уже выданный снимок не меняется
+    assert list(first.rates) == ["USD"]
+    assert sorted(second.rates) == ["EUR", "USD"]
+    assert store.get("usd")["value"] == 90.0
+
+    third = store.publish([], remove=["USD"])
+    assert third.generation == 3
+    assert store.codes() == ["EUR"]
+    assert store.get("USD") is None
+    assert "USD" in second.rates
+
+def test_seed_takes_latest_rate_per_currency(run, database):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            usd = Currency(code="USD", name="Доллар США")
+            eur = Currency(code="EUR", name="Евро")
+            db.add_all([usd, eur])
+            await db.flush()
+            db.add_all([
+                CurrencyRate(currency_id=usd.id, value=90.0, date=datetime(2024, 1, 1)),
+                CurrencyRate(currency_id=usd.id, value=91.0, date=datetime(2024, 1, 2)),
+                CurrencyRate(currency_id=eur.id, value=100.0, date=datetime(2024, 1, 1))
+            ])
+            await db.commit()
+
+            store = SnapshotStore()
+            store.publish([LatestRate("GBP", "Фунт", 115.0, datetime(2024, 1, 1))])
+            snapshot = await store.seed(db)
+            return store, snapshot
+
+    store, snapshot = run(scenario())
+    # Снимок из БД заменяет опубликованный целиком, поколение растёт
+    assert snapshot.generation == 2
+    assert sorted(snapshot.rates) == ["EUR", "USD"]
+    assert store.get("USD") == {"code": "USD", "name": "Доллар США", "value": 91.0, "date": "2024-01-02T00:00:00"}
+    assert snapshot.as_dict()["rates"][0]["code"] == "EUR"
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+from app.websocket.manager import ConnectionManager
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code: int = 1000):
+        pass
+
+def types(websocket: FakeWebSocket):
+    # Снимок при подписке зависит от уже опубликованных курсов
+    return [message["type"] for message in websocket.sent if message["type"] != "snapshot"]
+
+def test_subscribe_and_unsubscribe_topics(run):
+    manager = ConnectionManager(queue_size=100, overflow_policy="drop_oldest")
+    usd, everything, deletions = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    rates_event = {
+        "type": "rates_updated",
+        "data": {"changes": [{"code": "USD", "new": 91.0}, {"code": "EUR", "new": 99.0}]}
+    }
+
+    async def scenario():
+        for websocket in (usd, everything, deletions):
+            await manager.connect(websocket)
+        await manager.handle_client_message(usd, json.dumps({"action": "subscribe", "topics": ["usd"]}))
+        await manager.handle_client_message(deletions, json.dumps({"action": "subscribe", "topics": "currency_deleted"}))
+        assert set(manager.subscribers) == {"USD", "currency_deleted"}
+        assert manager.unfiltered == {manager.connections[everything]}
+
+        await manager.broadcast(rates_event, codes=["USD", "EUR"])
+        await manager.broadcast({"type": "currency_deleted", "data": {"id": 3}}, codes=["GBP"])
+
+        await manager.handle_client_message(usd, json.dumps({"action": "unsubscribe", "topics": ["USD"]}))
+        assert "USD" not in manager.subscribers
+        # Без подписок клиент снова получает все события
+        await manager.broadcast({"type": "currency_created", "data": {"code": "CNY"}}, codes=["CNY"])
+        await manager.handle_client_message(everything, "not json")
+        await asyncio.sleep(0.01)
+        for websocket in (usd, everything, deletions):
+            manager.disconnect(websocket)
+
+    run(scenario())
+
+    assert types(usd) == ["subscribed", "rates_updated", "unsubscribed", "currency_created"]
+    assert usd.sent[0]["topics"] == ["USD"]
+    narrowed = next(message for message in usd.sent if message["type"] == "rates_updated")
+    assert narrowed["data"]["changes"] == [{"code": "USD", "new": 91.0}]
+
+    assert types(everything) == ["rates_updated", "currency_deleted", "currency_created", "error"]
+    assert everything.sent[0] == rates_event
+
+    assert types(deletions) == ["subscribed", "currency_deleted"]
+
+def test_alerts_are_narrowed_to_subscribed_codes(run):
+    manager = ConnectionManager(queue_size=100, overflow_policy="drop_oldest")
+    usd, gbp = FakeWebSocket(), FakeWebSocket()
+    alert_event = {
+        "type": "rate_alert",
+        "data": {"source": "parser", "alerts": [{"code": "USD", "z_score": 5.0}, {"code": "EUR", "z_score": -4.0}]}
+    }
+
+    async def scenario():
+        for websocket, code in ((usd, "USD"), (gbp, "GBP")):
+            await manager.connect(websocket)
+            await manager.handle_client_message(websocket, json.dumps({"action": "subscribe", "topics": [code]}))
+        # Код без аномалии в списке (например, из codes события) не даёт пустого сообщения
+        await manager.broadcast(alert_event, codes=["USD", "EUR", "GBP"])
+        await asyncio.sleep(0.01)
+        for websocket in (usd, gbp):
+            manager.disconnect(websocket)
+
+    run(scenario())
+
+    assert types(usd) == ["subscribed", "rate_alert"]
+    alert = next(message for message in usd.sent if message["type"] == "rate_alert")
+    assert alert["data"]["alerts"] == [{"code": "USD", "z_score": 5.0}]
+    assert alert["data"]["source"] == "parser"
+    assert types(gbp) == ["subscribed"]
@@ -0,0 +1,42 @@
+from app.services.metrics import registry
+from app.websocket.manager import ClientConnection, ConnectionManager, encode_message
+
+def texts(connection: ClientConnection):
+    return [text for text, _ in connection.queue]
+
+def test_coalesce_keeps_control_frames():
+    manager = ConnectionManager(queue_size=4, overflow_policy="coalesce")
+    connection = ClientConnection(websocket=None)
+
+    manager._enqueue(connection, encode_message({"type": "subscribed", "topics": ["USD"]}))
+    manager._enqueue(connection, encode_message({"type": "snapshot"}))
+    manager._enqueue(connection, "rates-1", coalesce=True)
+    manager._enqueue(connection, "rates-2", coalesce=True)
+    manager._enqueue(connection, "rates-3", coalesce=True)
+
+    assert texts(connection)[:2] == ['{"type":"subscribed","topics":["USD"]}', '{"type":"snapshot"}']
+    assert texts(connection)[2:] == ["rates-3"]
+    assert connection.dropped == manager.dropped_total == 2
+
+    # Служебное сообщение в полной очереди сохраняет последнее событие с курсами
+    manager._enqueue(connection, "rates-4", coalesce=True)
+    manager._enqueue(connection, "pong")
+    assert texts(connection)[2:] == ["rates-4", "pong"]
+
+def test_coalesce_falls_back_to_drop_oldest_for_control_frames():
+    manager = ConnectionManager(queue_size=2, overflow_policy="coalesce")
+    connection = ClientConnection(websocket=None)
+    for text in ("a", "b", "c"):
+        manager._enqueue(connection, text)
+    assert texts(connection) == ["b", "c"]
+    assert manager.dropped_total == 1
+
+def test_dropped_messages_is_a_counter():
+    manager = ConnectionManager(queue_size=1, overflow_policy="drop_oldest")
+    connection = ClientConnection(websocket=None)
+    manager._enqueue(connection, "a", coalesce=True)
+    manager._enqueue(connection, "b", coalesce=True)
+
+    rendered = registry.render()
+    assert "# TYPE ws_dropped_messages_total counter" in rendered
+    assert "ws_dropped_messages " not in rendered
@@ -0,0 +1,43 @@
+import asyncio
+
+from app.db.writer import WriteCoordinator
+
+def test_stop_finishes_running_batch(run, database):
+    writer = WriteCoordinator(batch_size=1, window=0)
+    started = asyncio.Event()
+
+    async def slow(db):
+        started.set()
+        await asyncio.sleep(0.05)
+        return "slow"
+
+    async def scenario():
+        first = asyncio.ensure_future(writer.submit(slow))
+        await started.wait()
+        # Операция уже снята с очереди и выполняется: очередь пуста
+        await writer.stop()
+        return await asyncio.wait_for(first, 1)
+
+    assert run(scenario()) == "slow"
+    assert writer.stats()["operations_total"] == 1
+
+def test_cancelled_writer_fails_waiting_operations(run, database):
+    writer = WriteCoordinator(batch_size=1, window=0)
+    started = asyncio.Event()
+
+    async def hang(db):
+        started.set()
+        await asyncio.sleep(10)
+
+    async def scenario():
+        first = asyncio.ensure_future(writer.submit(hang))
+        await started.wait()
+        second = asyncio.ensure_future(writer.submit(hang))
+        await asyncio.sleep(0)
+        writer._task.cancel()
+        results = await asyncio.wait_for(asyncio.gather(first, second, return_exceptions=True), 1)
+        writer._task = None
+        return results
+
+    for result in run(scenario()):
+        assert isinstance(result, RuntimeError)